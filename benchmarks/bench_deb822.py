@@ -0,0 +1,314 @@
+#!/usr/bin/python
+
+# bench_deb822.py: time deb822 parsing on synthetic archives
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 2
+# of the License, or (at your option) any later version.
+
+"""Time deb822 on synthetic Packages and Sources files, and report as JSON
+
+Each case is run on files of each size (generated by corpus.py, once, in
+the corpus directory) in an interpreter of its own, so that the peak RSS
+reported is its own.  For each (case, size), the best time of --repeat
+runs is reported, along with the throughput in paragraphs and megabytes
+per second.
+
+To look for regressions, save the output of one version and pass it to
+--compare when running another one (with --lib pointing at its lib
+directory, if it is not this tree's):
+
+    ./bench_deb822.py --sizes 1000,50000 -o before.json
+    ... change things ...
+    ./bench_deb822.py --sizes 1000,50000 --compare before.json
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from optparse import OptionParser
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import corpus
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+def _iterate(path, touch=('Package',), cls='Packages', **kwargs):
+    def run():
+        count = 0
+        with open(path, 'rb') as f:
+            for paragraph in getattr(deb822, cls).iter_paragraphs(f,
+                                                                  **kwargs):
+                for field in touch:
+                    paragraph.get(field)
+                count += 1
+        return count
+    return run
+
+
+def case_packages_native(path):
+    return _iterate(path, use_apt_pkg=False)
+
+
+def case_packages_apt_pkg(path):
+    if not deb822._have_apt_pkg:
+        return None
+    return _iterate(path, use_apt_pkg=True)
+
+
+def case_packages_fields(path):
+    return _iterate(path, touch=('Package', 'Version', 'Depends'),
+                    use_apt_pkg=False,
+                    fields=['Package', 'Version', 'Depends'])
+
+
+def case_packages_mixed(path):
+    return _iterate(path, touch=('Package', 'Maintainer'), use_apt_pkg=False)
+
+
+def case_packages_relations(path):
+    def run():
+        count = 0
+        with open(path, 'rb') as f:
+            for paragraph in deb822.Packages.iter_paragraphs(
+                    f, use_apt_pkg=False):
+                paragraph.relations['depends']
+                count += 1
+        return count
+    return run
+
+
+def case_packages_dump(path):
+    with open(path, 'rb') as f:
+        paragraphs = list(deb822.Packages.iter_paragraphs(f,
+                                                          use_apt_pkg=False))
+
+    def run():
+        for paragraph in paragraphs:
+            paragraph.dump()
+        return len(paragraphs)
+    return run
+
+
+def case_sources_native(path):
+    return _iterate(path, touch=('Package', 'Files'), cls='Sources',
+                    use_apt_pkg=False)
+
+
+# name: (corpus kind, corpus variant, setup function)
+CASES = [
+    ('packages-native', 'packages', {}, case_packages_native),
+    ('packages-apt_pkg', 'packages', {}, case_packages_apt_pkg),
+    ('packages-fields', 'packages', {}, case_packages_fields),
+    ('packages-mixed', 'packages', {'mixed': True}, case_packages_mixed),
+    ('packages-relations', 'packages', {}, case_packages_relations),
+    ('packages-dump', 'packages', {}, case_packages_dump),
+    ('sources-native', 'sources', {}, case_sources_native),
+    ('sources-signed', 'sources', {'signed': True}, case_sources_native),
+]
+
+deb822 = None
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes there, rather than kilobytes
+        rss //= 1024
+    return rss
+
+
+def run_case(name, path, repeat):
+    """Run one case, in this process, and return its result as a dict"""
+    for case, kind, variant, setup in CASES:
+        if case == name:
+            break
+    else:
+        raise ValueError('unknown case: %s' % name)
+    result = {'case': name, 'bytes': os.path.getsize(path)}
+    run = setup(path)
+    if run is None:
+        result['skipped'] = True
+        return result
+    best = None
+    for i in range(repeat):
+        start = clock()
+        count = run()
+        elapsed = clock() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    result.update({
+        'paragraphs': count,
+        'seconds': best,
+        'paragraphs_per_second': count / best,
+        'mb_per_second': result['bytes'] / 1e6 / best,
+        'peak_rss_kb': peak_rss_kb(),
+    })
+    return result
+
+
+def git_revision(directory):
+    try:
+        p = subprocess.Popen(['git', 'describe', '--always', '--dirty'],
+                             cwd=directory, stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+        out = p.communicate()[0]
+    except EnvironmentError:
+        return None
+    if p.returncode:
+        return None
+    return out.decode('ascii', 'replace').strip()
+
+
+def run_all(options):
+    sizes = [int(size) for size in options.sizes.split(',')]
+    names = [case for case, kind, variant, setup in CASES]
+    if options.cases:
+        names = options.cases.split(',')
+    results = []
+    for size in sizes:
+        for case, kind, variant, setup in CASES:
+            if case not in names:
+                continue
+            path = corpus.corpus_file(options.corpus_dir, kind, size,
+                                      options.seed, **variant)
+            p = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__),
+                 '--run-case', case, '--path', path,
+                 '--repeat', str(options.repeat), '--lib', options.lib],
+                stdout=subprocess.PIPE)
+            out = p.communicate()[0]
+            if p.returncode:
+                raise SystemExit('case %s failed on %s' % (case, path))
+            result = json.loads(out.decode('utf-8'))
+            result['size'] = size
+            results.append(result)
+            if not result.get('skipped'):
+                print('%-20s %7d %9.3fs %10.0f par/s %7.2f MB/s %8s KB'
+                      % (case, size, result['seconds'],
+                         result['paragraphs_per_second'],
+                         result['mb_per_second'], result['peak_rss_kb']),
+                      file=sys.stderr)
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'apt_pkg': deb822._have_apt_pkg,
+        'lib': options.lib,
+        'revision': git_revision(options.lib),
+        'seed': options.seed,
+        'results': results,
+    }
+
+
+def compare(old, new, threshold):
+    """Print how new results compare to old ones, and return whether any
+    throughput went down by more than threshold"""
+    previous = {}
+    for result in old['results']:
+        previous[(result['case'], result['size'])] = result
+    regressed = False
+    for result in new['results']:
+        before = previous.get((result['case'], result['size']))
+        if before is None or result.get('skipped') or before.get('skipped'):
+            continue
+        ratio = (result['paragraphs_per_second']
+                 / before['paragraphs_per_second'])
+        flag = ''
+        if ratio < 1 - threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print('%-20s %7d %10.0f -> %10.0f par/s (x%.2f)%s'
+              % (result['case'], result['size'],
+                 before['paragraphs_per_second'],
+                 result['paragraphs_per_second'], ratio, flag),
+              file=sys.stderr)
+    return regressed
+
+
+def main():
+    global deb822
+    parser = OptionParser(usage='%prog [options]',
+                          description=__doc__.split('\n')[0])
+    parser.add_option('--sizes', default='1000,50000,500000',
+                      help='comma-separated numbers of paragraphs '
+                      '(default: %default)')
+    parser.add_option('--cases', default='',
+                      help='comma-separated cases to run (default: all of '
+                      + ', '.join([case[0] for case in CASES]) + ')')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='runs of each case, of which the best is kept '
+                      '(default: %default)')
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('--corpus-dir',
+                      default=os.path.join(tempfile.gettempdir(),
+                                           'deb822-corpus'),
+                      help='where to keep the generated files '
+                      '(default: %default)')
+    parser.add_option('--lib', default=os.path.join(HERE, '..', 'lib'),
+                      help='the directory to import debian.deb822 from '
+                      '(default: this tree)')
+    parser.add_option('-o', '--output', help='write the JSON report here '
+                      '(default: standard output)')
+    parser.add_option('--compare', metavar='FILE',
+                      help='compare with a previous JSON report, and exit '
+                      'with status 1 on regressions')
+    parser.add_option('--threshold', type='float', default=0.1,
+                      help='slowdown counted as a regression by --compare '
+                      '(default: %default)')
+    parser.add_option('--run-case', help='(internal) run a single case')
+    parser.add_option('--path', help='(internal) the corpus of --run-case')
+    options, args = parser.parse_args()
+    if args:
+        parser.error('unexpected arguments')
+
+    known = [case[0] for case in CASES]
+    for case in filter(None, options.cases.split(',')):
+        if case not in known:
+            parser.error('unknown case: %s' % case)
+
+    options.lib = os.path.abspath(options.lib)
+    sys.path.insert(0, options.lib)
+    from debian import deb822
+
+    if options.run_case:
+        # Warnings about odd input are not what is being measured
+        warnings.simplefilter('ignore')
+        json.dump(run_case(options.run_case, options.path, options.repeat),
+                  sys.stdout)
+        return
+
+    if not os.path.isdir(options.corpus_dir):
+        os.makedirs(options.corpus_dir)
+    report = run_all(options)
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+    if options.compare:
+        with open(options.compare) as f:
+            if compare(json.load(f), report, options.threshold):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,340 @@
+#!/usr/bin/python
+
+# corpus.py: deterministic synthetic Packages and Sources files
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 2
+# of the License, or (at your option) any later version.
+
+"""Generate synthetic Packages and Sources files for benchmarking
+
+The files are made from a seeded random number generator, so a given
+kind, size and seed always gives the same bytes, with field distributions
+loosely modelled on the Debian archive: mostly optional packages spread
+over the usual sections, a few dozen relations per package (with version
+constraints, alternatives and architecture qualifiers), multi-line
+descriptions, and checksums.
+
+Variants:
+  - signed: each paragraph is wrapped in its own clearsigned PGP armor, as
+    in a series of concatenated .dsc files (the signatures are fake).
+  - mixed: a few maintainer names are encoded in latin-1 rather than
+    UTF-8, as in old archives.
+"""
+
+from __future__ import print_function
+
+import os
+import random
+import sys
+from optparse import OptionParser
+
+SECTIONS = [
+    ('libs', 14), ('devel', 9), ('utils', 8), ('python', 7), ('net', 6),
+    ('doc', 6), ('admin', 5), ('x11', 4), ('text', 4), ('science', 4),
+    ('libdevel', 8), ('misc', 3), ('web', 3), ('games', 3), ('sound', 2),
+    ('graphics', 3), ('perl', 3), ('java', 2), ('kernel', 1), ('mail', 2),
+    ('database', 1), ('editors', 1), ('fonts', 1), ('gnome', 2),
+    ('kde', 2), ('contrib/utils', 1), ('non-free/misc', 1),
+]
+
+PRIORITIES = [('optional', 80), ('extra', 15), ('standard', 3),
+              ('important', 1), ('required', 1)]
+
+ARCHITECTURES = [('amd64', 80), ('all', 20)]
+
+SOURCE_ARCHITECTURES = [('any', 70), ('all', 20), ('linux-any', 5),
+                        ('amd64 i386', 5)]
+
+MULTI_ARCH = [(None, 80), ('same', 12), ('foreign', 7), ('allowed', 1)]
+
+FORMATS = [('3.0 (quilt)', 80), ('3.0 (native)', 10), ('1.0', 10)]
+
+FIRST_NAMES = [u'John', u'Jane', u'Adeodato', u'Frank', u'Enrico',
+               u'Stefano', u'Mar\xeda', u'J\xf6rg', u'Ren\xe9',
+               u'Fran\xe7ois', u'Bj\xf6rn', u'Ana', u'Peter', u'Yuki']
+
+LAST_NAMES = [u'Wright', u'Sim\xf3', u'K\xfcster', u'Zini', u'Zacchiroli',
+              u'M\xfcller', u'Garc\xeda', u'Smith', u'Dupont', u'Tanaka',
+              u'Nguyen', u'Kowalski']
+
+TEAMS = [u'Debian Python Team <team+python@tracker.debian.org>',
+         u'Debian Perl Group <pkg-perl-maintainers@lists.alioth.debian.org>',
+         u'Debian Java Maintainers '
+         u'<pkg-java-maintainers@lists.alioth.debian.org>',
+         u'Debian QA Group <packages@qa.debian.org>']
+
+WORDS = ('the a of and to library for with tools data files support '
+         'network client server module bindings development headers '
+         'documentation utility simple fast small program python perl '
+         'interface graphical command line this package contains provides '
+         'runtime shared static plugin extension framework system format '
+         'parser protocol implementation version manager editor '
+         'viewer').split()
+
+PGP_HEAD = b'-----BEGIN PGP SIGNED MESSAGE-----\nHash: SHA256\n\n'
+PGP_SIGNATURE = (b'\n-----BEGIN PGP SIGNATURE-----\n\n'
+                 b'iQIzBAEBCAAdFiEEAAAAAAAAAAAAAAAAAAAAAAAAAAAFAlxxxxx\n'
+                 b'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA\n'
+                 b'=AAAA\n-----END PGP SIGNATURE-----\n')
+
+
+def weighted(rng, choices):
+    total = sum([weight for _, weight in choices])
+    n = rng.uniform(0, total)
+    for value, weight in choices:
+        n -= weight
+        if n <= 0:
+            return value
+    return choices[-1][0]
+
+
+class Generator(object):
+    """Make the paragraphs of a synthetic archive
+
+    The same (seed, kind) always gives the same paragraphs, whatever the
+    size (a smaller corpus is a prefix of a larger one) and whatever the
+    version of Python.
+    """
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+        self.names = []
+
+    # random.randint and random.choice give different results on Python 2
+    # and 3; these only rely on random(), which does not
+
+    def randint(self, a, b):
+        return a + int(self.rng.random() * (b - a + 1))
+
+    def choice(self, seq):
+        return seq[int(self.rng.random() * len(seq))]
+
+    def name(self):
+        n = self.randint(1, 3)
+        parts = [self.choice(WORDS) for i in range(n)]
+        prefix = self.choice(['', '', '', 'lib', 'python3-', 'r-cran-',
+                              'golang-', 'node-'])
+        name = prefix + '-'.join(parts) + str(len(self.names) % 997)
+        self.names.append(name)
+        return name
+
+    def version(self):
+        rng = self.rng
+        version = '.'.join([str(self.randint(0, 20))
+                            for i in range(self.randint(1, 4))])
+        if rng.random() < 0.1:
+            version = '%d:%s' % (self.randint(1, 3), version)
+        if rng.random() < 0.1:
+            version += self.choice(['+dfsg', '~rc1', '+git20130101',
+                                    '~beta2'])
+        if rng.random() < 0.85:
+            version += '-%d' % self.randint(1, 5)
+            if rng.random() < 0.1:
+                version += '+b%d' % self.randint(1, 3)
+        return version
+
+    def maintainer(self):
+        rng = self.rng
+        if rng.random() < 0.2:
+            return self.choice(TEAMS)
+        first = self.choice(FIRST_NAMES)
+        last = self.choice(LAST_NAMES)
+        login = (first[0] + last).lower().encode('ascii', 'ignore')
+        return u'%s %s <%s@debian.org>' % (first, last,
+                                           login.decode('ascii'))
+
+    def relation(self):
+        rng = self.rng
+        if self.names and rng.random() < 0.7:
+            name = self.choice(self.names)
+        else:
+            name = 'lib' + self.choice(WORDS) + str(self.randint(0, 9))
+        if rng.random() < 0.4:
+            name += ' (%s %s)' % (self.choice(['>=', '>=', '=', '<<', '>>']),
+                                  self.version())
+        if rng.random() < 0.03:
+            name += ' [linux-any]'
+        return name
+
+    def relations(self, low, high):
+        rng = self.rng
+        relations = []
+        for i in range(self.randint(low, high)):
+            alternatives = [self.relation()]
+            while rng.random() < 0.1:
+                alternatives.append(self.relation())
+            relations.append(' | '.join(alternatives))
+        return ', '.join(relations)
+
+    def words(self, low, high):
+        return ' '.join([self.choice(WORDS)
+                         for i in range(self.randint(low, high))])
+
+    def description(self):
+        rng = self.rng
+        lines = [self.words(3, 8)]
+        for paragraph in range(self.randint(1, 3)):
+            if paragraph:
+                lines.append(' .')
+            for line in range(self.randint(1, 5)):
+                lines.append(' ' + self.words(6, 12))
+        if rng.random() < 0.2:
+            lines.append(' .')
+            for item in range(self.randint(2, 5)):
+                lines.append('  * ' + self.words(2, 6))
+        return '\n'.join(lines)
+
+    def checksum(self, bits):
+        return '%0*x' % (bits // 4, self.rng.getrandbits(bits))
+
+    def packages_paragraph(self):
+        rng = self.rng
+        name = self.name()
+        version = self.version()
+        architecture = weighted(rng, ARCHITECTURES)
+        section = weighted(rng, SECTIONS)
+        size = int(rng.lognormvariate(10, 1.5)) + 500
+        fields = [
+            ('Package', name),
+            ('Version', version),
+            ('Installed-Size', str(size * 3 // 1024 + 1)),
+            ('Maintainer', self.maintainer()),
+            ('Architecture', architecture),
+        ]
+        if rng.random() < 0.3:
+            fields.insert(1, ('Source', name.split('-')[0]))
+        multi_arch = weighted(rng, MULTI_ARCH)
+        if multi_arch:
+            fields.append(('Multi-Arch', multi_arch))
+        if rng.random() < 0.05:
+            fields.append(('Replaces', self.relations(1, 2)))
+        if rng.random() < 0.05:
+            fields.append(('Provides', self.relations(1, 3)))
+        if rng.random() < 0.9:
+            fields.append(('Depends', self.relations(1, 12)))
+        if rng.random() < 0.03:
+            fields.append(('Pre-Depends', self.relations(1, 2)))
+        if rng.random() < 0.3:
+            fields.append(('Recommends', self.relations(1, 4)))
+        if rng.random() < 0.25:
+            fields.append(('Suggests', self.relations(1, 4)))
+        if rng.random() < 0.05:
+            fields.append(('Conflicts', self.relations(1, 2)))
+        if rng.random() < 0.05:
+            fields.append(('Breaks', self.relations(1, 3)))
+        fields.extend([
+            ('Description', self.description()),
+            ('Homepage', 'https://example.org/%s' % name),
+            ('Section', section),
+            ('Priority', weighted(rng, PRIORITIES)),
+            ('Filename', 'pool/main/%s/%s/%s_%s_%s.deb'
+             % (name[0], name, name, version.split(':')[-1],
+                architecture)),
+            ('Size', str(size)),
+            ('MD5sum', self.checksum(128)),
+            ('SHA256', self.checksum(256)),
+        ])
+        return fields
+
+    def sources_paragraph(self):
+        rng = self.rng
+        name = self.name()
+        version = self.version()
+        upstream = version.split(':')[-1].rsplit('-', 1)[0]
+        files = ['%s_%s.dsc' % (name, version.split(':')[-1]),
+                 '%s_%s.orig.tar.xz' % (name, upstream),
+                 '%s_%s.debian.tar.xz' % (name, version.split(':')[-1])]
+        sizes = [str(int(rng.lognormvariate(10, 1.5))) for f in files]
+        binaries = [name] + [self.name() for i in range(self.randint(0, 4))]
+        fields = [
+            ('Package', name),
+            ('Binary', ', '.join(binaries)),
+            ('Version', version),
+            ('Maintainer', self.maintainer()),
+        ]
+        if rng.random() < 0.5:
+            fields.append(('Uploaders', ', '.join(
+                [self.maintainer() for i in range(self.randint(1, 3))])))
+        fields.extend([
+            ('Build-Depends', self.relations(1, 15)),
+            ('Architecture', weighted(rng, SOURCE_ARCHITECTURES)),
+            ('Standards-Version', '3.9.%d' % self.randint(0, 4)),
+            ('Format', weighted(rng, FORMATS)),
+            ('Files', '\n' + '\n'.join(
+                [' %s %s %s' % (self.checksum(128), size, f)
+                 for f, size in zip(files, sizes)])),
+            ('Checksums-Sha256', '\n' + '\n'.join(
+                [' %s %s %s' % (self.checksum(256), size, f)
+                 for f, size in zip(files, sizes)])),
+            ('Homepage', 'https://example.org/%s' % name),
+            ('Vcs-Git', 'https://salsa.debian.org/debian/%s.git' % name),
+            ('Directory', 'pool/main/%s/%s' % (name[0], name)),
+            ('Priority', weighted(rng, PRIORITIES)),
+            ('Section', weighted(rng, SECTIONS)),
+        ])
+        return fields
+
+    def paragraphs(self, kind, count, signed=False, mixed=False):
+        """Yield count encoded paragraphs (without separating blank line)"""
+        make = getattr(self, '%s_paragraph' % kind)
+        for i in range(count):
+            fields = make()
+            encoding = 'utf-8'
+            if mixed and self.rng.random() < 0.02:
+                encoding = 'latin-1'
+            text = u''.join([(value.startswith('\n') and u'%s:%s\n'
+                              or u'%s: %s\n') % (key, value)
+                             for key, value in fields])
+            data = text.encode(encoding)
+            if signed:
+                data = PGP_HEAD + data + PGP_SIGNATURE
+            yield data
+
+
+def generate(f, kind, count, seed=0, signed=False, mixed=False):
+    """Write a synthetic file of count paragraphs to the binary file f
+
+    :param kind: 'packages' or 'sources'.
+    """
+    generator = Generator(seed)
+    for data in generator.paragraphs(kind, count, signed, mixed):
+        f.write(data)
+        f.write(b'\n')
+
+
+def corpus_file(directory, kind, count, seed=0, signed=False, mixed=False):
+    """Return the name of a synthetic file in directory, making it if needed
+    """
+    variant = ''.join([signed and '-signed' or '', mixed and '-mixed' or ''])
+    name = os.path.join(directory, '%s%s-%d-%d' % (
+        kind.capitalize(), variant, count, seed))
+    if not os.path.exists(name):
+        tmp = name + '.tmp'
+        with open(tmp, 'wb') as f:
+            generate(f, kind, count, seed, signed, mixed)
+        os.rename(tmp, name)
+    return name
+
+
+def main():
+    parser = OptionParser(usage='%prog [options] KIND COUNT',
+                          description='Write a synthetic Packages or '
+                          'Sources file (KIND is packages or sources) of '
+                          'COUNT paragraphs to standard output.')
+    parser.add_option('--seed', type='int', default=0)
+    parser.add_option('--signed', action='store_true', default=False,
+                      help='wrap each paragraph in (fake) PGP armor')
+    parser.add_option('--mixed', action='store_true', default=False,
+                      help='encode some maintainers in latin-1')
+    options, args = parser.parse_args()
+    if len(args) != 2 or args[0] not in ('packages', 'sources'):
+        parser.error('expected KIND (packages or sources) and COUNT')
+    out = getattr(sys.stdout, 'buffer', sys.stdout)
+    generate(out, args[0], int(args[1]), options.seed, options.signed,
+             options.mixed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# vim: fileencoding=utf-8
+#
+# asyncio support for deb822.  This uses syntax that needs Python >= 3.6, so
+# it is kept apart from deb822 itself, which only imports it when needed.
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import asyncio
+
+from debian.deb822 import (
+    _COMPRESSED_CHUNK_SIZE,
+    _ParagraphSplitter,
+    _StreamDecompressor,
+    _Where,
+    _check_chunk,
+    _compression_of,
+    _count_fields,
+    Deb822Decoder,
+)
+
+
+async def _iter_chunks(stream, chunk_size):
+    """Yield the chunks of stream: an object with a coroutine read method
+    (such as asyncio.StreamReader), or an asynchronous iterable of bytes"""
+    if hasattr(stream, 'read'):
+        while True:
+            chunk = await stream.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        async for chunk in stream:
+            if chunk:
+                yield chunk
+
+
+async def _decompressed(chunks):
+    """Yield chunks, decompressed if the first one starts like gzip, bzip2
+    or xz data"""
+    decompressor = None
+    async for chunk in chunks:
+        if decompressor is None:
+            kind = _compression_of(chunk[:6])
+            if kind is None:
+                yield chunk
+                async for chunk in chunks:
+                    yield chunk
+                return
+            decompressor = _StreamDecompressor(kind)
+        for data in decompressor.decompress(chunk):
+            yield data
+        if decompressor.done:
+            return
+    if decompressor is not None:
+        data = decompressor.flush()
+        if data:
+            yield data
+
+
+async def aiter_paragraphs(cls, stream, fields=None, encoding="utf-8",
+                           where=None, compact=False, decoder=None,
+                           chunk_size=_COMPRESSED_CHUNK_SIZE):
+    """The implementation of Deb822.aiter_paragraphs"""
+    if decoder is None:
+        decoder = Deb822Decoder(encoding)
+    else:
+        encoding = decoder.encoding
+    if where is not None:
+        where = _Where(where, encoding)
+    if fields is not None:
+        fields = frozenset(fields)
+    wanted = _count_fields(fields)
+    keys = {}
+    splitter = _ParagraphSplitter()
+
+    def parse(blocks):
+        for block in blocks:
+            if where is not None and not where.test(block[2]):
+                continue
+            paragraph = cls._from_block(block, fields, keys, encoding,
+                                        wanted, compact, decoder)
+            if paragraph is not None:
+                yield paragraph
+
+    clean = True
+    async for chunk in _decompressed(_iter_chunks(stream, chunk_size)):
+        clean = _check_chunk(decoder, splitter, chunk, clean)
+        for paragraph in parse(splitter.feed(chunk)):
+            yield paragraph
+            # Let the event loop run between paragraphs, even when they
+            # all come from a chunk that was already there
+            await asyncio.sleep(0)
+    for paragraph in parse(splitter.close()):
+        yield paragraph
+        await asyncio.sleep(0)
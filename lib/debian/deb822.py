@@ -34,18 +34,55 @@ try:
 except (ImportError, AttributeError):
     _have_apt_pkg = False
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import threading
+except ImportError:
+    threading = None
+
+from array import array
+import bz2
 import chardet
+import codecs
+import contextlib
+import hashlib
+import marshal
+import mmap
+import multiprocessing
 import os
 import re
 import subprocess
 import sys
+import tempfile
+import time
 import warnings
+import zlib
 
 try:
     from StringIO import StringIO
     BytesIO = StringIO
 except ImportError:
     from io import BytesIO, StringIO
+try:
+    from queue import Queue, Full
+except ImportError:
+    from Queue import Queue, Full
+try:
+    from collections.abc import KeysView as _KeysView
+except ImportError:
+    from collections import KeysView as _KeysView
 try:
     from collections import Mapping, MutableMapping
     _mapping_mixin = Mapping
@@ -55,6 +92,8 @@ except ImportError:
     _mapping_mixin = DictMixin
     _mutable_mapping_mixin = DictMixin
 
+from collections import deque, namedtuple
+
 import six
 
 if sys.version >= '3':
@@ -72,6 +111,15 @@ else:
         return isinstance(f, file) and hasattr(f, 'fileno')
 
 
+def _file_path(f):
+    """Return the name of the regular file f is opened on, or None"""
+    name = getattr(f, 'name', None)
+    if (_is_real_file(f) and isinstance(name, six.string_types)
+            and os.path.isfile(name)):
+        return name
+    return None
+
+
 GPGV_DEFAULT_KEYRINGS = frozenset(['/usr/share/keyrings/debian-keyring.gpg'])
 GPGV_EXECUTABLE = '/usr/bin/gpgv'
 
@@ -110,6 +158,1169 @@ class TagSectionWrapper(_mapping_mixin, object):
         return data.lstrip(b' \t').rstrip(b'\n')
 
 
+class _RawParagraph(_mapping_mixin, object):
+    """Expose the fields of a paragraph found by the native parser
+
+    This plays the same role as TagSectionWrapper does for apt_pkg: values
+    are kept exactly as they were found in the input (bytes, for binary
+    input), and are only decoded by Deb822Dict when they are looked up.
+    """
+
+    def __init__(self, pairs):
+        self.__keys = []
+        self.__values = {}
+        for key, lower, value in pairs:
+            if lower not in self.__values:
+                self.__keys.append(key)
+            self.__values[lower] = value
+
+    def __iter__(self):
+        return iter(self.__keys)
+
+    def __len__(self):
+        return len(self.__keys)
+
+    def __getitem__(self, key):
+        return self.__values[key.lower()]
+
+    def __contains__(self, key):
+        return key.lower() in self.__values
+
+
+class _BlobParagraph(_mapping_mixin, object):
+    """Expose the fields of a paragraph as offsets into its raw text
+
+    This plays the same role as _RawParagraph, but rather than a copy of
+    each value it keeps the paragraph as found by _ParagraphSplitter, a
+    shared _FieldLayout of its field names, and a table of (key start,
+    value start, value end) offsets, so a value is only cut out of the
+    paragraph when it is looked up.  The few values that are not a single
+    slice of the paragraph (because some line of them was dropped) are
+    kept separately.
+
+    It is built from the tuples _scan_fields returns with spans=True.
+    """
+
+    __slots__ = ('_data', '_layout', '_offsets', '_values')
+
+    def __init__(self, data, spans):
+        layout = _layouts.layout(tuple([span[0] for span in spans]))
+        if layout.select is not None:
+            spans = [spans[i] for i in layout.select]
+        offsets = []
+        values = None
+        for i, (key, lower, key_start, start, end, value) in enumerate(spans):
+            if value is not None:
+                if values is None:
+                    values = {}
+                values[i] = value
+                end = start
+            offsets.append(key_start)
+            offsets.append(start)
+            offsets.append(end)
+        self._data = data
+        self._layout = layout
+        self._offsets = array('i', offsets)
+        self._values = values
+
+    def __getstate__(self):
+        return (self._data, self._layout.names, self._offsets, self._values)
+
+    def __setstate__(self, state):
+        self._data, names, self._offsets, self._values = state
+        self._layout = _layouts.layout(names)
+
+    def __iter__(self):
+        return iter(self._layout.names)
+
+    def __len__(self):
+        return len(self._layout.names)
+
+    def __getitem__(self, key):
+        positions = self._layout.positions
+        try:
+            i = positions[key]
+        except KeyError:
+            i = positions[key.lower()]
+        if self._values is not None and i in self._values:
+            return self._values[i]
+        offsets = self._offsets
+        return self._data[offsets[3 * i + 1]:offsets[3 * i + 2]]
+
+    def __contains__(self, key):
+        positions = self._layout.positions
+        return key in positions or key.lower() in positions
+
+
+class _FieldLayout(object):
+    """The field names of a CompactDeb822, shared by all paragraphs with them
+
+    positions maps each name, and its lowercase form, to the position of
+    its value.  If some field appears more than once in the names the
+    layout was made from, only its first position is kept, and select
+    gives the indices of the values to keep (the last one of each field).
+    """
+
+    __slots__ = ('names', 'positions', 'select')
+
+    def __init__(self, names):
+        unique = []
+        positions = {}
+        last = {}
+        for i, name in enumerate(names):
+            lower = name.lower()
+            if lower not in positions:
+                positions[lower] = len(unique)
+                unique.append(name)
+            last[lower] = i
+        for i, name in enumerate(unique):
+            positions[name] = i
+        self.names = tuple(unique)
+        self.positions = positions
+        if len(unique) == len(names):
+            self.select = None
+        else:
+            self.select = tuple([last[name.lower()] for name in unique])
+
+
+class _LayoutTable(object):
+    """Interns field names and the _FieldLayouts made of them"""
+
+    # Past this many layouts, start afresh rather than grow without bound
+    max_layouts = 4096
+
+    def __init__(self):
+        self.__names = {}
+        self.__layouts = {}
+
+    def layout(self, names):
+        """Return the _FieldLayout for the tuple of field names"""
+        try:
+            return self.__layouts[names]
+        except KeyError:
+            pass
+        if len(self.__layouts) >= self.max_layouts:
+            self.__layouts.clear()
+        intern = self.__names.setdefault
+        interned = tuple([intern(name, name) for name in names])
+        layout = self.__layouts[interned] = _FieldLayout(interned)
+        return layout
+
+
+_layouts = _LayoutTable()
+
+
+class _CaseInsensitiveFields(object):
+    """A container of field names for _scan_fields, ignoring case"""
+
+    def __init__(self, fields):
+        self.__lower = frozenset([f.lower() for f in fields])
+
+    def __contains__(self, name):
+        return name.lower() in self.__lower
+
+    def __len__(self):
+        return len(self.__lower)
+
+    def __iter__(self):
+        return iter(self.__lower)
+
+    def __eq__(self, other):
+        return isinstance(other, _CaseInsensitiveFields) and \
+            self.__lower == other.__lower
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.__lower)
+
+
+class _Syntax(object):
+    """The tokens the native parser needs, as either text or bytes"""
+
+    def __init__(self, sample):
+        if isinstance(sample, six.text_type):
+            def conv(s):
+                if isinstance(s, bytes):
+                    return s.decode('utf-8')
+                return s
+        else:
+            def conv(s):
+                if isinstance(s, bytes):
+                    return s
+                return s.encode('utf-8')
+        self.conv = conv
+        self.nl = conv('\n')
+        self.blank = conv('\n\n')
+        self.cr = conv('\r')
+        self.colon = conv(':')
+        self.comment = conv('#')
+        self.newline_comment = conv('\n#')
+        self.armor = conv('-----BEGIN PGP ')
+        self.armor_end = conv('-----END PGP ')
+        self.whitespace = tuple(conv(c) for c in ' \t\f\v')
+        # The start of the next line that is not a continuation line
+        self.next_field_re = re.compile(conv('\n(?=[^ \t\f\v])'))
+        # A continuation line consisting of a single character
+        self.short_line_re = re.compile(conv('\n[ \t\f\v](?:\n|$)'))
+        self.separator_re = re.compile(conv('\n\r*\n'))
+        self.blank_lines_re = re.compile(conv('(?:\r*\n)*'))
+        self.empty = conv('')
+
+    _cache = {}
+
+    @classmethod
+    def of(cls, sample):
+        kind = isinstance(sample, six.text_type)
+        try:
+            return cls._cache[kind]
+        except KeyError:
+            syntax = cls._cache[kind] = cls(sample)
+            return syntax
+
+
+_NATIVE_CHUNK_SIZE = 1 << 20
+
+try:
+    _buffer_types = (bytes, bytearray, memoryview)
+except NameError:
+    # Python 2.6
+    _buffer_types = (bytes, bytearray)
+
+
+# Compressed input is read this much at a time
+_COMPRESSED_CHUNK_SIZE = 1 << 16
+
+_COMPRESSION_MAGIC = [
+    (b'\x1f\x8b', 'gz'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+]
+
+
+def _compression_of(head):
+    """Return 'gz', 'bz2', 'xz' or None, from the first bytes of a file"""
+    if isinstance(head, bytes) and not isinstance(head, six.text_type):
+        for magic, kind in _COMPRESSION_MAGIC:
+            if head.startswith(magic):
+                return kind
+    return None
+
+
+def _peek_compression(f):
+    """Return the compression of the binary file f, without consuming it"""
+    if sys.version >= '3' and isinstance(f, io.TextIOBase):
+        return None
+    try:
+        pos = f.tell()
+        try:
+            head = f.read(6)
+        finally:
+            f.seek(pos)
+    except (AttributeError, EnvironmentError, ValueError):
+        return None
+    return _compression_of(head)
+
+
+def _new_decompressor(kind):
+    if kind == 'gz':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif kind == 'bz2':
+        return bz2.BZ2Decompressor()
+    elif lzma is None:
+        raise ValueError("xz compressed input needs the lzma module")
+    else:
+        return lzma.LZMADecompressor()
+
+
+def _new_compressor(kind):
+    if kind == 'gz':
+        # zlib writes a gzip header without file name or timestamp, so the
+        # output only depends on the input
+        return zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif kind == 'bz2':
+        return bz2.BZ2Compressor(9)
+    elif lzma is None:
+        raise ValueError("xz compression needs the lzma module")
+    else:
+        return lzma.LZMACompressor()
+
+
+class _StreamDecompressor(object):
+    """Decompress compressed data given a chunk at a time
+
+    Concatenated streams (as produced by e.g. 'cat a.gz b.gz') are
+    decompressed one after the other.  NUL bytes after the end of a stream
+    (padding, as left by tape and block devices) end the input, as they do
+    for gzip: done is then set, and anything given after is ignored.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.done = False
+        self.__decompressor = _new_decompressor(kind)
+        self.__ended = False
+
+    def decompress(self, chunk):
+        """Return the list of the pieces of data decompressed from chunk"""
+        pieces = []
+        while chunk and not self.done:
+            if self.__ended:
+                if chunk.startswith(b'\0'):
+                    self.done = True
+                    break
+                self.__decompressor = _new_decompressor(self.kind)
+            try:
+                data = self.__decompressor.decompress(chunk)
+            except EOFError:
+                # The stream ended with the last chunk, and (lacking an eof
+                # attribute on Python 2) bz2 refuses anything after it
+                self.__ended = True
+                continue
+            if data:
+                pieces.append(data)
+            chunk = self.__decompressor.unused_data
+            # zlib leaves anything given to a finished stream in
+            # unused_data, but bz2 and lzma refuse it
+            self.__ended = bool(chunk) or \
+                getattr(self.__decompressor, 'eof', False)
+        return pieces
+
+    def flush(self):
+        """Return whatever data is left at the end of the input"""
+        if self.kind == 'gz' and not self.done:
+            return self.__decompressor.flush()
+        return b''
+
+
+def _decompress(chunks, kind):
+    """Decompress a stream of compressed chunks, one chunk at a time, as
+    _StreamDecompressor does"""
+    decompressor = _StreamDecompressor(kind)
+    for chunk in chunks:
+        for data in decompressor.decompress(chunk):
+            yield data
+        if decompressor.done:
+            return
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+def _iter_lines(chunks):
+    """Yield the lines (without line endings) of a stream of bytes chunks"""
+    rest = b''
+    for chunk in chunks:
+        lines = (rest + chunk).split(b'\n')
+        rest = lines.pop()
+        for line in lines:
+            yield line
+    if rest:
+        yield rest
+
+
+def _uncompressed(sequence):
+    """Return sequence, decompressed if it is compressed
+
+    Compressed bytes are decompressed as a whole.  A compressed binary file
+    (read from its start) gives an iterator over the decompressed lines, which only reads (and
+    decompresses) as much of the file as is used.  Anything else is
+    returned as it is.
+    """
+    if isinstance(sequence, bytes) and \
+            not isinstance(sequence, six.text_type):
+        if _compression_of(sequence[:6]) is not None:
+            return b''.join(_iter_chunks(sequence))
+    elif hasattr(sequence, 'read'):
+        # Only whole files are looked at: peeking part way through a file
+        # would also throw away what iterating over it (on Python 2) had
+        # read ahead
+        try:
+            at_start = sequence.tell() == 0
+        except (AttributeError, EnvironmentError, ValueError):
+            at_start = False
+        if at_start and _peek_compression(sequence) is not None:
+            return _iter_lines(_iter_chunks(sequence))
+    return sequence
+
+
+def _read_ahead(chunks, depth=4):
+    """Produce chunks in a separate thread, up to depth chunks in advance
+
+    zlib, bz2 and lzma release the GIL while they work, so decompressing
+    the input this way overlaps with parsing it.
+    """
+    if threading is None:
+        for chunk in chunks:
+            yield chunk
+        return
+
+    queue = Queue(depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Give up once the consumer has gone away
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for chunk in chunks:
+                if not put((chunk, None)):
+                    return
+        except Exception:
+            put((done, sys.exc_info()[1]))
+        else:
+            put((done, None))
+
+    thread = threading.Thread(target=produce)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            chunk, error = queue.get()
+            if chunk is done:
+                if error is not None:
+                    raise error
+                break
+            yield chunk
+    finally:
+        stop.set()
+
+
+def _iter_chunks(sequence, chunk_size=_NATIVE_CHUNK_SIZE):
+    """Yield the contents of sequence as a series of text or bytes chunks
+
+    sequence may be a string, a bytes-like object, a file-like object with a
+    read method, or any iterable of lines (with or without trailing
+    newlines).  Binary input compressed with gzip, bzip2 or xz is
+    decompressed as it is read.
+    """
+    if isinstance(sequence, six.string_types + _buffer_types):
+        if not isinstance(sequence, six.string_types + (bytes,)):
+            # bytearray and memoryview slices are not bytes, which is what
+            # Deb822Dict expects to decode; take a single copy up front.
+            if hasattr(sequence, 'tobytes'):
+                sequence = sequence.tobytes()
+            else:
+                sequence = bytes(sequence)
+        kind = _compression_of(sequence[:6])
+        if kind is None:
+            yield sequence
+        else:
+            pieces = (sequence[i:i + _COMPRESSED_CHUNK_SIZE] for i in
+                      range(0, len(sequence), _COMPRESSED_CHUNK_SIZE))
+            for chunk in _decompress(pieces, kind):
+                yield chunk
+    elif hasattr(sequence, 'read'):
+        chunk = sequence.read(_COMPRESSED_CHUNK_SIZE)
+        kind = _compression_of(chunk[:6])
+        if kind is not None:
+            def pieces(chunk):
+                while chunk:
+                    yield chunk
+                    chunk = sequence.read(_COMPRESSED_CHUNK_SIZE)
+            for chunk in _decompress(pieces(chunk), kind):
+                yield chunk
+            return
+        while chunk:
+            yield chunk
+            chunk = sequence.read(chunk_size)
+    else:
+        lines = []
+        size = 0
+        nl = None
+        for line in sequence:
+            if nl is None:
+                nl = _Syntax.of(line).nl
+            lines.append(line)
+            if not line.endswith(nl):
+                lines.append(nl)
+            size += len(line)
+            if size >= chunk_size:
+                yield nl[:0].join(lines)
+                lines = []
+                size = 0
+        if lines:
+            yield nl[:0].join(lines)
+
+
+def _iter_blocks(sequence, readahead=False, decoder=None, stats=None):
+    """Yield the raw paragraphs of sequence, as _ParagraphSplitter does
+
+    If a Deb822Decoder is given, each chunk is checked with it, and its
+    clean attribute tells whether the paragraph just yielded only comes
+    from clean chunks.  If a Deb822Stats is given, reading, checking and
+    splitting chunks are timed into it.
+    """
+    if stats is None:
+        splitter = _ParagraphSplitter()
+    else:
+        splitter = _ProfiledSplitter(stats)
+    chunks = _iter_chunks(sequence)
+    if readahead:
+        chunks = _read_ahead(chunks)
+    if stats is not None:
+        chunks = stats.iterate('read', chunks, len)
+    clean = True
+    for chunk in chunks:
+        if decoder is not None:
+            if stats is not None:
+                stats.enter('decode')
+            try:
+                clean = _check_chunk(decoder, splitter, chunk, clean)
+            finally:
+                if stats is not None:
+                    stats.leave()
+        if stats is None:
+            blocks = splitter.feed(chunk)
+        else:
+            stats.enter('split')
+            try:
+                blocks = splitter.feed(chunk)
+            finally:
+                stats.leave(len(chunk), _count_lines(chunk))
+        for block in blocks:
+            yield block
+    if stats is not None:
+        stats.enter('split')
+    try:
+        blocks = splitter.close()
+    finally:
+        if stats is not None:
+            stats.leave()
+    for block in blocks:
+        yield block
+
+
+def _check_chunk(decoder, splitter, chunk, clean):
+    """Check chunk with decoder, before feeding it to splitter, and return
+    whether the paragraphs then split only come from clean chunks (clean
+    tells whether those before did), which is also set on decoder"""
+    if not splitter.buf:
+        clean = True
+    clean = decoder.check_chunk(chunk) and clean
+    decoder.clean = clean
+    return clean
+
+
+_PARALLEL_BATCH_SIZE = 1 << 18
+
+
+def _iter_batches(sequence, batch_size=_PARALLEL_BATCH_SIZE,
+                  readahead=False):
+    """Yield lists of (data, signed) pairs of about batch_size in total"""
+    batch = []
+    size = 0
+    for start, end, data, signed in _iter_blocks(sequence, readahead):
+        batch.append((data, signed))
+        size += len(data)
+        if size >= batch_size:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
+
+
+def _parse_batch(batch, fields, encoding, where=None):
+    """Scan and decode a batch of raw paragraphs, in a worker process
+
+    Returns a list of (triples, encoding, signed) tuples, where the values
+    in triples are already decoded, and encoding is the one the paragraph
+    ended up being decoded with.
+    """
+    keys = {}
+    wanted = _count_fields(fields)
+    decoder = Deb822Decoder(encoding)
+    parsed = []
+    for data, signed in batch:
+        if where is not None and not where.test(data):
+            continue
+        triples = _scan_fields(data, fields, keys, wanted)
+        if not triples:
+            continue
+        paragraph = Deb822Dict(encoding=encoding)
+        paragraph._decoder = decoder
+        triples = [(key, lower, paragraph._detect_encoding(value))
+                   for key, lower, value in triples]
+        parsed.append((triples, paragraph.encoding, signed))
+    return parsed
+
+
+class _ParagraphSplitter(object):
+    """Split a stream of text or bytes chunks into raw paragraphs
+
+    Paragraph boundaries are found with str.find on the whole buffer rather
+    than by looking at every line.  Comments and carriage returns are only
+    dealt with in paragraphs that actually contain them, and the (much more
+    expensive) GPG armor handling of Deb822.split_gpg_and_payload is only
+    used when a '-----BEGIN PGP ' marker is present.
+
+    feed() and close() return lists of (start, end, data, signed) tuples,
+    where start and end are offsets of the raw paragraph in the stream, data
+    is the text of the paragraph (comments and carriage returns removed, no
+    trailing newline), and signed is the raw bytes of the whole signed
+    message if the paragraph was the payload of one, or None.
+    """
+
+    def __init__(self):
+        self.syntax = None
+        self.buf = None
+        self.offset = 0
+
+    def feed(self, chunk):
+        if self.buf is None:
+            self.syntax = _Syntax.of(chunk)
+            self.buf = chunk
+        elif chunk:
+            self.buf = self.buf + chunk
+        return self._scan(final=False)
+
+    def close(self):
+        if self.buf is None:
+            return []
+        return self._scan(final=True)
+
+    def _scan(self, final):
+        s = self.syntax
+        buf = self.buf
+        n = len(buf)
+        has_cr = buf.find(s.cr) >= 0
+        next_armor = buf.find(s.armor)
+        next_comment = buf.find(s.newline_comment)
+        found = []
+        pos = 0
+
+        while True:
+            pos = s.blank_lines_re.match(buf, pos).end()
+            if pos >= n:
+                break
+            start = pos
+
+            if has_cr:
+                m = s.separator_re.search(buf, start)
+                end, after = (m.start(), m.end()) if m else (-1, -1)
+            else:
+                end = buf.find(s.blank, start)
+                after = end + 2
+            if end < 0:
+                if not final:
+                    break
+                end = after = n
+
+            if 0 <= next_armor < end:
+                result = self._split_armored(buf, start, final)
+                if result is None:
+                    break
+                data, signed, pos = result
+                next_armor = buf.find(s.armor, pos)
+                if data:
+                    found.append((self.offset + start, self.offset + pos,
+                                  data, signed))
+                continue
+
+            data = buf[start:end]
+            if has_cr:
+                data = s.nl.join([line.rstrip(s.cr)
+                                  for line in data.split(s.nl)])
+            if 0 <= next_comment < start:
+                next_comment = buf.find(s.newline_comment, start)
+            if data.startswith(s.comment) or 0 <= next_comment < end:
+                data = s.nl.join([line for line in data.split(s.nl)
+                                  if not line.startswith(s.comment)])
+            if data:
+                found.append((self.offset + start, self.offset + end,
+                              data, None))
+            pos = after
+
+        self.buf = buf[pos:]
+        self.offset += pos
+        return found
+
+    def _split_armored(self, buf, start, final):
+        """Hand a GPG armored region over to split_gpg_and_payload
+
+        Returns (data, signed, end), or None if more input is needed.
+        """
+        s = self.syntax
+        n = len(buf)
+        end = buf.find(s.armor_end, start)
+        if end >= 0:
+            end = buf.find(s.nl, end)
+        if end < 0:
+            if not final:
+                return None
+            end = n
+
+        region = buf[start:end]
+        lines = region.split(s.nl)
+        consumed = [0]
+
+        def counted(lines):
+            for line in lines:
+                consumed[0] += 1
+                yield line
+
+        try:
+            gpg_pre, payload, gpg_post = Deb822.split_gpg_and_payload(
+                Deb822._skip_useless_lines(counted(lines)))
+        except EOFError:
+            gpg_pre = payload = gpg_post = []
+        end = start + min(len(region), sum([len(line) + 1 for line
+                                            in lines[:consumed[0]]]))
+
+        # split_gpg_and_payload hands back bytes for text input on Python 3
+        data = b'\n'.join(payload)
+        raw = buf[start:end]
+        if isinstance(raw, six.text_type):
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            raw = raw.encode('utf-8')
+        signed = None
+        if gpg_pre and gpg_post:
+            signed = raw
+        return data, signed, end
+
+
+class _ProfiledSplitter(_ParagraphSplitter):
+    """A _ParagraphSplitter timing its handling of GPG armor as a stage"""
+
+    def __init__(self, stats):
+        _ParagraphSplitter.__init__(self)
+        self.stats = stats
+
+    def _split_armored(self, buf, start, final):
+        self.stats.enter('armor')
+        result = None
+        try:
+            result = _ParagraphSplitter._split_armored(self, buf, start,
+                                                       final)
+        finally:
+            if result is None:
+                self.stats.leave()
+            else:
+                self.stats.leave(result[2] - start)
+        return result
+
+
+def _count_fields(fields):
+    """Return how many distinct fields _scan_fields can find in fields"""
+    if fields is None:
+        return None
+    if isinstance(fields, _CaseInsensitiveFields):
+        return len(fields)
+    try:
+        return len(set(fields))
+    except TypeError:
+        # Some other container; never stop early
+        return None
+
+
+def _decode_key(raw_key, fields):
+    """Return the (name, lowercase name) of the raw text before a colon
+
+    Both are None if raw_key is not a valid field name, and lowercase name
+    is None if the field is not in fields.
+    """
+    name = raw_key.rstrip()
+    s = _Syntax.of(raw_key)
+    if not name or name.find(s.whitespace[0]) >= 0 or \
+            name.find(s.whitespace[1]) >= 0:
+        return None, None
+    if sys.version >= '3' and isinstance(name, bytes):
+        name = name.decode('utf-8', 'replace')
+    lower = name.lower()
+    if fields is not None and name not in fields:
+        lower = None
+    return name, lower
+
+
+_field_patterns = {}
+
+
+def _field_pattern(fields, syntax):
+    """Return a regular expression matching the lines that start fields
+
+    Returns None if fields cannot be enumerated (or hashed).
+    """
+    try:
+        return _field_patterns[fields, syntax.empty]
+    except KeyError:
+        pass
+    except TypeError:
+        return None
+    conv = syntax.conv
+    names = []
+    for name in fields:
+        if not name or re.search(r'[\s:]', name):
+            # Not something _decode_key would accept
+            continue
+        names.append(re.escape(conv(name)))
+    flags = re.MULTILINE
+    if isinstance(fields, _CaseInsensitiveFields):
+        flags |= re.IGNORECASE
+    if names:
+        pattern = conv('^(') + conv('|').join(names) + conv(')[ \t\f\v]*:')
+    else:
+        pattern = conv('(?!)')
+    pattern = re.compile(pattern, flags)
+    if len(_field_patterns) >= 64:
+        _field_patterns.clear()
+    _field_patterns[fields, syntax.empty] = pattern
+    return pattern
+
+
+def _span(key, lower, key_start, start, end, value, pieces, syntax):
+    """Return the tuple _scan_fields gives for a field when spans is True"""
+    if end is not None:
+        return (key, lower, key_start, start, end, None)
+    if pieces:
+        value += syntax.empty.join(pieces)
+    return (key, lower, key_start, start, end, value)
+
+
+def _scan_fields(data, fields=None, keys=None, wanted=None, spans=False,
+                 pos=0, endpos=None):
+    """Return the (key, lowercase key, value) triples of a raw paragraph
+
+    data is as returned by _ParagraphSplitter.  Values are not decoded.  If
+    fields is given, only keys in fields are returned: the lines of other
+    fields (and their continuation lines) are skipped without looking at
+    them, and scanning stops once all of the fields have been seen, unless
+    one of them appears again further on (a field given more than once
+    takes its last value, whether or not fields is given).  wanted is the
+    number of distinct fields in fields, as given by _count_fields.
+    keys is an optional dict used to share decoded keys between paragraphs.
+
+    If spans is True, return (key, lowercase key, key start, value start,
+    value end, value) tuples instead, where value is None when it is just
+    data[value start:value end], and value end is None when it is not (a
+    line of it was dropped).
+
+    Only data[pos:endpos] is scanned, but all offsets are into data, so a
+    paragraph inside a larger buffer can be scanned without copying it.
+    """
+    s = _Syntax.of(data)
+    nl = s.nl
+    whitespace = s.whitespace
+    next_field = s.next_field_re.search
+    if keys is None:
+        keys = {}
+    if wanted is None:
+        wanted = _count_fields(fields)
+    if wanted:
+        pattern = _field_pattern(fields, s)
+        if pattern is not None:
+            if isinstance(fields, _CaseInsensitiveFields):
+                seen_index = 1
+            else:
+                seen_index = 0
+            return _find_fields(data, fields, keys, wanted, seen_index,
+                                pattern, spans, pos, endpos)
+
+    triples = []
+    n = len(data) if endpos is None else endpos
+    if data.endswith(nl, 0, n):
+        n -= 1
+    key = None
+    value = None
+    pieces = []
+    start = end = None
+
+    while pos < n:
+        if data[pos:pos + 1] in whitespace:
+            # Find the whole run of continuation lines at once; all of them
+            # are kept verbatim, except (as Deb822 always did) lines
+            # consisting of a single whitespace character.
+            m = next_field(data, pos, n)
+            if m is None:
+                eol = n
+            else:
+                eol = m.start()
+            if key is not None:
+                run = data[pos - 1:eol]
+                if s.short_line_re.search(run) is None:
+                    pieces.append(run)
+                    if end == pos - 1:
+                        end = eol
+                    else:
+                        end = None
+                else:
+                    for line in data[pos:eol].split(nl):
+                        if len(line) >= 2:
+                            pieces.append(nl + line)
+                    end = None
+            pos = eol + 1
+            continue
+
+        eol = data.find(nl, pos, n)
+        if eol < 0:
+            eol = n
+        line = data[pos:eol]
+        line_start = pos
+        pos = eol + 1
+        raw_key, sep, rest = line.partition(s.colon)
+        if not sep:
+            continue
+        try:
+            name, lower = keys[raw_key]
+        except KeyError:
+            name, lower = keys[raw_key] = _decode_key(raw_key, fields)
+        if name is None:
+            continue
+
+        if key is not None:
+            if spans:
+                triples.append(_span(key, lkey, key_start, start, end, value,
+                                     pieces, s))
+            else:
+                if pieces:
+                    value += s.empty.join(pieces)
+                triples.append((key, lkey, value))
+            pieces = []
+            key = None
+        if lower is None:
+            # An unwanted field; skip its continuation lines, if any
+            if pos < n and data[pos:pos + 1] in whitespace:
+                m = next_field(data, pos, n)
+                if m is None:
+                    pos = n
+                else:
+                    pos = m.end()
+            continue
+        key = name
+        lkey = lower
+        value = rest.strip()
+        if spans:
+            key_start = line_start
+            if value:
+                start = eol - len(rest.lstrip())
+                end = start + len(value)
+            else:
+                start = end = eol
+
+    if key is not None:
+        if spans:
+            triples.append(_span(key, lkey, key_start, start, end, value,
+                                 pieces, s))
+        else:
+            if pieces:
+                value += s.empty.join(pieces)
+            triples.append((key, lkey, value))
+
+    return triples
+
+
+def _find_fields(data, fields, keys, wanted, seen_index, pattern,
+                 spans=False, pos=0, endpos=None):
+    """_scan_fields for a few fields, jumping from one to the next
+
+    pattern (from _field_pattern) finds the lines starting the wanted
+    fields, so that the lines of all other fields are never looked at in
+    Python code.
+    """
+    s = _Syntax.of(data)
+    nl = s.nl
+    whitespace = s.whitespace
+    next_field = s.next_field_re.search
+    n = len(data) if endpos is None else endpos
+    if data.endswith(nl, 0, n):
+        n -= 1
+    triples = []
+    seen = set()
+
+    for m in pattern.finditer(data, pos, n):
+        raw_key = m.group(1)
+        try:
+            name, lower = keys[raw_key]
+        except KeyError:
+            name, lower = keys[raw_key] = _decode_key(raw_key, fields)
+        if lower is None:
+            continue
+        eol = data.find(nl, m.end(), n)
+        if eol < 0:
+            eol = n
+        rest = data[m.end():eol]
+        value = rest.strip()
+        if value:
+            start = eol - len(rest.lstrip())
+            end = start + len(value)
+        else:
+            start = end = eol
+
+        # The value goes on up to the next valid field line; continuation
+        # lines are added to it and lines that are neither are skipped, just
+        # as _scan_fields does.
+        pieces = []
+        pos = eol + 1
+        while pos < n:
+            if data[pos:pos + 1] in whitespace:
+                run_end = next_field(data, pos, n)
+                if run_end is None:
+                    eol = n
+                else:
+                    eol = run_end.start()
+                run = data[pos - 1:eol]
+                if s.short_line_re.search(run) is None:
+                    pieces.append(run)
+                    if end == pos - 1:
+                        end = eol
+                    else:
+                        end = None
+                else:
+                    for line in data[pos:eol].split(nl):
+                        if len(line) >= 2:
+                            pieces.append(nl + line)
+                    end = None
+                pos = eol + 1
+                continue
+            eol = data.find(nl, pos, n)
+            if eol < 0:
+                eol = n
+            raw_key, sep, rest = data[pos:eol].partition(s.colon)
+            if sep:
+                try:
+                    other = keys[raw_key][0]
+                except KeyError:
+                    keys[raw_key] = _decode_key(raw_key, fields)
+                    other = keys[raw_key][0]
+                if other is not None:
+                    break
+            pos = eol + 1
+
+        if spans and end is not None:
+            triples.append((name, lower, m.start(), start, end, None))
+        else:
+            if pieces:
+                value += s.empty.join(pieces)
+            if spans:
+                triples.append((name, lower, m.start(), start, end, value))
+            else:
+                triples.append((name, lower, value))
+        seen.add((name, lower)[seen_index])
+        if len(seen) >= wanted and pattern.search(data, pos, n) is None:
+            # Everything asked for has been found, and (as the last copy
+            # of a field is the one that counts) not found again later
+            break
+
+    return triples
+
+
+class _Where(object):
+    """Field predicates for iter_paragraphs, tested on raw paragraphs
+
+    where maps field names (in any case) to predicates, all of which a
+    paragraph must satisfy: a string the value of the field must be equal
+    to, a compiled regular expression it must match (as with search), or a
+    set, frozenset, list or tuple of strings it must be one of.  Paragraphs
+    missing a field never match.
+
+    Predicates are tested against the raw values, before anything is
+    decoded, so for bytes input they are encoded with encoding first.
+    """
+
+    def __init__(self, where, encoding="utf-8"):
+        self.encoding = encoding
+        self.fields = _CaseInsensitiveFields(where)
+        self.__predicates = []
+        for name, predicate in six.iteritems(where):
+            if isinstance(predicate, six.string_types + (bytes,)):
+                kind = 'equal'
+            elif hasattr(predicate, 'search'):
+                kind = 'regex'
+            elif isinstance(predicate, (set, frozenset, list, tuple)):
+                kind = 'in'
+            else:
+                raise TypeError('unsupported predicate for field %s: %r'
+                                % (name, predicate))
+            self.__predicates.append((name.lower(), kind, predicate))
+        # The predicates converted for text and for bytes input
+        self.__tests = {}
+        self.__keys = {}
+
+    def __convert(self, value, text):
+        if text and isinstance(value, bytes) and \
+                not isinstance(value, six.text_type):
+            return value.decode(self.encoding)
+        if not text and isinstance(value, six.text_type):
+            return value.encode(self.encoding)
+        return value
+
+    def __tests_for(self, sample):
+        """Return (tests, needles) for data of the same type as sample
+
+        tests maps lowercase field names to (kind, operand) pairs, and
+        needles are strings any matching paragraph has to contain.
+        """
+        text = isinstance(sample, six.text_type)
+        try:
+            return self.__tests[text]
+        except KeyError:
+            pass
+        tests = {}
+        needles = []
+        for lower, kind, predicate in self.__predicates:
+            if kind == 'equal':
+                operand = self.__convert(predicate, text)
+                needles.append(operand)
+            elif kind == 'regex':
+                operand = predicate
+                pattern = self.__convert(predicate.pattern, text)
+                if type(pattern) is not type(predicate.pattern):
+                    flags = predicate.flags
+                    if not text:
+                        flags &= ~re.UNICODE
+                    operand = re.compile(pattern, flags)
+            else:
+                operand = frozenset([self.__convert(value, text)
+                                     for value in predicate])
+            tests[lower] = (kind, operand)
+        result = self.__tests[text] = (tests, needles)
+        return result
+
+    def test(self, data):
+        """Return whether the raw paragraph data matches"""
+        tests, needles = self.__tests_for(data)
+        for needle in needles:
+            if needle not in data:
+                return False
+        triples = _scan_fields(data, self.fields, self.__keys, len(tests))
+        return self.test_triples(triples, tests)
+
+    def test_triples(self, triples, tests=None):
+        """Return whether the (key, lowercase key, raw value) triples match"""
+        if tests is None:
+            if not triples:
+                return False
+            tests = self.__tests_for(triples[0][2])[0]
+        values = {}
+        for key, lower, value in triples:
+            # The last copy of a field is the one that counts
+            if lower in tests:
+                values[lower] = value
+        if len(values) < len(tests):
+            return False
+        for lower, (kind, operand) in six.iteritems(tests):
+            value = values[lower]
+            if kind == 'equal':
+                if value != operand:
+                    return False
+            elif kind == 'regex':
+                if operand.search(value) is None:
+                    return False
+            elif value not in operand:
+                return False
+        return True
+
+
 class OrderedSet(object):
     """A set-like object that preserves order when iterating over it
 
@@ -157,6 +1368,271 @@ class OrderedSet(object):
     ###
 
 
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+class Deb822Stats(object):
+    """Where the time goes when parsing, stage by stage
+
+    For each stage, seconds, calls, bytes and lines map its name to the
+    wall time spent in it (not counting the stages it calls), the number of
+    times it ran, and the bytes and lines it handled.  The stages are:
+
+      read       reading (and decompressing) the input
+      split      finding the paragraphs, and dropping comments
+      armor      splitting GPG armor from signed paragraphs
+      skip       dropping comments and leading blank lines (Deb822(...))
+      filter     testing paragraphs against the where argument
+      decode     decoding paragraphs from clean chunks up front
+      scan       finding the fields of paragraphs
+      construct  making paragraph objects
+      apt_pkg, cache, workers
+                 producing paragraphs in those modes of iter_paragraphs
+      detect     guessing the encoding of values with chardet
+
+    fallbacks counts the values that did not decode with the expected
+    encoding, and detections the chardet runs they caused.
+
+    Stats are gathered by passing an instance as the stats argument of
+    Deb822.iter_paragraphs, or for everything parsed within a
+    profile_stages block.  Without either, none of this code runs.
+    """
+
+    stages = ['read', 'split', 'armor', 'skip', 'filter', 'decode', 'scan',
+              'construct', 'apt_pkg', 'cache', 'workers', 'detect']
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.bytes = {}
+        self.lines = {}
+        self.fallbacks = 0
+        self.detections = 0
+        self.__stack = []
+        self.__mark = None
+
+    def enter(self, stage):
+        """Start timing stage, pausing the stage that was running"""
+        now = _clock()
+        if self.__stack:
+            top = self.__stack[-1]
+            self.seconds[top] = self.seconds.get(top, 0) + now - self.__mark
+        self.__stack.append(stage)
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+        self.__mark = now
+
+    def leave(self, nbytes=0, nlines=0):
+        """Stop timing the current stage, which handled nbytes and nlines"""
+        now = _clock()
+        stage = self.__stack.pop()
+        self.seconds[stage] = self.seconds.get(stage, 0) + now - self.__mark
+        self.__mark = now
+        if nbytes:
+            self.bytes[stage] = self.bytes.get(stage, 0) + nbytes
+        if nlines:
+            self.lines[stage] = self.lines.get(stage, 0) + nlines
+
+    def iterate(self, stage, iterable, size=None, lines=0):
+        """Yield the items of iterable, timing each step as stage
+
+        Each item counts for size(item) bytes, if size is given, and for
+        lines lines.  Items are only taken from iterable as they are asked
+        for.
+        """
+        iterator = iter(iterable)
+        while True:
+            self.enter(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.leave()
+                return
+            except:
+                self.leave()
+                raise
+            if size is None:
+                self.leave(0, lines)
+            else:
+                self.leave(size(item), lines)
+            yield item
+
+    def total(self):
+        return sum(self.seconds.values())
+
+    def report(self):
+        """Return a table of the time spent in each stage"""
+        total = self.total() or 1
+        lines = ['%-10s %9s %6s %9s %12s %10s' % (
+            'stage', 'seconds', '%', 'calls', 'bytes', 'lines')]
+        for stage in self.stages:
+            if stage not in self.calls:
+                continue
+            lines.append('%-10s %9.4f %6.1f %9d %12d %10d' % (
+                stage, self.seconds.get(stage, 0),
+                100.0 * self.seconds.get(stage, 0) / total,
+                self.calls[stage], self.bytes.get(stage, 0),
+                self.lines.get(stage, 0)))
+        lines.append('%-10s %9.4f' % ('total', self.total()))
+        lines.append('fallbacks: %d, chardet detections: %d'
+                     % (self.fallbacks, self.detections))
+        return '\n'.join(lines) + '\n'
+
+
+# The Deb822Stats of the innermost profile_stages block, if any
+_stats = None
+
+
+@contextlib.contextmanager
+def profile_stages(stats=None, file=None):
+    """Gather Deb822Stats about all the parsing done in a with block
+
+    When the block ends, a breakdown by stage is printed to file (standard
+    error by default), unless file is False.  Paragraph generators must be
+    consumed within the block:
+
+        with profile_stages() as stats:
+            packages = list(Packages.iter_paragraphs(f))
+    """
+    global _stats
+    if stats is None:
+        stats = Deb822Stats()
+    previous = _stats
+    _stats = stats
+    try:
+        yield stats
+    finally:
+        _stats = previous
+        if file is not False:
+            (file or sys.stderr).write(stats.report())
+
+
+def _count_lines(data):
+    if isinstance(data, bytes):
+        return data.count(b'\n')
+    return data.count('\n')
+
+
+if hasattr(bytes, 'isascii'):
+    _is_ascii = bytes.isascii
+else:
+    _non_ascii_re = re.compile(b'[\x80-\xff]')
+
+    def _is_ascii(data):
+        return _non_ascii_re.search(data) is None
+
+
+class Deb822Decoder(object):
+    """The encoding strategy of the paragraphs read from a file
+
+    Deb822.iter_paragraphs makes one of these for each call (or uses the
+    one it is given), and shares it between all the paragraphs it yields:
+
+      - each chunk of binary input is checked once, for being pure ASCII
+        or valid in the encoding; the paragraphs made only from such
+        chunks are decoded as a whole, up front, and their values never
+        need to be decoded again.
+      - values that do not decode with the encoding are handed to chardet,
+        whose verdicts are cached by a fingerprint of the paragraph they
+        come from and by the value itself, so that a paragraph read again,
+        or a name that appears in many paragraphs, is only examined once.
+
+    The counters chunks, clean_chunks, fallbacks (values that failed to
+    decode with the encoding), detections (chardet runs) and cache_hits
+    record what happened.
+    """
+
+    # Number of chardet verdicts kept before the cache is cleared
+    max_verdicts = 4096
+
+    def __init__(self, encoding="utf-8"):
+        self.encoding = encoding
+        self.chunks = 0
+        self.clean_chunks = 0
+        self.fallbacks = 0
+        self.detections = 0
+        self.cache_hits = 0
+        # Whether the paragraphs being split come from clean chunks only
+        self.clean = False
+        # The Deb822Stats of the iter_paragraphs call using this decoder
+        self.stats = None
+        self.__verdicts = {}
+        self.__incremental = codecs.getincrementaldecoder(encoding)()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_Deb822Decoder__incremental']
+        state['stats'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__incremental = codecs.getincrementaldecoder(self.encoding)()
+
+    def check_chunk(self, chunk):
+        """Return whether all of chunk can be decoded with the encoding"""
+        self.chunks += 1
+        if isinstance(chunk, six.text_type):
+            return False
+        if _is_ascii(chunk):
+            clean = True
+        else:
+            try:
+                self.__incremental.decode(chunk)
+                clean = True
+            except UnicodeDecodeError:
+                self.__incremental.reset()
+                clean = False
+        if clean:
+            self.clean_chunks += 1
+        return clean
+
+    def decode_paragraph(self, data):
+        """Return data decoded with the encoding if it came from clean chunks,
+        and data itself otherwise"""
+        if self.clean and isinstance(data, bytes):
+            try:
+                return data.decode(self.encoding)
+            except UnicodeDecodeError:
+                pass
+        return data
+
+    def detect(self, value, paragraph=None):
+        """Return the encoding of value, which did not decode with the
+        encoding, or None if chardet cannot tell
+
+        :param paragraph: the raw paragraph value comes from, if known.
+        """
+        self.fallbacks += 1
+        if self.stats is not None or _stats is not None:
+            (self.stats or _stats).fallbacks += 1
+        keys = [value]
+        if isinstance(paragraph, bytes):
+            keys.append(_fingerprint(paragraph))
+        for key in keys:
+            try:
+                encoding = self.__verdicts[key]
+            except KeyError:
+                continue
+            self.cache_hits += 1
+            return encoding
+        stats = self.stats or _stats
+        self.detections += 1
+        if stats is None:
+            encoding = chardet.detect(value)['encoding']
+        else:
+            stats.detections += 1
+            stats.enter('detect')
+            try:
+                encoding = chardet.detect(value)['encoding']
+            finally:
+                stats.leave(len(value), _count_lines(value) + 1)
+        if len(self.__verdicts) >= self.max_verdicts:
+            self.__verdicts.clear()
+        for key in keys:
+            self.__verdicts[key] = encoding
+        return encoding
+
+
 class Deb822Dict(_mutable_mapping_mixin, object):
     # Subclassing _mutable_mapping_mixin because we're overriding so much
     # dict functionality that subclassing dict requires overriding many more
@@ -177,6 +1653,9 @@ class Deb822Dict(_mutable_mapping_mixin, object):
 
     # See the end of the file for the definition of _strI
 
+    # The Deb822Decoder shared with the other paragraphs of the same file
+    _decoder = None
+
     def __init__(self, _dict=None, _parsed=None, _fields=None,
                  encoding="utf-8"):
         self.__dict = {}
@@ -207,6 +1686,17 @@ class Deb822Dict(_mutable_mapping_mixin, object):
             else:
                 self.__keys.extend([ _strI(f) for f in _fields if f in self.__parsed ])
 
+    def _add_parsed(self, _parsed):
+        """Expose the fields of _parsed, after any fields already there
+
+        This is for parsers: the values of _parsed are taken as they are,
+        without validation.
+        """
+        if self.__parsed is not None:
+            raise ValueError('fields from a parser were already added')
+        self.__parsed = _parsed
+        self.__keys.extend([_strI(k) for k in _parsed])
+
     def _detect_encoding(self, value):
         """If value is not already Unicode, decode it intelligently."""
         if isinstance(value, bytes):
@@ -218,16 +1708,23 @@ class Deb822Dict(_mutable_mapping_mixin, object):
                 warnings.warn('decoding from %s failed; attempting to detect '
                               'the true encoding' % self.encoding,
                               UnicodeWarning)
-                result = chardet.detect(value)
+                decoder = getattr(self, '_decoder', None)
+                if decoder is None:
+                    decoder = Deb822Decoder(self.encoding)
+                parsed = getattr(self, '_Deb822Dict__parsed', None)
+                encoding = decoder.detect(value,
+                                          getattr(parsed, '_data', None))
+                if encoding is None:
+                    raise e
                 try:
-                    return value.decode(result['encoding'])
+                    return value.decode(encoding)
                 except UnicodeDecodeError:
                     raise e
                 else:
                     # Assume the rest of the paragraph is in this encoding as
                     # well (there's no sense in repeating this exercise for
                     # every field).
-                    self.encoding = result['encoding']
+                    self.encoding = encoding
         else:
             return value
 
@@ -251,7 +1748,11 @@ class Deb822Dict(_mutable_mapping_mixin, object):
             value = self.__dict[key]
         except KeyError:
             if self.__parsed is not None and key in self.__keys:
-                value = self.__parsed[key]
+                # Values from _parsed are decoded only the first time they
+                # are looked up
+                value = self._detect_encoding(self.__parsed[key])
+                self.__dict[key] = value
+                return value
             else:
                 raise
 
@@ -333,6 +1834,7 @@ class Deb822(Deb822Dict):
                             encoding=encoding)
 
         if sequence is not None:
+            sequence = _uncompressed(sequence)
             try:
                 self._internal_parser(sequence, fields)
             except EOFError:
@@ -341,7 +1843,9 @@ class Deb822(Deb822Dict):
         self.gpg_info = None
 
     def iter_paragraphs(cls, sequence, fields=None, use_apt_pkg=True,
-                        shared_storage=False, encoding="utf-8"):
+                        shared_storage=False, encoding="utf-8", cache=None,
+                        workers=None, readahead=False, where=None,
+                        compact=False, decoder=None, stats=None):
         """Generator that yields a Deb822 object for each paragraph in sequence.
 
         :param sequence: same as in __init__.
@@ -356,9 +1860,81 @@ class Deb822(Deb822Dict):
         :param encoding: Interpret the paragraphs in this encoding.
             (All values are given back as unicode objects, so an encoding is
             necessary in order to properly interpret the strings.)
+        :param cache: a Deb822Cache to keep the parsed paragraphs in.  It is
+            only used if sequence is a real file opened on a regular file,
+            which is then read (in binary mode) from its name.
+        :param workers: if greater than 1, split the input into batches of
+            paragraphs, and scan and decode them in a pool of this many
+            processes.  Paragraphs are still yielded in order, and only a
+            few batches per worker are held in memory at a time.  apt_pkg is
+            not used in this mode.
+        :param readahead: if True, read (and decompress) the input in a
+            separate thread, overlapping with parsing it.
+        :param where: a dict mapping field names to predicates, to only
+            yield the paragraphs satisfying all of them.  A predicate is
+            either a string the value of the field must be equal to, a
+            compiled regular expression it must match (as with search), or
+            a set, list or tuple of strings it must be one of.  Predicates
+            are tested on the raw paragraphs (encoded with encoding, for
+            bytes input), so paragraphs that do not match are never decoded
+            or turned into objects.  apt_pkg is not used with where.
+        :param compact: if True, yield read-only CompactDeb822 objects
+            instead of instances of this class.  They take much less memory,
+            which matters when keeping many paragraphs around, but only
+            offer the read-only mapping interface, get_as_string and dump.
+        :param decoder: the Deb822Decoder deciding how values are decoded
+            (its encoding then replaces the encoding parameter).  By
+            default, a new one is made for each call; pass one to share it
+            between calls, or to look at its counters afterwards.  Worker
+            processes use decoders of their own.
+        :param stats: a Deb822Stats to add the time spent in each stage of
+            parsing to, along with the amount of data each one handled.
+            Within a profile_stages block, its Deb822Stats is used by
+            default.  Only the native parser (without cache or workers)
+            tells its stages apart.
+
+        Binary files and bytes compressed with gzip, bzip2 or xz (e.g.
+        Packages.gz or Sources.xz) are detected by their first bytes, and
+        decompressed a chunk at a time as they are parsed.
         """
 
-        if _have_apt_pkg and use_apt_pkg and _is_real_file(sequence):
+        if decoder is None:
+            decoder = Deb822Decoder(encoding)
+        else:
+            encoding = decoder.encoding
+        if where is not None:
+            where = _Where(where, encoding)
+        if stats is None:
+            stats = _stats
+        if stats is not None:
+            # Only looked at by the slow path of Deb822Decoder.detect
+            decoder.stats = stats
+
+        path = cache is not None and _file_path(sequence)
+        if path:
+            paragraphs = cls._iter_payload_paragraphs(
+                payload=cache.load(path, 'paragraphs',
+                                   _build_paragraphs_payload),
+                fields=fields, encoding=encoding, where=where,
+                compact=compact, decoder=decoder)
+            if stats is not None:
+                paragraphs = stats.iterate('cache', paragraphs)
+            for paragraph in paragraphs:
+                yield paragraph
+
+        elif workers is not None and workers > 1:
+            paragraphs = cls._iter_parallel_paragraphs(
+                sequence, fields, encoding, workers, readahead, where,
+                compact)
+            if stats is not None:
+                paragraphs = stats.iterate('workers', paragraphs)
+            for paragraph in paragraphs:
+                yield paragraph
+
+        elif (_have_apt_pkg and use_apt_pkg and not readahead
+                and where is None
+                and _is_real_file(sequence)
+                and _peek_compression(sequence) is None):
             kwargs = {}
             if sys.version >= '3':
                 # bytes=True is supported for both Python 2 and 3, but we
@@ -368,27 +1944,213 @@ class Deb822(Deb822Dict):
                 # handling, which is more tolerant of mixed-encoding files.
                 kwargs['bytes'] = True
             parser = apt_pkg.TagFile(sequence, **kwargs)
+            if stats is not None:
+                parser = stats.iterate('apt_pkg', parser)
             for section in parser:
-                paragraph = cls(fields=fields,
-                                _parsed=TagSectionWrapper(section),
-                                encoding=encoding)
+                if compact:
+                    section = TagSectionWrapper(section)
+                    paragraph = cls._from_triples(
+                        [(key, key.lower(), section[key]) for key in section
+                         if fields is None or key in fields],
+                        None, encoding, compact)
+                else:
+                    paragraph = cls(fields=fields,
+                                    _parsed=TagSectionWrapper(section),
+                                    encoding=encoding)
+                    paragraph._decoder = decoder
                 if paragraph:
                     yield paragraph
 
         else:
-            if isinstance(sequence, six.string_types):
-                sequence = sequence.splitlines()
-            iterable = iter(sequence)
-            x = cls(iterable, fields, encoding=encoding)
-            while len(x) != 0:
-                yield x
-                x = cls(iterable, fields, encoding=encoding)
+            for paragraph in cls._iter_native_paragraphs(
+                    sequence, fields, encoding, readahead, where, compact,
+                    decoder, stats):
+                yield paragraph
 
     iter_paragraphs = classmethod(iter_paragraphs)
 
-    ###
+    if sys.version_info >= (3, 6):
+        @classmethod
+        def aiter_paragraphs(cls, stream, fields=None, encoding="utf-8",
+                             where=None, compact=False, decoder=None):
+            """Asynchronous generator of an object for each paragraph
 
-    @staticmethod
+            This is the asyncio counterpart of iter_paragraphs (without
+            apt_pkg, cache or workers), for use with 'async for':
+
+                reader, writer = await asyncio.open_unix_connection(path)
+                async for pkg in Packages.aiter_paragraphs(reader):
+                    ...
+
+            :param stream: an object with a coroutine read method, such as
+                an asyncio.StreamReader, or an asynchronous iterable of
+                bytes.  Data compressed with gzip, bzip2 or xz is
+                decompressed.
+
+            The other parameters are as for iter_paragraphs.  Paragraphs
+            are parsed as their data arrives, and control goes back to the
+            event loop after each of them.  Only defined on Python >= 3.6.
+            """
+            from debian._deb822_async import aiter_paragraphs
+            return aiter_paragraphs(cls, stream, fields, encoding, where,
+                                    compact, decoder)
+
+    @classmethod
+    def _iter_native_paragraphs(cls, sequence, fields=None,
+                                encoding="utf-8", readahead=False,
+                                where=None, compact=False, decoder=None,
+                                stats=None):
+        """Parse paragraphs without apt_pkg
+
+        The input is split into paragraphs on the raw text (or bytes) by
+        _ParagraphSplitter, and fields are found by _scan_fields.  Values
+        are handed to the paragraph undecoded, just like TagSectionWrapper
+        does, so they are only decoded when looked up.  With a Deb822Stats,
+        each stage is timed into it.
+        """
+        if fields is not None:
+            fields = frozenset(fields)
+        wanted = _count_fields(fields)
+        keys = {}
+        for block in _iter_blocks(sequence, readahead, decoder, stats):
+            if where is not None:
+                if stats is None:
+                    matched = where.test(block[2])
+                else:
+                    stats.enter('filter')
+                    try:
+                        matched = where.test(block[2])
+                    finally:
+                        stats.leave(len(block[2]))
+                if not matched:
+                    continue
+            paragraph = cls._from_block(block, fields, keys, encoding, wanted,
+                                        compact, decoder, stats)
+            if paragraph is not None:
+                yield paragraph
+
+    @classmethod
+    def _iter_parallel_paragraphs(cls, sequence, fields, encoding, workers,
+                                  readahead=False, where=None,
+                                  compact=False):
+        """Parse paragraphs with _parse_batch in a pool of worker processes
+
+        At most two batches per worker are submitted ahead of the paragraph
+        being yielded, so a slow consumer holds the workers back instead of
+        letting parsed paragraphs pile up in memory.
+        """
+        if fields is not None:
+            fields = frozenset(fields)
+        window = 2 * workers
+        pool = multiprocessing.Pool(workers)
+        pending = deque()
+        try:
+            for batch in _iter_batches(sequence, readahead=readahead):
+                pending.append(pool.apply_async(
+                    _parse_batch, (batch, fields, encoding, where)))
+                if len(pending) < window:
+                    continue
+                for triples, encoding_, signed in pending.popleft().get():
+                    yield cls._from_triples(triples, signed, encoding_,
+                                            compact)
+            while pending:
+                for triples, encoding_, signed in pending.popleft().get():
+                    yield cls._from_triples(triples, signed, encoding_,
+                                            compact)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @classmethod
+    def _from_block(cls, block, fields, keys, encoding, wanted=None,
+                    compact=False, decoder=None, stats=None):
+        if stats is not None:
+            return cls._from_profiled_block(block, fields, keys, encoding,
+                                            wanted, compact, decoder, stats)
+        start, end, data, signed = block
+        if decoder is not None:
+            data = decoder.decode_paragraph(data)
+        spans = _scan_fields(data, fields, keys, wanted, spans=not compact)
+        return cls._from_spans(data, spans, signed, encoding, compact,
+                               decoder)
+
+    @classmethod
+    def _from_profiled_block(cls, block, fields, keys, encoding, wanted,
+                             compact, decoder, stats):
+        """_from_block, timing each of its stages into stats"""
+        start, end, data, signed = block
+        if decoder is not None:
+            stats.enter('decode')
+            try:
+                data = decoder.decode_paragraph(data)
+            finally:
+                stats.leave(len(data))
+        stats.enter('scan')
+        try:
+            spans = _scan_fields(data, fields, keys, wanted,
+                                 spans=not compact)
+        finally:
+            stats.leave(len(data), _count_lines(data) + 1)
+        stats.enter('construct')
+        try:
+            return cls._from_spans(data, spans, signed, encoding, compact,
+                                   decoder)
+        finally:
+            stats.leave()
+
+    @classmethod
+    def _from_spans(cls, data, spans, signed, encoding, compact, decoder):
+        """Make a paragraph of what _scan_fields found in data (triples if
+        compact, or spans)"""
+        if compact:
+            return cls._from_triples(spans, signed, encoding, compact)
+        if not spans:
+            return None
+        paragraph = cls(_parsed=_BlobParagraph(data, spans), encoding=encoding)
+        paragraph._decoder = decoder
+        if signed is not None and isinstance(paragraph, _gpg_multivalued):
+            paragraph.raw_text = signed
+        return paragraph
+
+    @classmethod
+    def _from_triples(cls, triples, signed, encoding, compact=False,
+                      decoder=None):
+        if not triples:
+            return None
+        if compact:
+            return CompactDeb822._from_triples(triples, encoding)
+        paragraph = cls(_parsed=_RawParagraph(triples), encoding=encoding)
+        paragraph._decoder = decoder
+        if signed is not None and isinstance(paragraph, _gpg_multivalued):
+            paragraph.raw_text = signed
+        return paragraph
+
+    @classmethod
+    def _iter_payload_paragraphs(cls, payload, fields=None, encoding="utf-8",
+                                 where=None, compact=False, decoder=None):
+        """Yield paragraphs from data cached by _build_paragraphs_payload"""
+        names, rows = payload
+        lowers = [name.lower() for name in names]
+        if fields is not None:
+            fields = frozenset(fields)
+        for row in rows:
+            if where is not None and not where.test_triples(
+                    [(names[row[i]], lowers[row[i]], row[i + 1])
+                     for i in range(1, len(row), 2)]):
+                continue
+            triples = []
+            for i in range(1, len(row), 2):
+                name = names[row[i]]
+                if fields is None or name in fields:
+                    triples.append((name, lowers[row[i]], row[i + 1]))
+            paragraph = cls._from_triples(triples, row[0], encoding, compact,
+                                          decoder)
+            if paragraph is not None:
+                yield paragraph
+
+    ###
+
+    @staticmethod
     def _skip_useless_lines(sequence):
         """Yields only lines that do not begin with '#'.
 
@@ -418,57 +2180,45 @@ class Deb822(Deb822Dict):
             yield line
 
     def _internal_parser(self, sequence, fields=None):
-        # The key is non-whitespace, non-colon characters before any colon.
-        key_part = r"^(?P<key>[^: \t\n\r\f\v]+)\s*:\s*"
-        single = re.compile(key_part + r"(?P<data>\S.*?)\s*$")
-        multi = re.compile(key_part + r"$")
-        multidata = re.compile(r"^\s(?P<data>.+?)\s*$")
-
-        wanted_field = lambda f: fields is None or f in fields
-
         if isinstance(sequence, (six.string_types, bytes)):
             sequence = sequence.splitlines()
+        stats = _stats
 
-        curkey = None
-        content = ""
-
-        for line in self.gpg_stripped_paragraph(
-                self._skip_useless_lines(sequence)):
-            line = self._detect_encoding(line)
-
-            m = single.match(line)
-            if m:
-                if curkey:
-                    self[curkey] = content
-
-                if not wanted_field(m.group('key')):
-                    curkey = None
-                    continue
-
-                curkey = m.group('key')
-                content = m.group('data')
-                continue
-
-            m = multi.match(line)
-            if m:
-                if curkey:
-                    self[curkey] = content
-
-                if not wanted_field(m.group('key')):
-                    curkey = None
-                    continue
-
-                curkey = m.group('key')
-                content = ""
-                continue
-
-            m = multidata.match(line)
-            if m:
-                content += '\n' + line # XXX not m.group('data')?
-                continue
-
-        if curkey:
-            self[curkey] = content
+        # The payload lines are always bytes; they are scanned as a whole by
+        # the native parser, and values are only decoded when looked up.
+        lines = self._skip_useless_lines(sequence)
+        if stats is None:
+            data = b'\n'.join(self.gpg_stripped_paragraph(lines))
+        else:
+            # Lines are only read up to the end of the paragraph, so the
+            # rest of a file is left for the next one
+            lines = stats.iterate('skip', lines, len, 1)
+            data = None
+            stats.enter('armor')
+            try:
+                data = b'\n'.join(self.gpg_stripped_paragraph(lines))
+            finally:
+                stats.leave(data is not None and len(data) or 0)
+        if fields is not None:
+            fields = frozenset(fields)
+        if stats is None:
+            spans = _scan_fields(data, fields, spans=True)
+        else:
+            stats.enter('scan')
+            try:
+                spans = _scan_fields(data, fields, spans=True)
+            finally:
+                stats.leave(len(data), _count_lines(data) + 1)
+        if not spans:
+            return
+        if stats is None:
+            self._add_parsed(_BlobParagraph(data, spans))
+        else:
+            stats.enter('construct')
+            try:
+                self._add_parsed(_BlobParagraph(data, spans))
+            finally:
+                stats.leave()
 
     def __str__(self):
         return self.dump()
@@ -689,13 +2439,15 @@ class Deb822(Deb822Dict):
 
     gpg_stripped_paragraph = classmethod(gpg_stripped_paragraph)
 
-    def get_gpg_info(self, keyrings=None):
+    def get_gpg_info(self, keyrings=None, cache=None):
         """Return a GpgInfo object with GPG signature information
 
         This method will raise ValueError if the signature is not available
         (e.g. the original text cannot be found).
 
         :param keyrings: list of keyrings to use (see GpgInfo.from_sequence)
+        :param cache: a GpgInfoCache to look the result up in before running
+            gpgv, and to store it in (see GpgInfo.from_sequence)
         """
 
         # raw_text is saved (as a string) only for Changes and Dsc (see
@@ -706,7 +2458,8 @@ class Deb822(Deb822Dict):
 
         if self.gpg_info is None:
             self.gpg_info = GpgInfo.from_sequence(self.raw_text,
-                                                  keyrings=keyrings)
+                                                  keyrings=keyrings,
+                                                  cache=cache)
 
         return self.gpg_info
 
@@ -748,9 +2501,20 @@ class GpgInfo(dict):
     # keys with format "key keyid uid"
     uidkeys = ('GOODSIG', 'EXPSIG', 'EXPKEYSIG', 'REVKEYSIG', 'BADSIG')
 
+    # keys which mean gpgv came to a conclusion about the signature, rather
+    # than failing to check it (e.g. for want of memory or a keyring)
+    definitive_keys = ('VALIDSIG', 'GOODSIG', 'BADSIG', 'NO_PUBKEY')
+
     def valid(self):
         """Is the signature valid?"""
         return 'GOODSIG' in self or 'VALIDSIG' in self
+
+    def is_definitive(self):
+        """Did gpg(v) reach a verdict on the signature?"""
+        for key in self.definitive_keys:
+            if key in self:
+                return True
+        return False
     
 # XXX implement as a property?
 # XXX handle utf-8 %-encoding
@@ -796,16 +2560,25 @@ class GpgInfo(dict):
         return n 
 
     @classmethod
-    def from_sequence(cls, sequence, keyrings=None, executable=None):
+    def from_sequence(cls, sequence, keyrings=None, executable=None,
+                      cache=None):
         """Create a new GpgInfo object from the given sequence.
 
         :param sequence: sequence of lines of bytes or a single byte string
+            (or other bytes-like object, such as a memoryview, which is
+            handed to gpgv without being copied on Python 3)
 
         :param keyrings: list of keyrings to use (default:
             ['/usr/share/keyrings/debian-keyring.gpg'])
 
         :param executable: list of args for subprocess.Popen, the first element
             being the gpgv executable (default: ['/usr/bin/gpgv'])
+
+        :param cache: a GpgInfoCache.  If it has the result of verifying the
+            same bytes with the same keyrings (as they are now) and
+            executable, that is returned without running gpgv; otherwise
+            the new result is stored in it, if it is definitive (gpgv
+            succeeded, or gave one of definitive_keys).
         """
 
         keyrings = keyrings or GPGV_DEFAULT_KEYRINGS
@@ -821,19 +2594,34 @@ class GpgInfo(dict):
         if "--keyring" not in args:
             raise IOError("cannot access any of the given keyrings")
 
-        p = subprocess.Popen(args, stdin=subprocess.PIPE,
-                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-                             universal_newlines=False)
-        # XXX what to do with exit code?
-
         if isinstance(sequence, bytes):
             inp = sequence
+        elif isinstance(sequence, _buffer_types):
+            inp = sequence
+            if sys.version < '3':
+                inp = bytes(bytearray(sequence))
         else:
             inp = cls._get_full_bytes(sequence)
+
+        if cache is not None:
+            key = cache.key(inp, keyrings, executable)
+            output = cache.get(key)
+            if output is not None:
+                return cls.from_output(*output)
+
+        p = subprocess.Popen(args, stdin=subprocess.PIPE,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             universal_newlines=False)
+        # XXX what to do with exit code?
         out, err = p.communicate(inp)
+        out = out.decode('utf-8')
+        err = err.decode('utf-8')
 
-        return cls.from_output(out.decode('utf-8'),
-                               err.decode('utf-8'))
+        info = cls.from_output(out, err)
+        if cache is not None and (p.returncode == 0 or
+                                  info.is_definitive()):
+            cache.put(key, (out, err))
+        return info
 
     @staticmethod
     def _get_full_bytes(sequence):
@@ -862,6 +2650,478 @@ class GpgInfo(dict):
         with open(target, 'rb') as target_file:
             return cls.from_sequence(target_file, *args, **kwargs)
 
+    @classmethod
+    def verify_many(cls, items, keyrings=None, max_workers=4,
+                    executable=None, cache=None):
+        """Verify many signed files or buffers, running gpgv concurrently
+
+        Yields a GpgVerification for each item as soon as it is done, which
+        is not necessarily in the order of items.  An item failing (e.g. a
+        file that cannot be read) gives a GpgVerification with its error
+        instead of a GpgInfo, and the other items are still verified.
+
+        :param items: an iterable of file names and signed data.  Text
+            strings are file names, as are byte strings without a newline;
+            other bytes-like objects are the signed data itself.  Items are
+            only taken from the iterable as gpgv processes become free.
+        :param keyrings: as for from_sequence.
+        :param max_workers: how many gpgv processes to run at a time.
+        :param executable: as for from_sequence (e.g. a stub behaving like
+            gpgv --status-fd 1, for testing).
+        :param cache: as for from_sequence.
+        """
+        numbered = enumerate(items)
+        if max_workers <= 1 or threading is None:
+            for index, item in numbered:
+                yield cls._verify_item(index, item, keyrings, executable,
+                                       cache)
+            return
+
+        lock = threading.Lock()
+        stop = threading.Event()
+        results = Queue(2 * max_workers)
+        done = object()
+
+        def put(result):
+            # Give up once the consumer has gone away
+            while not stop.is_set():
+                try:
+                    results.put(result, timeout=0.1)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def work():
+            while not stop.is_set():
+                try:
+                    with lock:
+                        index, item = next(numbered)
+                except StopIteration:
+                    break
+                except Exception:
+                    # From items itself: that ends the whole batch
+                    put((done, sys.exc_info()[1]))
+                    return
+                if not put(cls._verify_item(index, item, keyrings,
+                                            executable, cache)):
+                    return
+            put((done, None))
+
+        threads = []
+        for i in range(max_workers):
+            thread = threading.Thread(target=work)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        try:
+            running = len(threads)
+            while running:
+                result = results.get()
+                if result[0] is not done:
+                    yield result
+                    continue
+                if result[1] is not None:
+                    raise result[1]
+                running -= 1
+        finally:
+            stop.set()
+
+    @classmethod
+    def _verify_item(cls, index, item, keyrings, executable, cache=None):
+        """Verify one item of verify_many, catching its errors"""
+        try:
+            if isinstance(item, six.text_type) or (
+                    isinstance(item, bytes) and item.find(b'\n') < 0):
+                with open(item, 'rb') as f:
+                    data = f.read()
+            else:
+                data = item
+            info = cls.from_sequence(data, keyrings, executable, cache)
+        except Exception:
+            return GpgVerification(index, item, None, sys.exc_info()[1])
+        return GpgVerification(index, item, info, None)
+
+
+class GpgVerification(namedtuple('GpgVerification', 'index item info error')):
+    """The outcome of verifying one item with GpgInfo.verify_many
+
+    index is the position of item in the items given to verify_many, and
+    info its GpgInfo, or None if verifying it raised error.
+    """
+
+    __slots__ = ()
+
+    def valid(self):
+        """Was the item verified, with a valid signature?"""
+        return self.info is not None and self.info.valid()
+
+
+class GpgInfoCache(object):
+    """A persistent cache of gpgv results, shared between programs
+
+    Results are stored in a directory, one small file each, under a key
+    made of the SHA-256 of the signed bytes, the path, size and
+    modification time of each keyring, and the gpgv command line.  When a
+    keyring changes, the results obtained with it are therefore no longer
+    found, and eventually evicted: past max_entries results, the least
+    recently used ones are removed, down to 90% of max_entries at a time.
+    Only definitive results are stored (see GpgInfo.from_sequence).
+
+    Entries are written to a temporary file and renamed into place, so
+    concurrent users never see partial ones.  A result that cannot be
+    stored is silently not cached.
+
+    Use it by passing it as the cache argument of Deb822.get_gpg_info,
+    GpgInfo.from_sequence, from_file or verify_many:
+
+        cache = GpgInfoCache(os.path.expanduser('~/.cache/gpginfo'))
+        info = Dsc(f).get_gpg_info(cache=cache)
+    """
+
+    format_version = 1
+
+    def __init__(self, directory, max_entries=4096):
+        """Create a new GpgInfoCache instance.
+
+        :param directory: where to keep the results (created if needed).
+
+        :param max_entries: how many results to keep.
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        # The number of entries, as last counted plus those put since (other
+        # users of the directory only show up when it is counted again)
+        self.__count = None
+
+    @staticmethod
+    def keyring_fingerprint(keyrings):
+        """Return the (path, size, mtime) of each of keyrings, sorted
+
+        Missing keyrings have a size and mtime of None.
+        """
+        fingerprint = []
+        for keyring in sorted(keyrings):
+            path = os.path.abspath(keyring)
+            try:
+                st = os.stat(path)
+            except EnvironmentError:
+                fingerprint.append((path, None, None))
+                continue
+            mtime_ns = getattr(st, 'st_mtime_ns', None)
+            if mtime_ns is None:
+                mtime_ns = int(st.st_mtime * 1000000000)
+            fingerprint.append((path, st.st_size, mtime_ns))
+        return tuple(fingerprint)
+
+    def key(self, data, keyrings=None, executable=None):
+        """Return the key of the result of verifying data (bytes-like)"""
+        keyrings = keyrings or GPGV_DEFAULT_KEYRINGS
+        executable = executable or [GPGV_EXECUTABLE]
+        # marshal's format is only stable within a Python version
+        identity = (self.format_version, tuple(sys.version_info[:2]),
+                    hashlib.sha256(data).hexdigest(),
+                    self.keyring_fingerprint(keyrings),
+                    tuple([six.text_type(arg) for arg in executable]))
+        return hashlib.sha256(marshal.dumps(identity)).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.gpginfo')
+
+    def get(self, key):
+        """Return the (out, err) of gpgv stored under key, or None"""
+        path = self._path(key)
+        try:
+            f = open(path, 'rb')
+        except EnvironmentError:
+            return None
+        try:
+            try:
+                output = marshal.load(f)
+            except (EOFError, ValueError, TypeError):
+                return None
+        finally:
+            f.close()
+        self._touch(path)
+        return tuple(output)
+
+    @staticmethod
+    def _touch(path):
+        # The modification time records when an entry was last used.  It is
+        # set explicitly, as the file system's clock may be too coarse to
+        # tell entries used in quick succession apart.
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except EnvironmentError:
+            pass
+
+    def put(self, key, output):
+        """Store the (out, err) of gpgv under key"""
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, tmp = tempfile.mkstemp(dir=self.directory,
+                                       prefix='.gpginfo')
+        except EnvironmentError:
+            return
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                marshal.dump(tuple(output), f)
+            finally:
+                f.close()
+            os.rename(tmp, self._path(key))
+        except EnvironmentError:
+            try:
+                os.remove(tmp)
+            except EnvironmentError:
+                pass
+            return
+        self._touch(self._path(key))
+        if self.__count is not None:
+            self.__count += 1
+        if self.__count is None or self.__count > self.max_entries:
+            self._evict()
+
+    def __len__(self):
+        return len(self._entries())
+
+    def _entries(self):
+        try:
+            names = os.listdir(self.directory)
+        except EnvironmentError:
+            return []
+        return [name for name in names if name.endswith('.gpginfo')
+                and not name.startswith('.')]
+
+    def _evict(self):
+        """Once past max_entries, remove the least recently used entries
+
+        So that the directory is not listed again on every put, entries are
+        removed down to 90% of max_entries.
+        """
+        names = self._entries()
+        self.__count = len(names)
+        if len(names) <= self.max_entries:
+            return
+        keep = self.max_entries * 9 // 10
+        used = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+                used.append((getattr(st, 'st_mtime_ns', st.st_mtime), path))
+            except EnvironmentError:
+                # Evicted by somebody else
+                pass
+        used.sort()
+        for mtime, path in used[:len(used) - keep]:
+            try:
+                os.remove(path)
+            except EnvironmentError:
+                pass
+        self.__count = min(len(used), keep)
+
+    def clear(self):
+        """Remove all the entries"""
+        self.__count = None
+        for name in self._entries():
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except EnvironmentError:
+                pass
+
+
+if sys.version >= '3':
+    _intern = sys.intern
+else:
+    # intern() only takes byte strings on Python 2; unicode names (from
+    # text input) are shared through this table instead
+    _interned_unicode = {}
+
+    def _intern(name):
+        if isinstance(name, str):
+            return intern(name)
+        return _interned_unicode.setdefault(name, name)
+
+
+class PkgRelationOp(object):
+    """The relational operator of a versioned relation, such as >=
+
+    There is one PkgRelationOp per operator, so they can be compared with
+    "is": PkgRelationOp.LT (<<), LE (<=), EQ (=), GE (>=) and GT (>>), plus
+    the deprecated < and > (meaning <= and >=, whose name is None).
+    PkgRelationOp.get returns the one of a symbol.
+    """
+
+    __slots__ = ('symbol', 'name', '_signs')
+
+    _members = {}
+
+    def __init__(self, symbol, name=None, signs=None):
+        self.symbol = symbol
+        self.name = name
+        self._signs = signs
+
+    @classmethod
+    def get(cls, symbol):
+        """Return the PkgRelationOp of symbol
+
+        Symbols not known to Debian policy (which the parser lets through
+        all the same) get a PkgRelationOp of their own, which satisfied_by
+        refuses.
+        """
+        op = cls._members.get(symbol)
+        if op is None:
+            op = cls._members.setdefault(symbol, cls(symbol))
+        return op
+
+    def satisfied_by(self, comparison):
+        """Return whether a version comparing as comparison (negative, zero
+        or positive, as returned by debian_support.version_compare) to the
+        version of the relation satisfies it"""
+        if self._signs is None:
+            raise ValueError('unknown relational operator: %s' % self.symbol)
+        return (comparison > 0) - (comparison < 0) in self._signs
+
+    def __str__(self):
+        return self.symbol
+
+    def __repr__(self):
+        if self.name is None:
+            return 'PkgRelationOp.get(%r)' % self.symbol
+        return 'PkgRelationOp.%s' % self.name
+
+    def __reduce__(self):
+        return (_pkg_relation_op, (self.symbol,))
+
+
+def _pkg_relation_op(symbol):
+    # For unpickling, which cannot call classmethods on Python 2
+    return PkgRelationOp.get(symbol)
+
+
+for _symbol, _name, _signs in [('<<', 'LT', (-1,)), ('<=', 'LE', (-1, 0)),
+                               ('=', 'EQ', (0,)), ('>=', 'GE', (0, 1)),
+                               ('>>', 'GT', (1,)), ('<', None, (-1, 0)),
+                               ('>', None, (0, 1))]:
+    PkgRelationOp._members[_symbol] = PkgRelationOp(_symbol, _name, _signs)
+    if _name is not None:
+        setattr(PkgRelationOp, _name, PkgRelationOp._members[_symbol])
+del _symbol, _name, _signs
+
+
+class PkgRelationAtom(namedtuple('PkgRelationAtom', 'name op version arch')):
+    """A single package relation, such as "libc6 (>= 2.14)", in the compact
+    form returned by PkgRelation.parse_compact
+
+    name is the package name (interned), op the PkgRelationOp and version
+    the version string of a versioned relation (both None otherwise), and
+    arch a tuple of (polarity, architecture) pairs, or None.  Atoms are
+    immutable, and take far less memory than the dicts of parse_relations,
+    to and from which to_dict and from_dict convert them.
+    """
+
+    __slots__ = ()
+
+    def __new__(cls, name, op=None, version=None, arch=None):
+        return super(PkgRelationAtom, cls).__new__(cls, _intern(name), op,
+                                                   version, arch)
+
+    @classmethod
+    def from_dict(cls, rel):
+        """Return the atom of a dict as returned by parse_relations"""
+        op = version = arch = None
+        if rel.get('version') is not None:
+            op, version = rel['version']
+            op = PkgRelationOp.get(op)
+        if rel.get('arch') is not None:
+            arch = tuple([tuple(spec) for spec in rel['arch']])
+        return cls(rel['name'], op, version, arch)
+
+    def to_dict(self):
+        """Return the atom as a dict, as returned by parse_relations"""
+        return {'name': self.name,
+                'version': None if self.op is None
+                           else (self.op.symbol, self.version),
+                'arch': None if self.arch is None else list(self.arch)}
+
+    def __str__(self):
+        return self._format()
+
+    def _format(self):
+        s = self.name
+        if self.op is not None:
+            s += ' (%s %s)' % (self.op.symbol, self.version)
+        if self.arch is not None:
+            s += ' [%s]' % ' '.join([arch if polarity else '!' + arch
+                                     for polarity, arch in self.arch])
+        return s
+
+
+class PkgRelationCache(object):
+    """Memoized results of PkgRelation.parse_relations and parse_compact
+
+    The same relationship strings (whole fields such as "libc6 (>= 2.14)",
+    and the alternatives they are made of) come up over and over in a
+    Packages or Sources file, so they are only parsed once.  Two tables
+    are kept, of whole fields and of single relations, in the immutable
+    form of parse_compact, which parse_relations copies into new lists and
+    dicts each time, so that callers cannot corrupt the cache.  When a
+    table has max_size entries, it is emptied rather than growing further.
+    Strings that do not parse are not cached.
+
+    hits and misses count lookups of whole fields, and atom_hits and
+    atom_misses lookups of single relations (in fields that missed).
+    The cache can be used from several threads at once.
+    """
+
+    def __init__(self, max_size=1 << 16):
+        self.max_size = max_size
+        self.fields = {}
+        self.atoms = {}
+        self.__lock = threading and threading.Lock()
+        self.hits = self.misses = self.atom_hits = self.atom_misses = 0
+
+    def _count(self, hits, misses, atom_hits, atom_misses):
+        if self.__lock:
+            self.__lock.acquire()
+        try:
+            self.hits += hits
+            self.misses += misses
+            self.atom_hits += atom_hits
+            self.atom_misses += atom_misses
+        finally:
+            if self.__lock:
+                self.__lock.release()
+
+    def _store(self, table, raw, value):
+        # Replacing the tables rather than clearing them keeps lookups going
+        # on in other threads safe, without taking a lock for each of them
+        if len(table) >= self.max_size:
+            if table is self.fields:
+                table = self.fields = {}
+            else:
+                table = self.atoms = {}
+        table[raw] = value
+
+    def __len__(self):
+        return len(self.fields) + len(self.atoms)
+
+    def stats(self):
+        """Return a dict of the hit and miss counts, and of the sizes"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'atom_hits': self.atom_hits, 'atom_misses': self.atom_misses,
+                'fields': len(self.fields), 'atoms': len(self.atoms)}
+
+    def clear(self):
+        """Forget all the cached relations, and reset the counts"""
+        self.fields = {}
+        self.atoms = {}
+        self._count(-self.hits, -self.misses, -self.atom_hits,
+                    -self.atom_misses)
+
 
 class PkgRelation(object):
     """Inter-package relationships
@@ -878,53 +3138,178 @@ class PkgRelation(object):
             r'^\s*(?P<name>[a-zA-Z0-9.+\-]{2,})(\s*\(\s*(?P<relop>[>=<]+)\s*(?P<version>[0-9a-zA-Z:\-+~.]+)\s*\))?(\s*\[(?P<archs>[\s!\w\-]+)\])?\s*$')
     __comma_sep_RE = re.compile(r'\s*,\s*')
     __pipe_sep_RE = re.compile(r'\s*\|\s*')
-    __blank_sep_RE = re.compile(r'\s*')
+    __blank_sep_RE = re.compile(r'\s+')
+
+    # The PkgRelationCache used by parse_relations; None to disable caching
+    cache = PkgRelationCache()
 
     @classmethod
     def parse_relations(cls, raw):
         """Parse a package relationship string (i.e. the value of a field like
         Depends, Recommends, Build-Depends ...)
+
+        Results are memoized in PkgRelation.cache (see PkgRelationCache);
+        each call returns new lists and dicts all the same.
+        """
+        cache = cls.cache
+        if cache is None:
+            return cls._parse_relations(raw)
+        return [[{'name': name,
+                  'version': None if op is None else (op.symbol, version),
+                  'arch': None if arch is None else list(arch)}
+                 for name, op, version, arch in or_deps]
+                for or_deps in cls.parse_compact(raw)]
+
+    @classmethod
+    def parse_compact(cls, raw):
+        """Parse a package relationship string like parse_relations, into
+        a tuple (of relations to AND) of tuples (of alternatives to OR) of
+        PkgRelationAtom
+
+        These are immutable, so the results memoized in PkgRelation.cache
+        are returned as they are.
         """
-        def parse_archs(raw):
-            # assumption: no space beween '!' and architecture name
-            archs = []
-            for arch in cls.__blank_sep_RE.split(raw.strip()):
-                if len(arch) and arch[0] == '!':
-                    archs.append((False, arch[1:]))
+        cache = cls.cache
+        if cache is None:
+            return cls._parse_compact(raw, None)
+        parsed = cache.fields.get(raw)
+        if parsed is None:
+            return cls._parse_compact(raw, cache)
+        cache._count(1, 0, 0, 0)
+        return parsed
+
+    @classmethod
+    def _parse_compact(cls, raw, cache):
+        """parse_compact, looking single relations up in cache (if it is
+        not None), and adding what it parses to it"""
+        if cache is None:
+            atoms = {}
+        else:
+            atoms = cache.atoms
+        get = atoms.get
+        pipe_split = cls.__pipe_sep_RE.split
+        parsed = []
+        hits = misses = 0
+        cacheable = True
+        for or_deps in cls.__comma_sep_RE.split(raw.strip()):
+            if '|' in or_deps:
+                or_deps = pipe_split(or_deps)
+            else:
+                # Most relations have no alternatives: skip the split
+                or_deps = (or_deps,)
+            alternatives = []
+            for or_dep in or_deps:
+                atom = get(or_dep)
+                if atom is None:
+                    misses += 1
+                    atom = cls._parse_atom(or_dep)
+                    if atom is None:
+                        atom = PkgRelationAtom(
+                            cls._unparsed_rel(or_dep)['name'])
+                        cacheable = False
+                    else:
+                        atoms[or_dep] = atom
                 else:
-                    archs.append((True, arch))
-            return archs
+                    hits += 1
+                alternatives.append(atom)
+            parsed.append(tuple(alternatives))
+        parsed = tuple(parsed)
+        if cache is None:
+            return parsed
+        if len(atoms) >= cache.max_size:
+            cache.atoms = {}
+        if cacheable:
+            cache._store(cache.fields, raw, parsed)
+        cache._count(0, 1, hits, misses)
+        return parsed
 
+    @classmethod
+    def _parse_relations(cls, raw):
+        """parse_relations, without any caching"""
         def parse_rel(raw):
-            match = cls.__dep_RE.match(raw)
-            if match:
-                parts = match.groupdict()
-                d = { 'name': parts['name'] }
-                if not (parts['relop'] is None or parts['version'] is None):
-                    d['version'] = (parts['relop'], parts['version'])
-                else:
-                    d['version'] = None
-                if parts['archs'] is None:
-                    d['arch'] = None
-                else:
-                    d['arch'] = parse_archs(parts['archs'])
-                return d
-            else:
-                print('deb822.py: WARNING: cannot parse package' \
-                      ' relationship "%s", returning it raw' % raw,
-                      file=sys.stderr)
-                return { 'name': raw, 'version': None, 'arch': None }
+            d = cls._parse_rel(raw)
+            if d is None:
+                d = cls._unparsed_rel(raw)
+            return d
 
         tl_deps = cls.__comma_sep_RE.split(raw.strip()) # top-level deps
         cnf = map(cls.__pipe_sep_RE.split, tl_deps)
         return [[parse_rel(or_dep) for or_dep in or_deps] for or_deps in cnf]
 
+    @classmethod
+    def _parse_archs(cls, raw):
+        # assumption: no space beween '!' and architecture name
+        archs = []
+        for arch in cls.__blank_sep_RE.split(raw.strip()):
+            if len(arch) and arch[0] == '!':
+                archs.append((False, arch[1:]))
+            else:
+                archs.append((True, arch))
+        return archs
+
+    @classmethod
+    def _parse_rel(cls, raw):
+        """Parse a single relation, or return None if it cannot be parsed"""
+        match = cls.__dep_RE.match(raw)
+        if match:
+            parts = match.groupdict()
+            d = { 'name': parts['name'] }
+            if not (parts['relop'] is None or parts['version'] is None):
+                d['version'] = (parts['relop'], parts['version'])
+            else:
+                d['version'] = None
+            if parts['archs'] is None:
+                d['arch'] = None
+            else:
+                d['arch'] = cls._parse_archs(parts['archs'])
+            return d
+        return None
+
+    @classmethod
+    def _parse_atom(cls, raw):
+        """Parse a single relation into a PkgRelationAtom, or return None if
+        it cannot be parsed"""
+        match = cls.__dep_RE.match(raw)
+        if match is None:
+            return None
+        name, op, version, archs = match.group('name', 'relop', 'version',
+                                               'archs')
+        if op is not None and version is not None:
+            op = PkgRelationOp._members.get(op) or PkgRelationOp.get(op)
+        else:
+            op = version = None
+        if archs is not None:
+            archs = tuple(cls._parse_archs(archs))
+        # Skipping PkgRelationAtom.__new__, which is slower
+        return tuple.__new__(PkgRelationAtom,
+                             (_intern(name), op, version, archs))
+
+    @staticmethod
+    def _unparsed_rel(raw):
+        print('deb822.py: WARNING: cannot parse package' \
+              ' relationship "%s", returning it raw' % raw,
+              file=sys.stderr)
+        return { 'name': raw, 'version': None, 'arch': None }
+
+    @staticmethod
+    def to_compact(rels):
+        """Convert relationships as returned by parse_relations to the form
+        returned by parse_compact"""
+        return tuple([tuple([PkgRelationAtom.from_dict(rel) for rel in or_deps])
+                      for or_deps in rels])
+
+    @staticmethod
+    def to_dicts(rels):
+        """Convert relationships as returned by parse_compact to the form
+        returned by parse_relations"""
+        return [[atom.to_dict() for atom in or_deps] for or_deps in rels]
+
     @staticmethod
     def str(rels):
         """Format to string structured inter-package relationships
         
-        Perform the inverse operation of parse_relations, returning a string
-        suitable to be written in a package stanza.
+        Perform the inverse operation of parse_relations (or parse_compact),
+        returning a string suitable to be written in a package stanza.
         """
         def pp_arch(arch_spec):
             (excl, arch) = arch_spec
@@ -934,6 +3319,8 @@ class PkgRelation(object):
                 return '!' + arch
 
         def pp_atomic_dep(dep):
+            if isinstance(dep, PkgRelationAtom):
+                return dep._format()
             s = dep['name']
             if dep.get('version') is not None:
                 s += ' (%s %s)' % dep['version']
@@ -952,62 +3339,183 @@ class _lowercase_dict(dict):
         return dict.__getitem__(self, key.lower())
 
 
-class _PkgRelationMixin(object):
-    """Package relationship mixin
-
-    Inheriting from this mixin you can extend a Deb882 object with attributes
-    letting you access inter-package relationship in a structured way, rather
-    than as strings. For example, while you can usually use pkg['depends'] to
-    obtain the Depends string of package pkg, mixing in with this class you
-    gain pkg.depends to access Depends as a Pkgrel instance
-
-    To use, subclass _PkgRelationMixin from a class with a _relationship_fields
-    attribute. It should be a list of field names for which structured access
-    is desired; for each of them a method wild be added to the inherited class.
-    The method name will be the lowercase version of field name; '-' will be
-    mangled as '_'. The method would return relationships in the same format of
-    the PkgRelation' relations property.
+class _lazy_relations(_lowercase_dict):
+    """A _lowercase_dict of the relationship fields of a paragraph, each of
+    which is only parsed (by parse) the first time it is looked up.  Until
+    then it is only in _pending, not in the dict itself, and the methods
+    that see all the values parse every field first.
 
-    See Packages and Sources as examples.
+    Where copying a dict subclass (with dict() or dict.update) reads its
+    storage directly rather than through keys and __getitem__, as Python 2
+    does, every field is parsed right away instead.
     """
 
-    def __init__(self, *args, **kwargs):
-        self.__relations = _lowercase_dict({})
-        self.__parsed_relations = False
-        for name in self._relationship_fields:
+    __slots__ = ('_paragraph', '_parse', '_pending')
+
+    def __init__(self, paragraph, parse, empty):
+        dict.__init__(self)
+        self._paragraph = paragraph
+        self._parse = parse
+        self._pending = []
+        for name in paragraph._relationship_fields:
             # To avoid reimplementing Deb822 key lookup logic we use a really
-            # simple dict subclass which just lowercase keys upon lookup. Since
-            # dictionary building happens only here, we ensure that all keys
-            # are in fact lowercase.
+            # simple dict subclass which just lowercase keys upon lookup.
+            # Since dictionary building happens only here, we ensure that
+            # all keys are in fact lowercase.
             # With this trick we enable users to use the same key (i.e. field
             # name) of Deb822 objects on the dictionary returned by the
             # relations property.
-            keyname = name.lower()
-            if name in self:
-                self.__relations[keyname] = None   # lazy value
-                    # all lazy values will be expanded before setting
-                    # __parsed_relations to True
+            keyname = _intern(name.lower())
+            if name in paragraph:
+                self._pending.append(keyname)
             else:
-                self.__relations[keyname] = []
+                dict.__setitem__(self, keyname, empty())
+        if not _dict_copies_use_keys:
+            self._parse_all()
 
-    @property
-    def relations(self):
-        """Return a dictionary of inter-package relationships among the current
-        and other packages.
+    def __getitem__(self, key):
+        key = key.lower()
+        if key in self._pending:
+            dict.__setitem__(self, key, self._parse(self._paragraph[key]))
+            self._pending.remove(key)
+        return dict.__getitem__(self, key)
 
-        Dictionary keys depend on the package kind. Binary packages have keys
-        like 'depends', 'recommends', ... while source packages have keys like
-        'build-depends', 'build-depends-indep' and so on. See the Debian policy
-        for the comprehensive field list.
+    def _parse_all(self):
+        for key in list(self._pending):
+            self[key]
 
-        Dictionary values are package relationships returned as lists of lists
-        of dictionaries (see below for some examples).
+    def __setitem__(self, key, value):
+        if key in self._pending:
+            self._pending.remove(key)
+        dict.__setitem__(self, key, value)
 
-        The encoding of package relationships is as follows:
-        - the top-level lists corresponds to the comma-separated list of
-          Deb822, their components form a conjuction, i.e. they have to be
-          AND-ed together
-        - the inner lists corresponds to the pipe-separated list of Deb822,
+    def __delitem__(self, key):
+        if key in self._pending:
+            self._pending.remove(key)
+        else:
+            dict.__delitem__(self, key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self._pending
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._pending)
+
+    def __iter__(self):
+        # A copy, as looking up the fields while iterating adds them
+        return iter(list(dict.keys(self)) + self._pending)
+
+    if sys.version >= '3':
+        def keys(self):
+            return _KeysView(self)
+    else:
+        def keys(self):
+            return list(self)
+
+        def iterkeys(self):
+            return iter(self)
+
+        def has_key(self, key):
+            return key in self
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def __eq__(self, other):
+        self._parse_all()
+        if isinstance(other, _lazy_relations):
+            other._parse_all()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def clear(self):
+        del self._pending[:]
+        dict.clear(self)
+
+    def __reduce__(self):
+        self._parse_all()
+        return (_lowercase_dict, (dict(self),))
+
+
+def _parsing_all_relations(name):
+    method = getattr(dict, name)
+
+    def parsing_all(self, *args, **kwargs):
+        self._parse_all()
+        return method(self, *args, **kwargs)
+    parsing_all.__name__ = name
+    return parsing_all
+
+for _name in ['__repr__', 'copy', 'items', 'values', 'pop', 'popitem',
+              'setdefault', 'update', 'iteritems', 'itervalues', 'viewkeys',
+              'viewitems', 'viewvalues']:
+    if hasattr(dict, _name):
+        setattr(_lazy_relations, _name, _parsing_all_relations(_name))
+del _name
+
+
+class _KeysProbe(dict):
+    def keys(self):
+        return ['key']
+
+    def __iter__(self):
+        return iter(['key'])
+
+    def __getitem__(self, key):
+        return key
+
+# Whether dict(d) and dict.update(d) go through the keys and __getitem__ of
+# a dict subclass which overrides them, rather than its storage
+_dict_copies_use_keys = dict(_KeysProbe()) == {'key': 'key'}
+del _KeysProbe
+
+
+class _PkgRelationMixin(object):
+    """Package relationship mixin
+
+    Inheriting from this mixin you can extend a Deb882 object with attributes
+    letting you access inter-package relationship in a structured way, rather
+    than as strings. For example, while you can usually use pkg['depends'] to
+    obtain the Depends string of package pkg, mixing in with this class you
+    gain pkg.depends to access Depends as a Pkgrel instance
+
+    To use, subclass _PkgRelationMixin from a class with a _relationship_fields
+    attribute. It should be a list of field names for which structured access
+    is desired; for each of them a method wild be added to the inherited class.
+    The method name will be the lowercase version of field name; '-' will be
+    mangled as '_'. The method would return relationships in the same format of
+    the PkgRelation' relations property.
+
+    See Packages and Sources as examples.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # Built on first use, each field being parsed only when looked up
+        self.__relations = None
+        self.__compact_relations = None
+
+    @property
+    def relations(self):
+        """Return a dictionary of inter-package relationships among the current
+        and other packages.
+
+        Dictionary keys depend on the package kind. Binary packages have keys
+        like 'depends', 'recommends', ... while source packages have keys like
+        'build-depends', 'build-depends-indep' and so on. See the Debian policy
+        for the comprehensive field list.
+
+        Dictionary values are package relationships returned as lists of lists
+        of dictionaries (see below for some examples).
+
+        The encoding of package relationships is as follows:
+        - the top-level lists corresponds to the comma-separated list of
+          Deb822, their components form a conjuction, i.e. they have to be
+          AND-ed together
+        - the inner lists corresponds to the pipe-separated list of Deb822,
           their components form a disjunction, i.e. they have to be OR-ed
           together
         - member of the inner lists are dictionaries with the following keys:
@@ -1032,15 +3540,132 @@ class _PkgRelationMixin(object):
           "tcl8.4-dev, procps [!hurd-i386]"                 becomes
           [ [ {'name': 'tcl8.4-dev'} ],
             [ {'name': 'procps', 'arch': (false, 'hurd-i386')} ] ]
+
+        Each field is parsed the first time it is looked up.
         """
-        if not self.__parsed_relations:
-            lazy_rels = filter(lambda n: self.__relations[n] is None,
-                    self.__relations.keys())
-            for n in lazy_rels:
-                self.__relations[n] = PkgRelation.parse_relations(self[n])
-            self.__parsed_relations = True
+        if self.__relations is None:
+            self.__relations = _lazy_relations(
+                self, PkgRelation.parse_relations, list)
         return self.__relations
 
+    @property
+    def compact_relations(self):
+        """Return the inter-package relationships like relations, but as
+        returned by PkgRelation.parse_compact: tuples of tuples of
+        PkgRelationAtom, shared with PkgRelation.cache and other paragraphs
+        (with an empty tuple for fields the paragraph does not have).
+
+          "emacs | emacsen, make (>= 3.81)"                 becomes
+          ( ( PkgRelationAtom('emacs', None, None, None),
+              PkgRelationAtom('emacsen', None, None, None) ),
+            ( PkgRelationAtom('make', PkgRelationOp.GE, '3.81', None), ) )
+        """
+        if self.__compact_relations is None:
+            self.__compact_relations = _lazy_relations(
+                self, PkgRelation.parse_compact, tuple)
+        return self.__compact_relations
+
+
+class _MultivaluedRow(_mutable_mapping_mixin, object):
+    """A row of a multivalued field, such as one file of Files
+
+    Rows keep a tuple of their values; the names of the values come from a
+    _FieldLayout shared by all the rows of the same class (one class per
+    list of names, see _multivalued_row_class).  Lookups are
+    case-insensitive, and rows compare equal to dicts with the same items,
+    like the Deb822Dict objects they stand for.  The first change to a row
+    copies it into a Deb822Dict of its own, which it uses from then on.
+    """
+
+    __slots__ = ('_values', '_dict')
+
+    _layout = None
+
+    def __init__(self, values):
+        self._values = values
+        self._dict = None
+
+    def _writable(self):
+        """Return the Deb822Dict holding the row, making it if needed"""
+        if self._dict is None:
+            self._dict = Deb822Dict(zip(self._layout.names, self._values))
+            self._values = None
+        return self._dict
+
+    def __getitem__(self, key):
+        if self._dict is not None:
+            return self._dict[key]
+        positions = self._layout.positions
+        try:
+            return self._values[positions[key]]
+        except KeyError:
+            try:
+                return self._values[positions[key.lower()]]
+            except (AttributeError, KeyError):
+                raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self._writable()[key] = value
+
+    def __delitem__(self, key):
+        del self._writable()[key]
+
+    def __iter__(self):
+        if self._dict is not None:
+            return iter(self._dict)
+        return iter(self._layout.names)
+
+    def __len__(self):
+        if self._dict is not None:
+            return len(self._dict)
+        return len(self._values)
+
+    def __contains__(self, key):
+        if self._dict is not None:
+            return key in self._dict
+        positions = self._layout.positions
+        try:
+            return key in positions or key.lower() in positions
+        except AttributeError:
+            return False
+
+    if sys.version < '3':
+        has_key = __contains__
+
+        def keys(self):
+            return list(self)
+
+    def __reduce__(self):
+        if self._dict is not None:
+            return (Deb822Dict, (self._dict,))
+        return (_multivalued_row, (self._layout.names, self._values))
+
+    __repr__ = six.get_unbound_function(Deb822Dict.__repr__)
+    __eq__ = six.get_unbound_function(Deb822Dict.__eq__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+
+_multivalued_row_classes = {}
+
+
+def _multivalued_row_class(names):
+    """Return the _MultivaluedRow subclass for the tuple of names"""
+    try:
+        return _multivalued_row_classes[names]
+    except KeyError:
+        cls = type('_MultivaluedRow', (_MultivaluedRow,),
+                   {'__slots__': (), '_layout': _FieldLayout(names)})
+        return _multivalued_row_classes.setdefault(names, cls)
+
+
+def _multivalued_row(names, values):
+    """Return a row with the given names and values (for unpickling)"""
+    return _multivalued_row_class(names)(values)
+
 
 class _multivalued(Deb822):
     """A class with (R/W) support for multivalued fields.
@@ -1049,26 +3674,72 @@ class _multivalued(Deb822):
     be a dictionary with *lower-case* keys, with lists of human-readable
     identifiers of the fields as the values.  Please see Dsc, Changes, and
     PdiffIndex as examples.
+
+    Multivalued fields are only split into rows the first time they are
+    looked up; until then, get_as_string (and so dump) gives back their
+    original text.  Each row is a mapping of the names above to the values
+    of one line, which can be changed in place or replaced with a dict.
     """
 
+    # The multivalued fields (in lowercase) not split into rows yet
+    __unexpanded = frozenset()
+
     def __init__(self, *args, **kwargs):
         Deb822.__init__(self, *args, **kwargs)
 
-        for field, fields in self._multivalued_fields.items():
-            try:
-                contents = self[field]
-            except KeyError:
-                continue
+        unexpanded = set()
+        for field in self._multivalued_fields:
+            if field in self:
+                unexpanded.add(field)
+        if unexpanded:
+            self.__unexpanded = unexpanded
 
-            if self.is_multi_line(contents):
-                self[field] = []
-                updater_method = self[field].append
-            else:
-                self[field] = Deb822Dict()
-                updater_method = self[field].update
+    def __getitem__(self, key):
+        if self.__unexpanded:
+            key = _strI(key)
+            if key in self.__unexpanded:
+                return self.__expand(key)
+        return Deb822.__getitem__(self, key)
 
-            for line in filter(None, contents.splitlines()):
-                updater_method(Deb822Dict(zip(fields, line.split())))
+    def __setitem__(self, key, value):
+        if self.__unexpanded:
+            self.__unexpanded.discard(_strI(key))
+        Deb822.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        if self.__unexpanded:
+            self.__unexpanded.discard(_strI(key))
+        Deb822.__delitem__(self, key)
+
+    def __expand(self, key):
+        """Split the value of the multivalued field key into rows"""
+        self.__unexpanded.discard(key)
+        contents = Deb822.__getitem__(self, key)
+        if not isinstance(contents, six.string_types):
+            # Set to rows already, e.g. through the constructor
+            return contents
+
+        fields = tuple(self._multivalued_fields[key.lower()])
+        row_class = _multivalued_row_class(fields)
+        rows = []
+        for line in filter(None, contents.splitlines()):
+            values = tuple(line.split())
+            if len(values) == len(fields):
+                rows.append(row_class(values))
+            else:
+                # Missing values are left out (and extra ones dropped), as
+                # zip does
+                n = min(len(values), len(fields))
+                rows.append(_multivalued_row_class(fields[:n])(values[:n]))
+
+        if self.is_multi_line(contents):
+            value = rows
+        elif rows:
+            value = rows[-1]
+        else:
+            value = Deb822Dict()
+        Deb822Dict.__setitem__(self, key, value)
+        return value
 
     def validate_input(self, key, value):
         if key.lower() in self._multivalued_fields:
@@ -1082,6 +3753,11 @@ class _multivalued(Deb822):
 
     def get_as_string(self, key):
         keyl = key.lower()
+        if keyl in self.__unexpanded and \
+                getattr(type(self), '_fixed_field_lengths', None) is None:
+            # Still the original text (field lengths depend on settings
+            # that may have changed since it was parsed, though)
+            return Deb822.__getitem__(self, key)
         if keyl in self._multivalued_fields:
             fd = StringIO()
             if hasattr(self[key], 'keys'): # single-line
@@ -1114,6 +3790,58 @@ class _multivalued(Deb822):
             return Deb822.get_as_string(self, key)
 
 
+_SIGNED_MESSAGE = b'-----BEGIN PGP SIGNED MESSAGE-----\n'
+_SIGNATURE_START = b'\n-----BEGIN PGP SIGNATURE-----\n'
+_SIGNATURE_END = b'\n-----END PGP SIGNATURE-----'
+
+
+def _split_signed(buf):
+    """Find the parts of a clearsigned message, without copying any of it
+
+    Returns the (armor start, payload start, payload end, signature start,
+    signature end) offsets into buf, a bytes object, or None if it is not
+    a plain clearsigned message whose payload is a single paragraph, in
+    which case split_gpg_and_payload has to deal with it line by line.
+    """
+    start = len(buf) - len(buf.lstrip(b'\n'))
+    if not buf.startswith(_SIGNED_MESSAGE, start) or buf.find(b'\r') >= 0:
+        return None
+    payload_start = buf.find(b'\n\n', start)
+    if payload_start < 0:
+        return None
+    payload_start += 2
+    signature = buf.find(_SIGNATURE_START, payload_start - 1)
+    if signature < 0:
+        return None
+    signature_end = buf.find(_SIGNATURE_END, signature)
+    if signature_end < 0:
+        return None
+    signature_end += len(_SIGNATURE_END)
+
+    while buf.startswith(b'\n', payload_start):
+        payload_start += 1
+    payload_end = signature
+    while payload_end > payload_start and \
+            buf.startswith(b'\n', payload_end - 1):
+        payload_end -= 1
+    if payload_end <= payload_start:
+        return None
+    # Blank lines and comments in the payload, and armor lines that are not
+    # where they are expected, are left to split_gpg_and_payload
+    for marker in (b'\n\n', b'\n#', b'\n-----'):
+        if buf.find(marker, payload_start, payload_end) >= 0:
+            return None
+    if buf.startswith(b'#', payload_start) or \
+            buf.startswith(b'-----', payload_start):
+        return None
+    return start, payload_start, payload_end, signature + 1, signature_end
+
+
+# The payload of a clearsigned message, buffer[start:end], as found by
+# _split_signed
+_SignedPayload = namedtuple('_SignedPayload', 'buffer start end')
+
+
 class _gpg_multivalued(_multivalued):
     """A _multivalued class that can support gpg signed objects
 
@@ -1133,14 +3861,33 @@ class _gpg_multivalued(_multivalued):
             sequence = kwargs.get("sequence", None)
 
         if sequence is not None:
-            if isinstance(sequence, bytes):
-                self.raw_text = sequence
-            elif isinstance(sequence, six.string_types):
-                # If the file is really in some other encoding, then this
-                # probably won't verify correctly, but this is the best we
-                # can reasonably manage.  For accurate verification, the
-                # file should be opened in binary mode.
-                self.raw_text = sequence.encode('utf-8')
+            sequence = _uncompressed(sequence)
+            try:
+                args = list(args)
+                args[0] = sequence
+            except IndexError:
+                kwargs["sequence"] = sequence
+            if isinstance(sequence, (bytes,) + six.string_types):
+                if isinstance(sequence, bytes):
+                    self.raw_text = sequence
+                else:
+                    # If the file is really in some other encoding, then
+                    # this probably won't verify correctly, but this is the
+                    # best we can reasonably manage.  For accurate
+                    # verification, the file should be opened in binary
+                    # mode.
+                    self.raw_text = sequence.encode('utf-8')
+                offsets = _split_signed(self.raw_text)
+                if offsets is not None:
+                    # Parse the payload straight out of the signed text
+                    self._signed_offsets = offsets
+                    payload = _SignedPayload(self.raw_text, offsets[1],
+                                             offsets[2])
+                    try:
+                        args = list(args)
+                        args[0] = payload
+                    except IndexError:
+                        kwargs["sequence"] = payload
             elif hasattr(sequence, "items"):
                 # sequence is actually a dict(-like) object, so we don't have
                 # the raw text.
@@ -1168,6 +3915,36 @@ class _gpg_multivalued(_multivalued):
 
         _multivalued.__init__(self, *args, **kwargs)
 
+    def _internal_parser(self, sequence, fields=None):
+        if isinstance(sequence, _SignedPayload):
+            # The values are cut out of raw_text itself when looked up
+            if fields is not None:
+                fields = frozenset(fields)
+            spans = _scan_fields(sequence.buffer, fields, spans=True,
+                                 pos=sequence.start, endpos=sequence.end)
+            if spans:
+                self._add_parsed(_BlobParagraph(sequence.buffer, spans))
+        else:
+            _multivalued._internal_parser(self, sequence, fields)
+
+    def get_signed_parts(self):
+        """Return the (armor header, payload, signature) of the raw text
+
+        Each part is a memoryview of raw_text, so nothing is copied: the
+        armor header runs from '-----BEGIN PGP SIGNED MESSAGE-----' to the
+        blank line after it, and the signature from '-----BEGIN PGP
+        SIGNATURE-----' to '-----END PGP SIGNATURE-----'.  Returns None if
+        the parts are not known, i.e. if the object was not made from a
+        plain clearsigned message given as a string.
+        """
+        offsets = getattr(self, '_signed_offsets', None)
+        if offsets is None:
+            return None
+        start, payload_start, payload_end, signature, signature_end = offsets
+        view = memoryview(self.raw_text)
+        return (view[start:payload_start], view[payload_start:payload_end],
+                view[signature:signature_end])
+
 
 class Dsc(_gpg_multivalued):
     _multivalued_fields = {
@@ -1297,6 +4074,1255 @@ class Packages(Deb822, _PkgRelationMixin):
         _PkgRelationMixin.__init__(self, *args, **kwargs)
 
 
+class CompactDeb822(_mapping_mixin, object):
+    """A read-only paragraph, taking much less memory than a Deb822
+
+    Field names are kept in a _FieldLayout shared by all paragraphs with the
+    same fields (as is usual for Packages and Sources files), so a
+    paragraph only holds a reference to its layout, a tuple of values and
+    its encoding.  Values are decoded when they are looked up, as for
+    paragraphs yielded by Deb822.iter_paragraphs.
+
+    Lookups are case-insensitive, and iteration gives the fields in their
+    original order and spelling, just like Deb822.  The paragraph cannot be
+    changed; make a Deb822 out of it (Deb822(compact)) to edit it.
+    """
+
+    __slots__ = ('_layout', '_values', 'encoding')
+
+    def __init__(self, _dict=None, encoding="utf-8"):
+        """Create a new CompactDeb822 instance.
+
+        :param _dict: a mapping, or a sequence of (key, value) pairs.  Values
+            are checked with Deb822.validate_input.
+        :param encoding: decode bytes values with this encoding.
+        """
+        if _dict is None:
+            items = []
+        elif hasattr(_dict, 'items'):
+            items = list(_dict.items())
+        else:
+            items = list(_dict)
+        for key, value in items:
+            self.validate_input(key, value)
+        self._set_items(items, encoding)
+
+    @classmethod
+    def from_items(cls, items, encoding="utf-8"):
+        """Return a new CompactDeb822 with the given (key, value) pairs
+
+        Unlike the constructor, this does not validate the values, which
+        must therefore already be in the form a parser would give them.
+        """
+        paragraph = cls.__new__(cls)
+        paragraph._set_items(items, encoding)
+        return paragraph
+
+    @classmethod
+    def _from_triples(cls, triples, encoding):
+        """Return a new CompactDeb822 out of (key, lowercase key, value)"""
+        paragraph = cls.__new__(cls)
+        layout = _layouts.layout(tuple([key for key, lower, value
+                                        in triples]))
+        values = tuple([value for key, lower, value in triples])
+        if layout.select is not None:
+            values = tuple([values[i] for i in layout.select])
+        paragraph._layout = layout
+        paragraph._values = values
+        paragraph.encoding = encoding
+        return paragraph
+
+    def _set_items(self, items, encoding):
+        layout = _layouts.layout(tuple([key for key, value in items]))
+        values = tuple([value for key, value in items])
+        if layout.select is not None:
+            values = tuple([values[i] for i in layout.select])
+        self._layout = layout
+        self._values = values
+        self.encoding = encoding
+
+    def __getstate__(self):
+        return (self._layout.names, self._values, self.encoding)
+
+    def __setstate__(self, state):
+        names, values, self.encoding = state
+        self._layout = _layouts.layout(names)
+        self._values = values
+
+    def _position(self, key):
+        positions = self._layout.positions
+        try:
+            return positions[key]
+        except KeyError:
+            try:
+                return positions[key.lower()]
+            except (AttributeError, KeyError):
+                raise KeyError(key)
+
+    def __getitem__(self, key):
+        return self._detect_encoding(self._values[self._position(key)])
+
+    def __iter__(self):
+        return iter(self._layout.names)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, key):
+        try:
+            self._position(key)
+        except KeyError:
+            return False
+        return True
+
+    if sys.version < '3':
+        has_key = __contains__
+
+        def keys(self):
+            return list(self._layout.names)
+
+    _detect_encoding = six.get_unbound_function(Deb822Dict._detect_encoding)
+    validate_input = six.get_unbound_function(Deb822.validate_input)
+    get_as_string = six.get_unbound_function(Deb822.get_as_string)
+    dump = six.get_unbound_function(Deb822.dump)
+    __repr__ = six.get_unbound_function(Deb822Dict.__repr__)
+    __eq__ = six.get_unbound_function(Deb822Dict.__eq__)
+    __str__ = dump
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+
+class Deb822Index(_mapping_mixin, object):
+    """Random access to the paragraphs of a file, by the value of a field
+
+    The file is scanned once when the index is created, recording the offset
+    and length of each paragraph under the value of the indexed field
+    (Package, by default).  Looking up a value then only parses the matching
+    paragraph, read from a memory map of the file, rather than the whole
+    file.
+
+    Several paragraphs may have the same value (e.g. several versions of a
+    package in a Packages file): index[value] returns the first of them, and
+    index.get_all(value) all of them, in the order they appear in the file.
+    Paragraphs without the indexed field are not reachable through the
+    index.
+
+    Example:
+
+        with Deb822Index('Packages', cls=Packages) as index:
+            print(index['python-debian']['Version'])
+    """
+
+    def __init__(self, f, cls=None, field='Package', fields=None,
+                 encoding="utf-8", cache=None):
+        """Create a new Deb822Index instance.
+
+        :param f: a file name, or a real file object opened in binary mode.
+            The file must not be compressed.
+
+        :param cls: the class of the paragraphs returned (Deb822 if None),
+            e.g. Packages or Sources.
+
+        :param field: the field whose value the paragraphs are indexed by.
+
+        :param fields: if given, only these fields are parsed in the returned
+            paragraphs (see Deb822.iter_paragraphs).
+
+        :param encoding: interpret the file in this encoding.
+
+        :param cache: a Deb822Cache to keep the offsets of the paragraphs in,
+            so that they need not be found again while the file is unchanged.
+        """
+        self.cls = cls or Deb822
+        self.field = field
+        self.fields = fields
+        self.encoding = encoding
+
+        if isinstance(f, six.string_types):
+            self.__file = open(f, 'rb')
+            self.__own_file = True
+        else:
+            self.__file = f
+            self.__own_file = False
+        self.__map = None
+        self.__values = []
+        self.__locations = {}
+        # Don't leave the map (or the file, if opened here) behind if
+        # indexing fails
+        try:
+            self.__index(f, cache)
+        except:
+            self.close()
+            raise
+
+    def __index(self, f, cache):
+        """Map the file, and find the paragraphs (or get them from cache)"""
+        try:
+            self.__map = mmap.mmap(self.__file.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return
+        if _compression_of(self.__map[:6]):
+            raise ValueError("compressed files cannot be indexed")
+
+        if isinstance(f, six.string_types):
+            path = f
+        else:
+            path = _file_path(f)
+        if cache is not None and path:
+            kind = 'index-%s-%s' % (self.field.lower(), self.encoding)
+            payload = cache.load(path, kind, lambda path: self.__build())
+        else:
+            payload = self.__build()
+        for value, locations in payload:
+            self.__values.append(value)
+            self.__locations[value] = [(locations[i], locations[i + 1])
+                                       for i in range(0, len(locations), 2)]
+
+    def __build(self):
+        """Return a list of (value, (offset, length, offset, ...)) tuples"""
+        wanted = _CaseInsensitiveFields([self.field])
+        keys = {}
+        values = []
+        locations = {}
+        splitter = _ParagraphSplitter()
+        blocks = splitter.feed(self.__map) + splitter.close()
+        for start, end, data, signed in blocks:
+            triples = _scan_fields(data, wanted, keys, 1)
+            if not triples:
+                continue
+            value = self.__decode(triples[-1][2])
+            try:
+                locations[value].extend((start, end - start))
+            except KeyError:
+                locations[value] = [start, end - start]
+                values.append(value)
+        return [(value, tuple(locations[value])) for value in values]
+
+    def __decode(self, value):
+        if not isinstance(value, bytes) or sys.version < '3':
+            return value
+        try:
+            return value.decode(self.encoding)
+        except UnicodeDecodeError:
+            return Deb822Dict(encoding=self.encoding)._detect_encoding(value)
+
+    def __parse(self, offset, length):
+        raw = self.__map[offset:offset + length]
+        for paragraph in self.cls._iter_native_paragraphs(raw, self.fields,
+                                                          self.encoding):
+            return paragraph
+
+    def __iter__(self):
+        return iter(self.__values)
+
+    def __len__(self):
+        return len(self.__values)
+
+    def __contains__(self, value):
+        return value in self.__locations
+
+    def __getitem__(self, value):
+        offset, length = self.__locations[value][0]
+        return self.__parse(offset, length)
+
+    def locate(self, value):
+        """Return a list of (offset, length) pairs of paragraphs with value
+
+        Raises KeyError if no paragraph has the value.
+        """
+        return list(self.__locations[value])
+
+    def get_all(self, value):
+        """Return a list of all paragraphs with value, possibly empty"""
+        return [self.__parse(offset, length)
+                for offset, length in self.__locations.get(value, [])]
+
+    def close(self):
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+        if self.__own_file:
+            self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+
+def _build_paragraphs_payload(path):
+    """Parse the file at path into the form Deb822Cache keeps it in
+
+    That is a (names, rows) tuple, where names is a list of the distinct
+    field names, and each row is a tuple (signed, name index, raw value, name
+    index, raw value, ...) for one paragraph.
+    """
+    names = []
+    numbers = {}
+    keys = {}
+    rows = []
+    with open(path, 'rb') as f:
+        for start, end, block, signed in _iter_blocks(f):
+            row = [signed]
+            for name, lower, value in _scan_fields(block, None, keys):
+                try:
+                    number = numbers[name]
+                except KeyError:
+                    number = numbers[name] = len(names)
+                    names.append(name)
+                row.append(number)
+                row.append(value)
+            if len(row) > 1:
+                rows.append(tuple(row))
+    return names, rows
+
+
+class Deb822Cache(object):
+    """A persistent cache of parsed Packages, Sources, etc. files
+
+    Each file gets its own binary sidecar file, which records the identity
+    of the file it was made from (its path, size, modification time and
+    inode number, and optionally a hash of its contents) along with the
+    parsed data.  When the file changes, the sidecar no longer matches and
+    is rebuilt the next time it is needed.
+
+    Sidecars are written to a temporary file and renamed into place, so
+    readers never see partial data, and rebuilding one is done while holding
+    a lock, so that concurrent processes don't all do the same work.  A
+    sidecar that cannot be written is silently not cached.
+
+    Use it by passing it as the cache argument of Deb822.iter_paragraphs (or
+    Packages.iter_paragraphs, etc.), or of Deb822Index:
+
+        cache = Deb822Cache('/var/cache/myapp')
+        with open('/var/lib/apt/lists/..._Packages', 'rb') as f:
+            for pkg in Packages.iter_paragraphs(f, cache=cache):
+                ...
+    """
+
+    format_version = 1
+
+    def __init__(self, directory=None, verify_content=False):
+        """Create a new Deb822Cache instance.
+
+        :param directory: where to keep the sidecar files (created if
+            needed).  If None, a directory of the user's own is used:
+            python-debian in $XDG_CACHE_HOME, or else in ~/.cache.
+
+        :param verify_content: if True, also check a SHA-256 hash of the
+            whole file before using a sidecar, rather than trusting the size
+            and modification time alone.
+        """
+        if directory is None:
+            directory = self.default_directory()
+        self.directory = directory
+        self.verify_content = verify_content
+
+    @staticmethod
+    def default_directory():
+        """Return the per-user directory sidecars go to by default"""
+        base = os.environ.get('XDG_CACHE_HOME')
+        if not base or not os.path.isabs(base):
+            base = os.path.join(os.path.expanduser('~'), '.cache')
+        return os.path.join(base, 'python-debian')
+
+    def sidecar(self, path, kind):
+        """Return the name of the sidecar file for data of kind about path"""
+        path = os.path.abspath(path)
+        if isinstance(path, six.text_type):
+            path = path.encode('utf-8')
+        return os.path.join(self.directory, '%s.%s.deb822cache'
+                            % (hashlib.sha1(path).hexdigest(), kind))
+
+    def _header(self, path, kind):
+        st = os.stat(path)
+        mtime_ns = getattr(st, 'st_mtime_ns', None)
+        if mtime_ns is None:
+            mtime_ns = int(st.st_mtime * 1000000000)
+        content_hash = None
+        if self.verify_content:
+            sha256 = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(_NATIVE_CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+            content_hash = sha256.hexdigest()
+        # marshal's format is only stable within a Python version
+        return (self.format_version, tuple(sys.version_info[:2]), kind,
+                os.path.abspath(path), st.st_size, mtime_ns, st.st_ino,
+                content_hash)
+
+    def load(self, path, kind, build):
+        """Return the data of the given kind about the file at path
+
+        If the sidecar is missing or out of date, build(path) is called to
+        make the data, which is then stored.  It must only contain types
+        supported by the marshal module.
+        """
+        header = self._header(path, kind)
+        sidecar = self.sidecar(path, kind)
+        payload = self._read(sidecar, header)
+        if payload is not None:
+            return payload
+
+        lock = self._lock(sidecar)
+        try:
+            # Somebody else may have rebuilt it while we waited for the lock
+            payload = self._read(sidecar, header)
+            if payload is None:
+                payload = build(path)
+                # Don't store anything if the file changed as we read it
+                if self._header(path, kind) == header:
+                    self._write(sidecar, header, payload)
+        finally:
+            if lock is not None:
+                self._unlock(lock)
+        return payload
+
+    def _read(self, sidecar, header):
+        try:
+            f = open(sidecar, 'rb')
+        except EnvironmentError:
+            return None
+        try:
+            try:
+                if marshal.load(f) != header:
+                    return None
+                return marshal.load(f)
+            except (EOFError, ValueError, TypeError):
+                return None
+        finally:
+            f.close()
+
+    def _write(self, sidecar, header, payload):
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(sidecar),
+                                       prefix='.deb822cache')
+        except EnvironmentError:
+            return
+        try:
+            f = os.fdopen(fd, 'wb')
+            try:
+                marshal.dump(header, f)
+                marshal.dump(payload, f)
+            finally:
+                f.close()
+            os.rename(tmp, sidecar)
+        except EnvironmentError:
+            try:
+                os.remove(tmp)
+            except EnvironmentError:
+                pass
+
+    def _lock(self, sidecar):
+        """Return a lock file held exclusively for sidecar, or None
+
+        The lock file is removed by _unlock, so a process that gets hold of
+        it after that (having opened it before) tries again with a new one.
+        """
+        if fcntl is None:
+            return None
+        path = sidecar + '.lock'
+        while True:
+            try:
+                if not os.path.isdir(self.directory):
+                    os.makedirs(self.directory)
+                lock = open(path, 'ab')
+            except EnvironmentError:
+                return None
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                st = os.stat(path)
+            except EnvironmentError:
+                st = None
+            held = os.fstat(lock.fileno())
+            if st is not None and (st.st_dev, st.st_ino) == \
+                    (held.st_dev, held.st_ino):
+                return lock
+            lock.close()
+
+    @staticmethod
+    def _unlock(lock):
+        """Remove and release a lock file returned by _lock"""
+        try:
+            os.remove(lock.name)
+        except EnvironmentError:
+            pass
+        lock.close()
+
+
+if hasattr(hashlib, 'blake2b'):
+    def _fingerprint(data):
+        return hashlib.blake2b(data, digest_size=16).digest()
+else:
+    def _fingerprint(data):
+        return hashlib.md5(data).digest()
+
+
+class Deb822Delta(namedtuple('Deb822Delta', 'added removed changed')):
+    """The difference between two loads of a Deb822Reloader
+
+    added and removed are lists of paragraphs, and changed a list of (old,
+    new) pairs of paragraphs with the same key but different contents.
+    """
+
+    __slots__ = ()
+
+
+class Deb822Reloader(object):
+    """Load a file again and again, only parsing the paragraphs that changed
+
+    Each raw paragraph is fingerprinted with a fast hash; paragraphs whose
+    fingerprint was already seen in the previous load are not parsed again,
+    but the object built for them then is reused.  This makes reloading a
+    Packages file after an update, when most paragraphs are unchanged, much
+    cheaper than parsing it from scratch.
+
+    Each load returns a Deb822Delta of the paragraphs added, removed and
+    changed since the previous load (everything is added by the first one).
+    A paragraph is changed, rather than removed and added, if its key (the
+    values of the key fields, by default Package and Architecture) was in
+    the previous load.
+
+    Since paragraph objects are reused, changes made to them persist
+    across loads.
+
+    Example:
+
+        reloader = Deb822Reloader(cls=Packages)
+        with open('Packages', 'rb') as f:
+            reloader.load(f)
+        ...
+        with open('Packages', 'rb') as f:
+            added, removed, changed = reloader.load(f)
+        print(len(reloader.paragraphs))
+    """
+
+    def __init__(self, cls=None, key=('Package', 'Architecture'),
+                 fields=None, encoding="utf-8"):
+        """Create a new Deb822Reloader instance.
+
+        :param cls: the class of the paragraphs (Deb822 if None).
+
+        :param key: the names of the fields identifying a paragraph.
+
+        :param fields: if given, only these fields are parsed (see
+            Deb822.iter_paragraphs).  They should include the key fields.
+
+        :param encoding: interpret the input in this encoding.
+        """
+        self.cls = cls or Deb822
+        self.key = tuple(key)
+        if fields is not None:
+            fields = frozenset(fields)
+        self.fields = fields
+        self.encoding = encoding
+        # The paragraphs of the last load, in order
+        self.paragraphs = []
+        # (fingerprint, occurrence) -> (paragraph, key, position)
+        self.__entries = {}
+
+    def _key(self, paragraph):
+        return tuple([paragraph.get(field) for field in self.key])
+
+    def load(self, sequence):
+        """Load the paragraphs in sequence, and return a Deb822Delta
+
+        sequence is read like by Deb822.iter_paragraphs (without apt_pkg).
+        If reading or parsing it fails, the previous load is kept as it was.
+        """
+        # Entries are taken out of a copy, so that the table is untouched
+        # until the whole load has succeeded
+        old = dict(self.__entries)
+        entries = {}
+        paragraphs = []
+        added = []
+        seen = {}
+        keys = {}
+        wanted = _count_fields(self.fields)
+        for block in _iter_blocks(sequence):
+            data = block[2]
+            if isinstance(data, six.text_type):
+                fingerprint = _fingerprint(data.encode('utf-8'))
+            else:
+                fingerprint = _fingerprint(data)
+            occurrence = seen.get(fingerprint, 0)
+            seen[fingerprint] = occurrence + 1
+            entry = old.pop((fingerprint, occurrence), None)
+            if entry is None:
+                paragraph = self.cls._from_block(
+                    block, self.fields, keys, self.encoding, wanted)
+                if paragraph is None:
+                    continue
+                key = self._key(paragraph)
+                added.append((paragraph, key))
+            else:
+                paragraph, key, _ = entry
+            entries[(fingerprint, occurrence)] = (paragraph, key,
+                                                  len(paragraphs))
+            paragraphs.append(paragraph)
+
+        # Whatever is left of the previous load is gone, or was changed
+        removed = {}
+        order = []
+        for paragraph, key, _ in sorted(six.itervalues(old),
+                                        key=lambda entry: entry[2]):
+            removed.setdefault(key, deque()).append(paragraph)
+            order.append(paragraph)
+        delta = Deb822Delta([], [], [])
+        for paragraph, key in added:
+            previous = removed.get(key)
+            if previous:
+                delta.changed.append((previous.popleft(), paragraph))
+            else:
+                delta.added.append(paragraph)
+        changed = set([id(previous) for previous, _ in delta.changed])
+        delta.removed.extend([paragraph for paragraph in order
+                              if id(paragraph) not in changed])
+
+        self.__entries = entries
+        self.paragraphs = paragraphs
+        return delta
+
+
+class _WriterOutput(object):
+    """One of the files written by a Deb822Writer
+
+    Data is compressed (if needed), checksummed and written to a temporary
+    file by a thread of its own when threads are available, fed through a
+    bounded queue; commit renames the temporary file to path.
+    """
+
+    # The checksums listed in Release files, and their hashlib names
+    checksums = [('MD5Sum', 'md5'), ('SHA1', 'sha1'), ('SHA256', 'sha256')]
+
+    def __init__(self, path, kind, threads=True, depth=4):
+        self.path = path
+        self.kind = kind
+        self.size = 0
+        self.hashes = [hashlib.new(name) for _, name in self.checksums]
+        self.error = None
+        if kind:
+            self.compressor = _new_compressor(kind)
+        else:
+            self.compressor = None
+        self.__temp = path + '.new'
+        self.__file = open(self.__temp, 'wb')
+        if threads and threading is not None:
+            self.__queue = Queue(depth)
+            self.__thread = threading.Thread(target=self.__run)
+            self.__thread.daemon = True
+            self.__thread.start()
+        else:
+            self.__thread = None
+
+    def __output(self, data):
+        if data:
+            for h in self.hashes:
+                h.update(data)
+            self.size += len(data)
+            self.__file.write(data)
+
+    def __write(self, data):
+        if self.error is not None:
+            return
+        try:
+            if self.compressor is not None:
+                data = self.compressor.compress(data)
+            self.__output(data)
+        except Exception:
+            self.error = sys.exc_info()[1]
+
+    def __run(self):
+        while True:
+            data = self.__queue.get()
+            if data is None:
+                break
+            # After an error, keep emptying the queue so that write never
+            # blocks
+            self.__write(data)
+
+    def write(self, data):
+        if self.__thread is None:
+            self.__write(data)
+        else:
+            self.__queue.put(data)
+
+    def finish(self):
+        """Finish writing the temporary file
+
+        Errors met while writing are raised here.
+        """
+        if self.__thread is not None:
+            self.__queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+        if self.error is None:
+            try:
+                if self.compressor is not None:
+                    self.__output(self.compressor.flush())
+                self.__file.close()
+            except Exception:
+                self.error = sys.exc_info()[1]
+        if self.error is not None:
+            raise self.error
+
+    def commit(self):
+        """Rename the temporary file to path"""
+        os.rename(self.__temp, self.path)
+
+    def discard(self):
+        """Stop writing, and remove the temporary file"""
+        if self.__thread is not None:
+            self.error = self.error or ValueError("discarded")
+            self.__queue.put(None)
+            self.__thread.join()
+            self.__thread = None
+        self.__file.close()
+        if os.path.exists(self.__temp):
+            os.unlink(self.__temp)
+
+    def hexdigests(self):
+        """Return a dict of the hex digests of the file, by Release field"""
+        return dict([(field, h.hexdigest()) for (field, _), h in
+                     zip(self.checksums, self.hashes)])
+
+
+class Deb822Writer(object):
+    """Write many paragraphs to a file, and to compressed copies of it
+
+    Paragraphs are formatted as by Deb822.dump, and separated by blank
+    lines.  Their encoded text is gathered in large buffers, which are
+    handed to each output: the uncompressed file and its gzip, bzip2 or xz
+    compressed versions are all written in a single pass, each one (with
+    its compression and checksums) in a thread of its own.  Files are
+    written under a temporary name, and only renamed into place by close.
+
+    The sizes and checksums of the files written are then available from
+    release_entries, to be listed in a Release file.
+
+    Example:
+
+        path = 'dists/sid/main/binary-i386/Packages'
+        with Deb822Writer(path, compressions=['', 'gz', 'xz']) as writer:
+            for package in packages:
+                writer.write(package)
+        for field, entries in writer.release_entries('dists/sid').items():
+            release.setdefault(field, []).extend(entries)
+    """
+
+    # Number of bytes gathered before they are handed to the outputs
+    buffer_size = 1 << 20
+
+    # The known compressions, and the suffix they add to file names
+    suffixes = {'': '', 'gz': '.gz', 'bz2': '.bz2', 'xz': '.xz'}
+
+    def __init__(self, path, compressions=('',), encoding=None,
+                 buffer_size=None, threads=True):
+        """Create a new Deb822Writer, and the files it writes to.
+
+        :param path: the name of the uncompressed file.
+        :param compressions: the kinds of file to write: '' for the
+            uncompressed file, and 'gz', 'bz2' or 'xz' for a compressed copy
+            of it, whose name is path with the usual suffix.
+        :param encoding: the encoding of the output.  By default, the
+            encoding of each paragraph, as for Deb822.dump.
+        :param buffer_size: the number of bytes gathered before they are
+            handed to the outputs.
+        :param threads: if false, compress and write in the calling thread.
+        """
+        for kind in compressions:
+            if kind not in self.suffixes:
+                raise ValueError("unknown compression: %r" % kind)
+        self.path = path
+        self.encoding = encoding
+        if buffer_size is not None:
+            self.buffer_size = buffer_size
+        self.outputs = []
+        try:
+            for kind in compressions:
+                self.outputs.append(_WriterOutput(
+                    path + self.suffixes[kind], kind, threads))
+        except Exception:
+            for output in self.outputs:
+                output.discard()
+            raise
+        self.__buffer = []
+        self.__buffered = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self.closed:
+            self.close(abort=exc_type is not None)
+        return False
+
+    def _format(self, paragraph):
+        """Return the encoded text of paragraph, followed by a blank line"""
+        get_as_string = getattr(paragraph, 'get_as_string', None)
+        entries = []
+        for key in paragraph:
+            if get_as_string is not None:
+                value = get_as_string(key)
+            else:
+                value = six.text_type(paragraph[key])
+            if not value or value[0] == '\n':
+                entries.append('%s:%s\n' % (key, value))
+            else:
+                entries.append('%s: %s\n' % (key, value))
+        entries.append('\n')
+        encoding = self.encoding or getattr(paragraph, 'encoding', 'utf-8')
+        return ''.join(entries).encode(encoding)
+
+    def write(self, paragraph):
+        """Append paragraph (a Deb822 object or a dict) to the outputs"""
+        if self.closed:
+            raise ValueError("write to a closed Deb822Writer")
+        data = self._format(paragraph)
+        self.__buffer.append(data)
+        self.__buffered += len(data)
+        if self.__buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Hand the buffered data to the outputs"""
+        if self.__buffer:
+            data = b''.join(self.__buffer)
+            self.__buffer = []
+            self.__buffered = 0
+            for output in self.outputs:
+                output.write(data)
+
+    def close(self, abort=False):
+        """Finish writing all the files, or remove them if abort is true
+
+        Files are only renamed into place once all of them have been
+        written; otherwise, the first error met by any output is raised.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if abort:
+            for output in self.outputs:
+                output.discard()
+            return
+        try:
+            self.flush()
+            for output in self.outputs:
+                output.finish()
+        except Exception:
+            for output in self.outputs:
+                output.discard()
+            raise
+        for output in self.outputs:
+            output.commit()
+
+    def release_entries(self, root=None):
+        """Return the entries describing the files written in a Release file
+
+        The result maps 'MD5Sum', 'SHA1' and 'SHA256' to a list of dicts
+        with the checksum, size and name of each file, as the Release class
+        expects them.  Names are relative to root (the directory of the
+        Release file), if given.
+        """
+        if not self.closed:
+            raise ValueError("release_entries called before close")
+        entries = {}
+        for output in self.outputs:
+            name = output.path
+            if root is not None:
+                name = os.path.relpath(name, root)
+            digests = output.hexdigests()
+            for field, _ in _WriterOutput.checksums:
+                entries.setdefault(field, []).append(Deb822Dict([
+                    (field.lower(), digests[field]),
+                    ('size', str(output.size)),
+                    ('name', name),
+                ]))
+        return entries
+
+
+try:
+    array('q')
+    _int64_typecode = 'q'
+except ValueError:
+    # Python 2 has no 'q', but 'l' is 64 bits wide on LP64 platforms
+    _int64_typecode = 'l'
+_int64_max = (1 << (8 * array(_int64_typecode).itemsize - 1)) - 1
+
+try:
+    from collections import Counter as _Counter
+except ImportError:
+    _Counter = None
+
+
+def _count(values):
+    """Return a dict of the number of times each item appears in values"""
+    if _Counter is not None:
+        return dict(_Counter(values))
+    counts = {}
+    for value in values:
+        counts[value] = counts.get(value, 0) + 1
+    return counts
+
+
+class _IntegerColumn(object):
+    """A column of a Deb822Table holding integers, in an array('q')
+
+    Rows without a value hold 0, and are recorded in present (an array of
+    1 for rows with a value, and 0 for those without), which is only
+    created once some row has no value.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.values = array(_int64_typecode)
+        self.present = None
+
+    def convert(self, value):
+        """Return value as append stores it, or raise ValueError"""
+        if value is None:
+            return None
+        try:
+            number = int(value)
+        except ValueError:
+            raise ValueError('%s: not an integer: %r' % (self.name, value))
+        if not -_int64_max - 1 <= number <= _int64_max:
+            raise ValueError('%s: out of range: %r' % (self.name, value))
+        return number
+
+    def append(self, value):
+        value = self.convert(value)
+        if value is None:
+            if self.present is None:
+                self.present = array('b', [1]) * len(self.values)
+            self.values.append(0)
+            self.present.append(0)
+            return
+        self.values.append(value)
+        if self.present is not None:
+            self.present.append(1)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        if self.present is not None and not self.present[i]:
+            return None
+        return self.values[i]
+
+    def __iter__(self):
+        for i in range(len(self.values)):
+            yield self[i]
+
+    def _present_values(self):
+        if self.present is None:
+            return self.values
+        return [value for value, present in zip(self.values, self.present)
+                if present]
+
+    def count(self):
+        """Return the number of rows with a value"""
+        if self.present is None:
+            return len(self.values)
+        return self.present.count(1)
+
+    def sum(self):
+        # Rows without a value hold 0, which does not change the sum
+        return sum(self.values)
+
+    def min(self):
+        return min(self._present_values())
+
+    def max(self):
+        return max(self._present_values())
+
+    def mean(self):
+        count = self.count()
+        if not count:
+            raise ValueError('%s: no values to average' % self.name)
+        return float(self.sum()) / count
+
+    def to_numpy(self):
+        """Return the column as an int64 NumPy array
+
+        If some rows have no value, a masked array is returned.
+        """
+        import numpy
+        values = numpy.frombuffer(self.values, dtype=numpy.int64).copy()
+        if self.present is None:
+            return values
+        mask = numpy.frombuffer(self.present, dtype=numpy.int8) == 0
+        return numpy.ma.masked_array(values, mask=mask)
+
+
+class _DictionaryColumn(object):
+    """A column of a Deb822Table holding strings, dictionary encoded
+
+    Each distinct value is stored once, in categories; codes holds the
+    position in categories of the value of each row, or -1 for rows
+    without a value.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.codes = array('i')
+        self.categories = []
+        self.__index = {}
+
+    def append(self, value):
+        if value is None:
+            code = -1
+        else:
+            try:
+                code = self.__index[value]
+            except KeyError:
+                code = self.__index[value] = len(self.categories)
+                self.categories.append(value)
+        self.codes.append(code)
+
+    def convert(self, value):
+        """Return value as append stores it"""
+        return value
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        code = self.codes[i]
+        if code < 0:
+            return None
+        return self.categories[code]
+
+    def __iter__(self):
+        for i in range(len(self.codes)):
+            yield self[i]
+
+    def counts(self):
+        """Return a dict of the number of rows with each value"""
+        counts = _count(self.codes)
+        counts.pop(-1, None)
+        return dict([(self.categories[code], n)
+                     for code, n in six.iteritems(counts)])
+
+    def to_strings(self):
+        """Return a _StringColumn with the same values"""
+        column = _StringColumn(self.name)
+        column.values = list(self)
+        return column
+
+    def to_numpy(self):
+        """Return the column as a NumPy array of objects"""
+        import numpy
+        categories = numpy.empty(len(self.categories) + 1, dtype=object)
+        categories[:-1] = self.categories
+        # -1 picks the None at the end
+        return categories[numpy.frombuffer(self.codes, dtype=numpy.intc)]
+
+
+class _StringColumn(object):
+    """A column of a Deb822Table holding strings, as a plain list
+
+    Used instead of a _DictionaryColumn when most values are different.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.values = []
+
+    def append(self, value):
+        self.values.append(value)
+
+    def convert(self, value):
+        """Return value as append stores it"""
+        return value
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def counts(self):
+        """Return a dict of the number of rows with each value"""
+        counts = _count(self.values)
+        counts.pop(None, None)
+        return counts
+
+    def to_numpy(self):
+        """Return the column as a NumPy array of objects"""
+        import numpy
+        values = numpy.empty(len(self.values), dtype=object)
+        values[:] = self.values
+        return values
+
+
+class Deb822Table(object):
+    """The values of some fields of many paragraphs, stored by field
+
+    Each field becomes a column, stored compactly: integer fields (by
+    default Installed-Size and Size) as an array('q'), and other fields
+    dictionary encoded, i.e. as an array of indices into the list of their
+    distinct values, unless most of their values are different.  This
+    makes aggregating over a whole archive (counting packages per section
+    or maintainer, summing sizes, ...) fast, and cheap to keep in memory.
+
+    Columns are looked up by field name (in any case); integer columns
+    have count, sum, min, max and mean methods, and string columns have a
+    counts method.  All columns can be converted to NumPy arrays with
+    to_numpy, and the whole table to a NumPy structured array, if NumPy is
+    available.
+
+    Example:
+
+        with open('Packages', 'rb') as f:
+            table = Deb822Table.from_sequence(
+                f, ['Package', 'Section', 'Installed-Size'])
+        print(table['Section'].counts())
+        print(table['Installed-Size'].sum())
+    """
+
+    # Field names that are stored as integers unless told otherwise
+    integer_fields = frozenset(['installed-size', 'size'])
+
+    # String columns with more distinct values than this, and than half
+    # their rows, are stored as plain lists
+    max_categories = 256
+
+    def __init__(self, fields, integer_fields=None):
+        """Create a new, empty, Deb822Table instance.
+
+        :param fields: the names of the fields to keep.
+        :param integer_fields: the names of those fields which hold
+            integers.  By default, the ones in Deb822Table.integer_fields.
+        """
+        if integer_fields is None:
+            integer_fields = self.integer_fields
+        integer_fields = frozenset([f.lower() for f in integer_fields])
+        self.fields = list(fields)
+        self.__columns = []
+        self.__positions = {}
+        for field in self.fields:
+            if field.lower() in self.__positions:
+                raise ValueError('field given twice: %s' % field)
+            if field.lower() in integer_fields:
+                column = _IntegerColumn(field)
+            else:
+                column = _DictionaryColumn(field)
+            self.__positions[field.lower()] = len(self.__columns)
+            self.__columns.append(column)
+        self.__rows = 0
+
+    @classmethod
+    def from_paragraphs(cls, paragraphs, fields, integer_fields=None):
+        """Return a new Deb822Table with fields from an iterable of paragraphs
+        """
+        table = cls(fields, integer_fields)
+        table.extend(paragraphs)
+        return table
+
+    @classmethod
+    def from_sequence(cls, sequence, fields, integer_fields=None, **kwargs):
+        """Return a new Deb822Table with fields from the paragraphs in sequence
+
+        sequence and kwargs are passed on to Deb822.iter_paragraphs, which
+        is asked to only parse fields (so, as there, fields should be
+        spelled as in the input).
+        """
+        return cls.from_paragraphs(
+            Deb822.iter_paragraphs(sequence, fields=fields, compact=True,
+                                   **kwargs),
+            fields, integer_fields)
+
+    def append(self, paragraph):
+        """Add the values of the fields of paragraph as a new row
+
+        If some value cannot be stored (e.g. an integer field which is not
+        a number), ValueError is raised and the table is left unchanged.
+        """
+        get = paragraph.get
+        # All the values are checked before any column grows, so that the
+        # columns stay the same length
+        values = [column.convert(get(column.name))
+                  for column in self.__columns]
+        for column, value in zip(self.__columns, values):
+            column.append(value)
+        self.__rows += 1
+        if self.__rows % 1024 == 0:
+            self.__convert_columns()
+
+    def extend(self, paragraphs):
+        """Add a row for each paragraph of an iterable of paragraphs"""
+        for paragraph in paragraphs:
+            self.append(paragraph)
+        self.__convert_columns()
+
+    def __convert_columns(self):
+        """Stop dictionary encoding columns with too many distinct values"""
+        for i, column in enumerate(self.__columns):
+            if isinstance(column, _DictionaryColumn) and \
+                    len(column.categories) > self.max_categories and \
+                    2 * len(column.categories) > self.__rows:
+                self.__columns[i] = column.to_strings()
+
+    def __len__(self):
+        return self.__rows
+
+    def __getitem__(self, field):
+        """Return the column of field"""
+        try:
+            return self.__columns[self.__positions[field.lower()]]
+        except KeyError:
+            raise KeyError(field)
+
+    def __contains__(self, field):
+        return field.lower() in self.__positions
+
+    def columns(self):
+        """Return the list of columns, in the order of fields"""
+        return list(self.__columns)
+
+    def rows(self):
+        """Yield a dict of the values of each row"""
+        names = [column.name for column in self.__columns]
+        for row in zip(*self.__columns):
+            yield dict(zip(names, row))
+
+    def to_numpy(self):
+        """Return the table as a NumPy structured array
+
+        Integer columns are int64 fields (rows without a value get 0), and
+        the others are object fields.
+        """
+        import numpy
+        dtype = []
+        for column in self.__columns:
+            if isinstance(column, _IntegerColumn):
+                dtype.append((str(column.name), numpy.int64))
+            else:
+                dtype.append((str(column.name), object))
+        result = numpy.empty(self.__rows, dtype=dtype)
+        for column in self.__columns:
+            values = column.to_numpy()
+            if isinstance(values, numpy.ma.MaskedArray):
+                values = values.filled(0)
+            result[str(column.name)] = values
+        return result
+
+
 class _CaseInsensitiveString(str):
     """Case insensitive string.
     """
@@ -1317,4 +5343,21 @@ class _CaseInsensitiveString(str):
         return self.str_lower
 
 
-_strI = _CaseInsensitiveString
+_strI_cache = {}
+
+
+def _strI(str_):
+    """Return a _CaseInsensitiveString for str_, shared by all its users
+
+    Paragraphs of the same kind mostly have the same field names, so this
+    saves both building and storing a new key every time one is used.
+    """
+    if isinstance(str_, _CaseInsensitiveString):
+        return str_
+    try:
+        return _strI_cache[str_]
+    except KeyError:
+        if len(_strI_cache) >= 4096:
+            _strI_cache.clear()
+        key = _strI_cache[str_] = _CaseInsensitiveString(str_)
+        return key
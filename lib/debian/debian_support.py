@@ -66,6 +66,48 @@ class ParseError(Exception):
 
     printOut = function_deprecated_by(print_out)
 
+try:
+    _maketrans = str.maketrans
+except AttributeError:
+    from string import maketrans as _maketrans
+
+_re_version_digits = re.compile(r"(\d+)")
+# Characters other than digits which may be in a version, and what they
+# are mapped to in sort keys, to order like dpkg does: "~" before the end
+# of a run (mapped to "\x02"), and that before letters, and letters before
+# the rest.
+_version_key_table = _maketrans("~+-.:", "\x01\xab\xad\xae\xba")
+# The keys of the parts of versions seen, as the same ones (Debian
+# revisions above all) come up again and again; replaced when full
+_version_part_keys = {}
+_version_part_keys_max = 1 << 16
+
+def _version_part_key(part):
+    """Return the sort key of an upstream version or Debian revision
+
+    dpkg compares those by runs of non-digits (character by character, the
+    end of the shorter run coming after "~" but before anything else) and
+    of digits (as integers), in turn.  So does the key: each run of
+    non-digits is a string, ending with "\\x02", and each run of digits an
+    integer (0 if it is empty).
+    """
+    global _version_part_keys
+    key = _version_part_keys.get(part)
+    if key is not None:
+        return key
+    # Runs of non-digits and digits in turn, starting and ending with the
+    # former, but maybe empty
+    runs = _re_version_digits.split(part.translate(_version_key_table))
+    if runs[-1]:
+        runs.extend(("0", ""))
+    runs[1::2] = [int(run) for run in runs[1::2]]
+    runs[0::2] = [run + "\x02" for run in runs[0::2]]
+    key = tuple(runs)
+    if len(_version_part_keys) >= _version_part_keys_max:
+        _version_part_keys = {}
+    _version_part_keys[part] = key
+    return key
+
 class BaseVersion(object):
     """Base class for classes representing Debian versions
 
@@ -105,6 +147,7 @@ class BaseVersion(object):
         self.__epoch = m.group("epoch")
         self.__upstream_version = m.group("upstream_version")
         self.__debian_revision = m.group("debian_revision")
+        self.__sort_key = None
 
     def __setattr__(self, attr, value):
         if attr not in self.magic_attrs:
@@ -158,6 +201,25 @@ class BaseVersion(object):
     def __repr__(self):
         return "%s('%s')" % (self.__class__.__name__, self)
 
+    def sort_key(self):
+        """Return a key which orders versions like comparing them does
+
+        The key is a tuple of the epoch, as an integer, and of tuples
+        standing for the upstream version and Debian revision, in which
+        the runs of digits are integers and the other runs strings mapped
+        so that they order as dpkg orders them.  It is computed once, the
+        first time it is asked for, so sorting many versions, or finding
+        the greatest one, can compare keys rather than the versions:
+
+            sorted(versions, key=Version.sort_key)
+        """
+        if self.__sort_key is None:
+            self.__sort_key = (
+                int(self.__epoch or "0"),
+                _version_part_key(self.__upstream_version),
+                _version_part_key(self.__debian_revision or "0"))
+        return self.__sort_key
+
     def _compare(self, other):
         raise NotImplementedError
 
@@ -219,71 +281,9 @@ class NativeVersion(BaseVersion):
                 raise ValueError("Couldn't convert %r to BaseVersion: %s"
                                  % (other, e))
 
-        lepoch = int(self.epoch or "0")
-        repoch = int(other.epoch or "0")
-        if lepoch < repoch:
-            return -1
-        elif lepoch > repoch:
-            return 1
-        res = self._version_cmp_part(self.upstream_version,
-                                     other.upstream_version)
-        if res != 0:
-            return res
-        return self._version_cmp_part(self.debian_revision or "0",
-                                      other.debian_revision or "0")
-
-    @classmethod
-    def _order(cls, x):
-        """Return an integer value for character x"""
-        if x == '~':
-            return -1
-        elif cls.re_digit.match(x):
-            return int(x) + 1
-        elif cls.re_alpha.match(x):
-            return ord(x)
-        else:
-            return ord(x) + 256
-
-    @classmethod
-    def _version_cmp_string(cls, va, vb):
-        la = [cls._order(x) for x in va]
-        lb = [cls._order(x) for x in vb]
-        while la or lb:
-            a = 0
-            b = 0
-            if la:
-                a = la.pop(0)
-            if lb:
-                b = lb.pop(0)
-            if a < b:
-                return -1
-            elif a > b:
-                return 1
-        return 0
-
-    @classmethod
-    def _version_cmp_part(cls, va, vb):
-        la = cls.re_all_digits_or_not.findall(va)
-        lb = cls.re_all_digits_or_not.findall(vb)
-        while la or lb:
-            a = "0"
-            b = "0"
-            if la:
-                a = la.pop(0)
-            if lb:
-                b = lb.pop(0)
-            if cls.re_digits.match(a) and cls.re_digits.match(b):
-                a = int(a)
-                b = int(b)
-                if a < b:
-                    return -1
-                elif a > b:
-                    return 1
-            else:
-                res = cls._version_cmp_string(a, b)
-                if res != 0:
-                    return res
-        return 0
+        key = self.sort_key()
+        other_key = other.sort_key()
+        return (key > other_key) - (key < other_key)
 
 if _have_apt_pkg:
     class Version(AptPkgVersion):
@@ -0,0 +1,875 @@
+# vim: fileencoding=utf-8
+#
+# depgraph.py: indexed dependency graphs of collections of binary packages
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation, either version 2
+# of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+"""Dependency graphs of Packages files, for queries such as reverse
+dependencies, providers of virtual packages and transitive closures, and
+checks of which packages can be installed"""
+
+from __future__ import absolute_import
+
+from array import array
+from collections import namedtuple
+import multiprocessing
+
+import six
+
+from debian.deb822 import PkgRelation, PkgRelationOp, _intern
+from debian.debian_support import Version
+
+
+# The relationship fields which give edges of the graph, by their keys in
+# the relations property of Packages
+RELATIONS = [('pre-depends', 'Pre-Depends'), ('depends', 'Depends'),
+             ('recommends', 'Recommends'), ('conflicts', 'Conflicts'),
+             ('breaks', 'Breaks')]
+
+# What must be installed along with a package
+DEPENDS = ('pre-depends', 'depends')
+
+
+class _Adjacency(object):
+    """The edges out of each of n nodes, in compressed sparse row form: the
+    targets of node i are targets[offsets[i]:offsets[i + 1]]"""
+
+    __slots__ = ('offsets', 'targets')
+
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def from_lists(cls, lists):
+        offsets = array('i', [0])
+        targets = array('i')
+        for nodes in lists:
+            targets.extend(nodes)
+            offsets.append(len(targets))
+        return cls(offsets, targets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, node):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    def reversed(self):
+        """Return the adjacency of the same nodes with every edge turned
+        around (with the sources of each node in increasing order)"""
+        n = len(self)
+        counts = array('i', [0]) * (n + 1)
+        for target in self.targets:
+            counts[target + 1] += 1
+        for node in range(n):
+            counts[node + 1] += counts[node]
+        offsets = array('i', counts)
+        targets = array('i', [0]) * len(self.targets)
+        for node in range(n):
+            for target in self[node]:
+                targets[counts[target]] = node
+                counts[target] += 1
+        return _Adjacency(offsets, targets)
+
+
+class _Condensation(object):
+    """The strongly connected components of a graph (cycles of packages
+    depending on each other, or single packages), and the graph between
+    them, which has no cycles"""
+
+    def __init__(self, graph):
+        n = len(graph)
+        # Tarjan's algorithm, without recursion
+        component = array('i', [-1]) * n
+        index = array('i', [-1]) * n
+        lowlink = array('i', [0]) * n
+        members = []
+        stack = []
+        on_stack = bytearray(n)
+        counter = 0
+        for root in range(n):
+            if index[root] != -1:
+                continue
+            work = [(root, 0)]
+            while work:
+                node, i = work.pop()
+                if i == 0:
+                    index[node] = lowlink[node] = counter
+                    counter += 1
+                    stack.append(node)
+                    on_stack[node] = 1
+                successors = graph[node]
+                while i < len(successors):
+                    successor = successors[i]
+                    i += 1
+                    if index[successor] == -1:
+                        work.append((node, i))
+                        work.append((successor, 0))
+                        break
+                    if on_stack[successor]:
+                        lowlink[node] = min(lowlink[node], index[successor])
+                else:
+                    if lowlink[node] == index[node]:
+                        scc = []
+                        while True:
+                            member = stack.pop()
+                            on_stack[member] = 0
+                            component[member] = len(members)
+                            scc.append(member)
+                            if member == node:
+                                break
+                        scc.sort()
+                        members.append(scc)
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    continue
+        # Tarjan's algorithm finds components after all those they lead
+        # to, so members is in topological order, dependencies first
+        self.component = component
+        self.members = members
+        successors = []
+        for scc in members:
+            targets = set()
+            for node in scc:
+                targets.update(graph[node])
+            targets = set([component[node] for node in targets])
+            targets.discard(component[scc[0]])
+            successors.append(sorted(targets))
+        self.successors = _Adjacency.from_lists(successors)
+        self.predecessors = self.successors.reversed()
+        # closure bits of components, for successors and predecessors
+        self.closures = ({}, {})
+
+    def closure_bits(self, component, reverse=False):
+        """Return the set of the nodes reachable from component (including
+        its own) as an integer with bit i set for node i"""
+        memo = self.closures[reverse]
+        bits = memo.get(component)
+        if bits is not None:
+            return bits
+        following = self.predecessors if reverse else self.successors
+        work = [component]
+        while work:
+            current = work[-1]
+            if current in memo:
+                work.pop()
+                continue
+            pending = [c for c in following[current] if c not in memo]
+            if pending:
+                work.extend(pending)
+                continue
+            bits = 0
+            for node in self.members[current]:
+                bits |= 1 << node
+            for c in following[current]:
+                bits |= memo[c]
+            memo[current] = bits
+            work.pop()
+        return memo[component]
+
+
+def _bit_indices(bits):
+    """Return the indices of the bits set in the integer bits"""
+    # bin() gives '0b' and the bits, most significant first
+    digits = bin(bits)[:1:-1]
+    indices = []
+    i = digits.find('1')
+    while i != -1:
+        indices.append(i)
+        i = digits.find('1', i + 1)
+    return indices
+
+
+def _popcount(bits):
+    return bin(bits).count('1')
+
+
+class PackageUniverse(object):
+    """The dependency graph of a collection of binary packages
+
+    Built in one pass over Packages paragraphs (or any mappings with the
+    Package, Version and Architecture fields and the relationship fields),
+    which each get an integer id, in the order they come in.  Packages are
+    then referred to by these ids, and the names, versions and
+    architectures lists give their fields:
+
+        with open('Packages') as f:
+            universe = PackageUniverse(Packages.iter_paragraphs(f))
+        for pkg in universe.reverse_dependencies(universe.ids('libc6')[0]):
+            print(universe.names[pkg], universe.versions[pkg])
+
+    The relations dict gives the parsed relationship fields of each package
+    in the form of PkgRelation.parse_compact, by the keys of RELATIONS
+    (plus 'provides').  They make up one graph per kind of relationship, in
+    which a package has an edge to each package that could satisfy one of
+    its relations: those with the right name, and those providing it,
+    whatever the version and architecture constraints.  Both these edges
+    and their reverses are kept in integer arrays, as are the providers of
+    each virtual package, so that looking any of them up takes constant
+    time.
+
+    Transitive closures and topological orders are worked out on the
+    strongly connected components of a graph (so each cycle of packages
+    counts once), and remembered, so that after the first query, those on
+    any other packages are cheap.  These take the kinds of relationships
+    to follow, by default DEPENDS (Pre-Depends and Depends).
+    """
+
+    def __init__(self, packages):
+        self.names = []
+        self.versions = []
+        self.architectures = []
+        self.relations = {'provides': []}
+        for kind, field in RELATIONS:
+            self.relations[kind] = []
+        kinds = [('provides', 'Provides')] + RELATIONS
+        ids = {}
+        for paragraph in packages:
+            name = _intern(paragraph['Package'])
+            ids.setdefault(name, []).append(len(self.names))
+            self.names.append(name)
+            self.versions.append(paragraph.get('Version'))
+            self.architectures.append(paragraph.get('Architecture'))
+            for kind, field in kinds:
+                raw = paragraph.get(field)
+                if raw is None:
+                    self.relations[kind].append(())
+                else:
+                    self.relations[kind].append(PkgRelation.parse_compact(raw))
+
+        self._ids = {}
+        for name, pkgs in six.iteritems(ids):
+            self._ids[name] = tuple(pkgs)
+        providers = {}
+        for pkg, provides in enumerate(self.relations['provides']):
+            for alternatives in provides:
+                for atom in alternatives:
+                    providers.setdefault(atom.name, []).append(pkg)
+        self._providers = {}
+        for name, pkgs in six.iteritems(providers):
+            self._providers[name] = tuple(sorted(set(pkgs)))
+
+        self._graphs = {}
+        self._reverse_graphs = {}
+        for kind, field in RELATIONS:
+            graph = _Adjacency.from_lists(
+                [self.__targets(pkg, rels)
+                 for pkg, rels in enumerate(self.relations[kind])])
+            self._graphs[kind] = graph
+            self._reverse_graphs[kind] = graph.reversed()
+        self._condensations = {}
+        self._orders = {}
+
+    def __targets(self, pkg, rels):
+        targets = set()
+        for alternatives in rels:
+            for atom in alternatives:
+                targets.update(self.candidates(atom.name))
+        # A package does not depend on, or conflict with, itself
+        targets.discard(pkg)
+        return sorted(targets)
+
+    def __len__(self):
+        return len(self.names)
+
+    def ids(self, name):
+        """Return the ids of the packages called name"""
+        return self._ids.get(name, ())
+
+    def providers(self, name):
+        """Return the ids of the packages which provide (the virtual
+        package) name"""
+        return self._providers.get(name, ())
+
+    def candidates(self, name):
+        """Return the ids of the packages which could satisfy a relation on
+        name: those called name, and those providing it"""
+        return self._ids.get(name, ()) + self._providers.get(name, ())
+
+    def dependencies(self, pkg, kind='depends'):
+        """Return the ids of the packages that the relations of kind (a key
+        of RELATIONS, such as 'depends' or 'conflicts') of package pkg
+        could be satisfied by"""
+        return self._graphs[kind][pkg]
+
+    def reverse_dependencies(self, pkg, kind='depends'):
+        """Return the ids of the packages with a relation of kind which
+        package pkg could satisfy"""
+        return self._reverse_graphs[kind][pkg]
+
+    def _condensation(self, kinds):
+        kinds = tuple(sorted(set(kinds)))
+        condensation = self._condensations.get(kinds)
+        if condensation is None:
+            if len(kinds) == 1:
+                graph = self._graphs[kinds[0]]
+            else:
+                graph = _Adjacency.from_lists(
+                    [sorted(set().union(*[self._graphs[kind][pkg]
+                                          for kind in kinds]))
+                     for pkg in range(len(self))])
+            condensation = self._condensations[kinds] = _Condensation(graph)
+        return condensation
+
+    def __closure_bits(self, pkgs, kinds, reverse):
+        if isinstance(pkgs, six.integer_types):
+            pkgs = [pkgs]
+        condensation = self._condensation(kinds)
+        bits = 0
+        for pkg in pkgs:
+            bits |= condensation.closure_bits(condensation.component[pkg],
+                                              reverse)
+        return bits
+
+    def closure(self, pkgs, kinds=DEPENDS):
+        """Return the frozenset of the ids of packages pkgs (an id or an
+        iterable of them), and of the packages they depend on, directly
+        or not, through relations of kinds
+
+        This is every package which could be needed to install pkgs, since
+        all the alternatives are followed.
+        """
+        return frozenset(_bit_indices(self.__closure_bits(pkgs, kinds,
+                                                          False)))
+
+    def reverse_closure(self, pkgs, kinds=DEPENDS):
+        """Return the frozenset of the ids of packages pkgs, and of the
+        packages which depend on them, directly or not, through relations
+        of kinds"""
+        return frozenset(_bit_indices(self.__closure_bits(pkgs, kinds,
+                                                          True)))
+
+    def closure_size(self, pkgs, kinds=DEPENDS):
+        """Return len(self.closure(pkgs, kinds)), without making the set"""
+        return _popcount(self.__closure_bits(pkgs, kinds, False))
+
+    def topological_order(self, kinds=DEPENDS):
+        """Return a tuple of the ids of all the packages, each after those
+        it depends on through relations of kinds (those depending on each
+        other, in a cycle, being next to each other)"""
+        key = tuple(sorted(set(kinds)))
+        order = self._orders.get(key)
+        if order is None:
+            order = []
+            for members in self._condensation(kinds).members:
+                order.extend(members)
+            order = self._orders[key] = tuple(order)
+        return order
+
+    def cycles(self, kinds=DEPENDS):
+        """Return a list of the sorted lists of the ids of packages which
+        depend on each other, directly or not, through relations of kinds"""
+        return [members for members in self._condensation(kinds).members
+                if len(members) > 1]
+
+
+class Reason(namedtuple('Reason', 'kind chain relation other')):
+    """Why a package cannot be installed, as found by InstallabilityChecker
+
+    chain is a tuple of package ids, starting with the package checked,
+    each depending on the next one (through the alternative that was being
+    tried).  When kind is 'missing', no package can satisfy the relation
+    (a tuple of PkgRelationAtom alternatives, as in
+    PackageUniverse.relations) of the last one; when kind is 'conflict',
+    the last one conflicts with (or breaks, or is another version of) the
+    last one of other, another such chain.
+    """
+
+    __slots__ = ()
+
+
+class InstallabilityChecker(object):
+    """Which packages of a PackageUniverse can be installed
+
+    A package is installable if there is a set of packages including it in
+    which the Pre-Depends and Depends of each package are satisfied (taking
+    versions into account, with debian_support.Version, alternatives and
+    Provides), and no package conflicts with or breaks another, nor is
+    another version of the same package.  Architectures, Multi-Arch and
+    Essential are not taken into account.
+
+    Most of the work is shared between packages, and done once: resolving
+    relations to the package ids satisfying them, finding the packages
+    which cannot be installed whatever else is (because of a relation
+    nothing satisfies, down the line), and those whose cones (all the
+    packages they may need, worked out on strongly connected components)
+    hold no conflicts, which can be.  For the others, the possible
+    installations are searched, backtracking over the alternatives; what
+    each search finds installable, or not, is remembered for the next.
+
+    check returns the Reasons why a package cannot be installed, and
+    check_all does so for a whole suite, possibly in several processes:
+
+        checker = InstallabilityChecker(universe)
+        for pkg, reasons in sorted(checker.check_all(workers=4).items()):
+            print(universe.names[pkg], universe.versions[pkg])
+            for reason in reasons:
+                print('   ', checker.describe(reason))
+    """
+
+    # At most this many reasons are given for a package
+    max_reasons = 16
+
+    def __init__(self, universe):
+        self.universe = universe
+        self._sort_keys = {}
+        self._satisfiers = {}
+        n = len(universe)
+
+        # The ids of the packages satisfying each (Pre-)Depends of each
+        # package, and who each package may satisfy
+        self._clauses = []
+        satisfies = [[] for pkg in range(n)]
+        for pkg in range(n):
+            clauses = []
+            for kind in DEPENDS:
+                for alternatives in universe.relations[kind][pkg]:
+                    candidates = self._satisfying(alternatives)
+                    for candidate in candidates:
+                        satisfies[candidate].append((pkg, len(clauses)))
+                    clauses.append(candidates)
+            self._clauses.append(tuple(clauses))
+
+        # Packages which cannot be installed even without any conflicts,
+        # the clause which cannot be satisfied, and when they were found
+        self._broken = {}
+        left = [[len(candidates) for candidates in clauses]
+                for clauses in self._clauses]
+        work = []
+        for pkg in range(n):
+            for i, candidates in enumerate(self._clauses[pkg]):
+                if not candidates:
+                    self._broken[pkg] = (i, len(self._broken))
+                    work.append(pkg)
+                    break
+        while work:
+            candidate = work.pop()
+            for pkg, i in satisfies[candidate]:
+                left[pkg][i] -= 1
+                if left[pkg][i] == 0 and pkg not in self._broken:
+                    self._broken[pkg] = (i, len(self._broken))
+                    work.append(pkg)
+
+        # Pairs of packages which cannot be installed together
+        clashes = [set() for pkg in range(n)]
+        for pkg in range(n):
+            if pkg in self._broken:
+                continue
+            for kind in ('conflicts', 'breaks'):
+                for alternatives in universe.relations[kind][pkg]:
+                    for other in self._satisfying(alternatives):
+                        if other != pkg and other not in self._broken:
+                            clashes[pkg].add(other)
+                            clashes[other].add(pkg)
+            for other in universe.ids(universe.names[pkg]):
+                if other != pkg and other not in self._broken:
+                    clashes[pkg].add(other)
+        self._clashes = [tuple(sorted(others)) for others in clashes]
+
+        # Packages are safe if nothing in their cones (what they may need,
+        # through the dependencies on packages not broken) clashes with
+        # anything, as installing the whole cone then works: they need no
+        # search, and nor do the relations they satisfy
+        cones = _Condensation(_Adjacency.from_lists(
+            [sorted(set([candidate for candidates in clauses
+                         for candidate in candidates
+                         if candidate not in self._broken]))
+             for clauses in self._clauses]))
+        safe_components = bytearray(len(cones.members))
+        for component, members in enumerate(cones.members):
+            # After those it leads to
+            if all([safe_components[c]
+                    for c in cones.successors[component]]) and \
+                    not any([self._clashes[pkg] for pkg in members]):
+                safe_components[component] = 1
+        self._safe = bytearray(n)
+        for pkg in range(n):
+            if pkg not in self._broken:
+                self._safe[pkg] = safe_components[cones.component[pkg]]
+        # Where packages come in the dependency order of components
+        self._components = cones.component
+        # Packages found installable by some search, and the reasons of
+        # those found not to be, which no other search then tries
+        self._known = bytearray(n)
+        self._failures = {}
+
+        # What is left to search for, for each package: its clauses with
+        # no safe candidate, with their candidates which are not broken
+        self._open = []
+        for pkg in range(n):
+            clauses = []
+            for i, candidates in enumerate(self._clauses[pkg]):
+                if any([self._safe[c] for c in candidates]):
+                    continue
+                clauses.append((i, tuple([c for c in candidates
+                                          if c not in self._broken])))
+            self._open.append(tuple(clauses))
+
+    def _sort_key(self, version):
+        """Return the sort key of version (a string), or False if it is not
+        valid"""
+        key = self._sort_keys.get(version)
+        if key is None:
+            try:
+                key = Version(version).sort_key()
+            except ValueError:
+                key = False
+            self._sort_keys[version] = key
+        return key
+
+    def _compare(self, a, b):
+        """Return how versions a and b compare (negative, zero or positive),
+        or None if either is not valid"""
+        ka = self._sort_key(a)
+        kb = self._sort_key(b)
+        if ka is False or kb is False:
+            return None
+        return (ka > kb) - (ka < kb)
+
+    def _matches(self, op, version, wanted):
+        """Return whether version satisfies the relation "(op wanted)" """
+        if op is None:
+            return True
+        if version is None:
+            return False
+        comparison = self._compare(version, wanted)
+        if comparison is None:
+            return False
+        try:
+            return op.satisfied_by(comparison)
+        except ValueError:
+            return False
+
+    def _satisfying(self, alternatives):
+        """Return a tuple of the ids of the packages satisfying any of
+        alternatives (a relation, as in PackageUniverse.relations)"""
+        # The same relations come up again and again in an archive
+        satisfiers = self._satisfiers.get(alternatives)
+        if satisfiers is not None:
+            return satisfiers
+        universe = self.universe
+        found = []
+        for atom in alternatives:
+            for candidate in universe.ids(atom.name):
+                if self._matches(atom.op, universe.versions[candidate],
+                                 atom.version):
+                    found.append(candidate)
+            for candidate in universe.providers(atom.name):
+                # Only a versioned Provides satisfies a versioned relation
+                for provided in universe.relations['provides'][candidate]:
+                    provided = provided[0]
+                    if provided.name != atom.name:
+                        continue
+                    if atom.op is None or (
+                            provided.op is PkgRelationOp.EQ and
+                            self._matches(atom.op, provided.version,
+                                          atom.version)):
+                        found.append(candidate)
+                        break
+        seen = set()
+        unique = []
+        for candidate in found:
+            if candidate not in seen:
+                seen.add(candidate)
+                unique.append(candidate)
+        satisfiers = self._satisfiers[alternatives] = tuple(unique)
+        return satisfiers
+
+    def installable(self, pkg):
+        """Return whether package pkg (an id) can be installed"""
+        return not self.check(pkg)
+
+    def check(self, pkg):
+        """Return a tuple of the Reasons why package pkg (an id) cannot be
+        installed: empty if it can be"""
+        if pkg in self._broken:
+            return (self._missing(pkg),)
+        if self._safe[pkg] or self._known[pkg]:
+            return ()
+        reasons = self._failures.get(pkg)
+        if reasons is None:
+            reasons = self._search(pkg)
+            if reasons:
+                self._failures[pkg] = reasons
+        return reasons
+
+    def _missing(self, pkg):
+        """Return the Reason why package pkg, in self._broken, cannot be
+        installed, following each clause to the candidate found broken
+        first"""
+        chain = [pkg]
+        while True:
+            i = self._broken[pkg][0]
+            candidates = self._clauses[pkg][i]
+            if not candidates:
+                return Reason('missing', tuple(chain),
+                              self._relation(pkg, i), None)
+            pkg = min(candidates, key=lambda c: self._broken[c][1])
+            chain.append(pkg)
+
+    def _relation(self, pkg, i):
+        """Return the alternatives of the i-th clause of package pkg"""
+        for kind in DEPENDS:
+            rels = self.universe.relations[kind][pkg]
+            if i < len(rels):
+                return rels[i]
+            i -= len(rels)
+
+    def _search(self, root):
+        """Look for an installation of package root, backtracking over the
+        alternatives, and return the reasons of the failures if there is
+        none
+
+        Each choice of an alternative is a level, and each package decided
+        on gets the set of the levels it follows from (as the bits of an
+        int), so that a failure goes back to the last choice it follows
+        from, rather than trying all the combinations of those after it.
+        """
+        value = {root: True}
+        because = {root: 0}     # the levels each package follows from
+        parent = {root: None}   # who needs each package installed
+        blocker = {}            # who keeps each package out
+        trail = [root]
+        todo = [root]           # installed, but not propagated yet
+        pending = []            # (pkg, clause, candidates) to satisfy
+        cursor = 0              # pending before it are satisfied
+        # [trail, pending, cursor, pkg, candidates, tried, base, culprits]
+        # for each level: base is the levels which ruled out the other
+        # candidates of the clause of pkg, and culprits those which made
+        # the candidates tried fail
+        choices = []
+        reasons = []
+        failures = self._failures
+
+        def chain(pkg):
+            packages = []
+            while pkg is not None:
+                packages.append(pkg)
+                pkg = parent[pkg]
+            packages.reverse()
+            return tuple(packages)
+
+        def fail(reason):
+            if reason not in reasons and len(reasons) < self.max_reasons:
+                reasons.append(reason)
+
+        def propagate():
+            """Install what the packages to do need, and return None, or
+            the levels of a failure"""
+            while todo:
+                pkg = todo.pop()
+                for other in self._clashes[pkg]:
+                    state = value.get(other)
+                    if state is True:
+                        fail(Reason('conflict', chain(pkg), None,
+                                    chain(other)))
+                        return because[pkg] | because[other]
+                    if state is None:
+                        value[other] = False
+                        because[other] = because[pkg]
+                        blocker[other] = pkg
+                        trail.append(other)
+                for i, candidates in self._open[pkg]:
+                    conflict = install(pkg, i, candidates)
+                    if conflict is not None:
+                        return conflict
+            return None
+
+        def unsatisfiable(pkg, i, candidates, excluded):
+            """Record the failure of a clause with no candidate left, and
+            return its levels"""
+            for candidate in candidates:
+                if candidate in blocker:
+                    # Which would conflict with some installed package
+                    fail(Reason('conflict', chain(pkg) + (candidate,), None,
+                                chain(blocker[candidate])))
+                    break
+                if candidate in failures:
+                    # Which cannot be installed at all
+                    reason = failures[candidate][0]
+                    other = reason.other
+                    if other is not None:
+                        other = chain(pkg) + other
+                    fail(Reason(reason.kind, chain(pkg) + reason.chain,
+                                reason.relation, other))
+                    break
+            else:
+                fail(Reason('missing', chain(pkg), self._relation(pkg, i),
+                            None))
+            return because[pkg] | excluded
+
+        def open_candidates(candidates):
+            """Return None if a candidate is installed, or those which may
+            be and the levels which ruled out the others"""
+            open_ = []
+            excluded = 0
+            for candidate in candidates:
+                state = value.get(candidate)
+                if state is None:
+                    if candidate not in failures:
+                        open_.append(candidate)
+                elif state:
+                    return None, 0
+                else:
+                    excluded |= because[candidate]
+            return open_, excluded
+
+        def install(pkg, i, candidates):
+            """Install a candidate of a clause if there is only one, or
+            keep the clause for later; return the levels of the failure if
+            there is none"""
+            open_, excluded = open_candidates(candidates)
+            if open_ is None:
+                return None
+            if not open_:
+                return unsatisfiable(pkg, i, candidates, excluded)
+            if len(open_) == 1:
+                value[open_[0]] = True
+                because[open_[0]] = because[pkg] | excluded
+                parent[open_[0]] = pkg
+                trail.append(open_[0])
+                todo.append(open_[0])
+            else:
+                pending.append((pkg, i, candidates))
+            return None
+
+        def undo(mark, pending_mark):
+            while len(trail) > mark:
+                pkg = trail.pop()
+                del value[pkg]
+                del because[pkg]
+                parent.pop(pkg, None)
+                blocker.pop(pkg, None)
+            del pending[pending_mark:]
+            del todo[:]
+
+        conflict = propagate()
+        while True:
+            if conflict is None:
+                # Find the next clause to decide on
+                while cursor < len(pending):
+                    pkg, i, candidates = pending[cursor]
+                    open_, excluded = open_candidates(candidates)
+                    if open_ is not None:
+                        break
+                    cursor += 1
+                else:
+                    # Everything installed is then installable too
+                    for pkg, state in six.iteritems(value):
+                        if state:
+                            self._known[pkg] = 1
+                    return ()
+                if not open_:
+                    conflict = unsatisfiable(pkg, i, candidates, excluded)
+                    continue
+                level = len(choices)
+                choice = [len(trail), len(pending), cursor, pkg, open_, 0,
+                          because[pkg] | excluded, 0]
+                choices.append(choice)
+            else:
+                if not conflict:
+                    return tuple(reasons)
+                # Back to the last choice the failure follows from
+                level = conflict.bit_length() - 1
+                del choices[level + 1:]
+                choice = choices[level]
+                choice[7] |= conflict & ~(1 << level)
+                choice[5] += 1
+                if choice[5] == len(choice[4]):
+                    conflict = choice[6] | choice[7]
+                    del choices[level]
+                    continue
+            # Try the next candidate of that choice
+            mark, pending_mark, cursor, pkg, candidates, tried, base, \
+                culprits = choice
+            undo(mark, pending_mark)
+            for candidate in candidates[:tried]:
+                value[candidate] = False
+                because[candidate] = culprits
+                trail.append(candidate)
+            candidate = candidates[tried]
+            value[candidate] = True
+            because[candidate] = 1 << level
+            parent[candidate] = pkg
+            trail.append(candidate)
+            todo.append(candidate)
+            conflict = propagate()
+
+    def check_all(self, pkgs=None, workers=None):
+        """Check packages pkgs (ids; all by default), and return a dict of
+        the Reasons of those which cannot be installed, by id
+
+        With workers, the packages are checked in that many processes
+        (which each remember what they found on their own, so the Reasons
+        may come out differently).
+        """
+        if pkgs is None:
+            pkgs = range(len(self.universe))
+        # Dependencies first, so that the searches for the packages which
+        # need them can skip those found not to be installable
+        pkgs = sorted(pkgs, key=self._components.__getitem__)
+        broken = {}
+        if not workers:
+            for pkg in pkgs:
+                reasons = self.check(pkg)
+                if reasons:
+                    broken[pkg] = reasons
+            return broken
+        batches = [pkgs[i:i + _CHECK_BATCH_SIZE]
+                   for i in range(0, len(pkgs), _CHECK_BATCH_SIZE)]
+        pool = multiprocessing.Pool(workers, _init_check_worker, (self,))
+        try:
+            for results in pool.imap_unordered(_check_batch, batches):
+                broken.update(results)
+        finally:
+            pool.terminate()
+            pool.join()
+        return broken
+
+    def describe(self, reason):
+        """Return a line of text explaining reason (a Reason)"""
+        universe = self.universe
+
+        def package(pkg):
+            return '%s (= %s)' % (universe.names[pkg], universe.versions[pkg])
+
+        path = ' -> '.join([package(pkg) for pkg in reason.chain])
+        if reason.kind == 'missing':
+            return '%s: nothing satisfies %s' % (
+                path, PkgRelation.str([reason.relation]))
+        return '%s: conflicts with %s' % (
+            path, ' -> '.join([package(pkg) for pkg in reason.other]))
+
+
+# Packages checked at a time by each process of check_all
+_CHECK_BATCH_SIZE = 256
+
+_checker = None
+
+
+def _init_check_worker(checker):
+    global _checker
+    _checker = checker
+
+
+def _check_batch(pkgs):
+    results = {}
+    for pkg in pkgs:
+        reasons = _checker.check(pkg)
+        if reasons:
+            results[pkg] = reasons
+    return results
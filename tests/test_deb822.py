@@ -422,6 +422,42 @@ class TestDeb822(unittest.TestCase):
             self.assertEqual(result['VALIDSIG'], valid['VALIDSIG'])
             self.assertEqual(result['SIG_ID'][1:], valid['SIG_ID'][1:])
 
+    def test_signed_parts(self):
+        data = (SIGNED_CHECKSUM_CHANGES_FILE
+                % CHECKSUM_CHANGES_FILE).encode('utf-8')
+        changes = deb822.Changes(data)
+        self.assertTrue(changes.raw_text is data)
+        header, payload, signature = changes.get_signed_parts()
+        self.assertTrue(header.tobytes().startswith(
+            b'-----BEGIN PGP SIGNED MESSAGE-----\nHash: SHA1\n'))
+        self.assertEqual(CHECKSUM_CHANGES_FILE.encode('utf-8'),
+                         payload.tobytes() + b'\n')
+        self.assertTrue(signature.tobytes().startswith(
+            b'-----BEGIN PGP SIGNATURE-----\n'))
+        self.assertTrue(signature.tobytes().endswith(
+            b'-----END PGP SIGNATURE-----'))
+        self.assertEqual(deb822.Changes(data.splitlines()), changes)
+        self.assertEqual(None, deb822.Changes(data.splitlines())
+                                     .get_signed_parts())
+        self.assertEqual(None, deb822.Changes(CHECKSUM_CHANGES_FILE)
+                                     .get_signed_parts())
+
+        # The payload is parsed in place: its values are cut out of the
+        # signed text itself
+        parsed = changes._Deb822Dict__parsed
+        self.assertTrue(parsed._data is data)
+        self.assertEqual(deb822.Changes(CHECKSUM_CHANGES_FILE), changes)
+        some = deb822.Changes(data, fields=['Source', 'Files'])
+        self.assertEqual(['Files', 'Source'], sorted(some))
+        self.assertEqual(changes['Files'], some['Files'])
+        self.assertTrue(some._Deb822Dict__parsed._data is data)
+
+        # gpgv gets the buffer as it was given
+        info = deb822.GpgInfo.from_sequence(
+            memoryview(data), keyrings=['/nonexistent'],
+            executable=['sh', '-c', 'echo "[GNUPG:] GOODSIG $(wc -c)"'])
+        self.assertEqual([str(len(data))], info['GOODSIG'])
+
     def test_iter_paragraphs_array(self):
         text = (UNPARSED_PACKAGE + '\n\n\n' + UNPARSED_PACKAGE).splitlines()
 
@@ -494,6 +530,258 @@ class TestDeb822(unittest.TestCase):
         self._test_iter_paragraphs("test_Sources", deb822.Sources,
                                    use_apt_pkg=False, shared_storage=False)
 
+    def _parse_line_by_line(self, cls, lines, **kwargs):
+        """Parse paragraphs one at a time with the Deb822 constructor"""
+        lines = iter(lines)
+        paragraphs = []
+        p = cls(lines, **kwargs)
+        while p:
+            paragraphs.append(p)
+            p = cls(lines, **kwargs)
+        return paragraphs
+
+    def _test_iter_paragraphs_native_input(self, filename, cls):
+        with open(filename, 'rb') as f:
+            contents = f.read()
+        expected = self._parse_line_by_line(cls, contents.splitlines())
+        inputs = [contents, bytearray(contents), contents.splitlines(),
+                  BytesIO(contents), contents.replace(b'\n', b'\r\n')]
+        if sys.version >= '3':
+            inputs.append(memoryview(contents))
+        for sequence in inputs:
+            paragraphs = list(cls.iter_paragraphs(sequence,
+                                                  use_apt_pkg=False))
+            self.assertEqual(len(expected), len(paragraphs))
+            for p, e in zip(paragraphs, expected):
+                self.assertEqual(list(e.keys()), list(p.keys()))
+                self.assertEqual(e.dump(), p.dump())
+
+    def test_iter_paragraphs_native_input_packages(self):
+        self._test_iter_paragraphs_native_input("test_Packages",
+                                                deb822.Packages)
+
+    def test_iter_paragraphs_native_input_sources(self):
+        self._test_iter_paragraphs_native_input("test_Sources",
+                                                deb822.Sources)
+
+    def test_iter_paragraphs_native_continuation_lines(self):
+        data = ('Foo: bar\n'
+                ' baz  \n'
+                ' \n'
+                'not a field\n'
+                '  quux\n'
+                'Bad Key: value\n'
+                'Empty:\n'
+                ' .\n')
+        expected = self._parse_line_by_line(deb822.Deb822,
+                                            data.splitlines())
+        paragraphs = list(deb822.Deb822.iter_paragraphs(data,
+                                                        use_apt_pkg=False))
+        self.assertEqual(1, len(paragraphs))
+        self.assertWellParsed(paragraphs[0], expected[0])
+        self.assertEqual('bar\n baz  \n  quux', paragraphs[0]['Foo'])
+
+    def test_iter_paragraphs_lazy_decoding(self):
+        data = (b'Package: foo\n'
+                b'Description: caf\xe9\n'
+                b' more caf\xe9  \n'
+                b' .\n'
+                b'Maintainer: Foo  \n'
+                b' Bar\n')
+        p = next(deb822.Deb822.iter_paragraphs(data, use_apt_pkg=False))
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.assertEqual('foo', p['Package'])
+            self.assertEqual([], caught)
+            # Only the field looked up gets its encoding detected, and only
+            # the first time around
+            self.assertEqual(six.u('caf\xe9\n more caf\xe9  \n .'),
+                             p['Description'])
+            self.assertEqual(1, len(caught))
+            self.assertEqual(six.u('caf\xe9\n more caf\xe9  \n .'),
+                             p['description'])
+            self.assertEqual(1, len(caught))
+        self.assertEqual('Foo\n Bar', p['Maintainer'])
+
+    def test_iter_paragraphs_native_projection(self):
+        data = ('Package: foo\n'
+                'Description: short\n'
+                ' long\n'
+                ' .\n'
+                ' more\n'
+                'Version: 1.0\n'
+                ' continued\n'
+                'not a field\n'
+                ' still continued\n'
+                'Bad Key: value\n'
+                'Depends: bar\n'
+                'Version: 2.0\n'
+                '\n'
+                'Version: 3.0\n'
+                'Package: baz\n')
+        fieldsets = [['Package'], ['Version', 'Depends'], ['Description'],
+                     ['Depends', 'Nonexistent'], ['version'], []]
+        for fields in fieldsets:
+            paragraphs = list(deb822.Deb822.iter_paragraphs(
+                data, fields=fields, use_apt_pkg=False))
+            lines = iter(data.splitlines())
+            for p in paragraphs:
+                self.assertEqual(deb822.Deb822(lines, fields=fields), p)
+        # A field given twice takes its last value, as without fields
+        p = next(deb822.Deb822.iter_paragraphs(
+            data, fields=['Version', 'Package'], use_apt_pkg=False))
+        self.assertEqual({'Package': 'foo', 'Version': '2.0'}, p)
+        whole = next(deb822.Deb822.iter_paragraphs(data, use_apt_pkg=False))
+        self.assertEqual(whole['Version'], p['Version'])
+        self.assertEqual(p, deb822.Deb822(data.splitlines(),
+                                          fields=['Version', 'Package']))
+
+    def _test_iter_paragraphs_where(self, where, predicate, **kwargs):
+        with open('test_Packages', 'rb') as f:
+            contents = f.read()
+        expected = [p.dump() for p in deb822.Packages.iter_paragraphs(
+                    contents, use_apt_pkg=False, fields=kwargs.get('fields'))
+                    if predicate(p)]
+        for sequence in [contents, contents.decode('utf-8')]:
+            paragraphs = deb822.Packages.iter_paragraphs(
+                sequence, use_apt_pkg=False, where=where, **kwargs)
+            self.assertEqual(expected, [p.dump() for p in paragraphs])
+        return expected
+
+    def test_iter_paragraphs_where(self):
+        found = self._test_iter_paragraphs_where(
+            {'Section': 'text'}, lambda p: p['Section'] == 'text')
+        self.assertEqual(1, len(found))
+        self._test_iter_paragraphs_where(
+            {'section': u'text', 'priority': b'extra'},
+            lambda p: False)
+        self._test_iter_paragraphs_where(
+            {'Maintainer': re.compile(r'debian\.org>$')},
+            lambda p: p['Maintainer'].endswith('debian.org>'))
+        self._test_iter_paragraphs_where(
+            {'PACKAGE': set(['a2ps', 'zssh', 'no-such-package'])},
+            lambda p: p['Package'] in ('a2ps', 'zssh'))
+        self._test_iter_paragraphs_where(
+            {'No-Such-Field': 'x'}, lambda p: False)
+        # Projection only applies to the paragraphs yielded
+        self._test_iter_paragraphs_where(
+            {'Package': ['zssh']}, lambda p: p['Package'] == 'zssh',
+            fields=['Package', 'Section'])
+
+    def test_iter_paragraphs_where_workers(self):
+        self._test_iter_paragraphs_where(
+            {'Section': re.compile('^(text|net)$')},
+            lambda p: p['Section'] in ('text', 'net'), workers=2)
+
+    def test_iter_paragraphs_where_unsupported(self):
+        generator = deb822.Deb822.iter_paragraphs('Foo: bar\n',
+                                                  where={'Foo': 1})
+        self.assertRaises(TypeError, list, generator)
+
+    def _test_iter_paragraphs_workers(self, filename, cls, **kwargs):
+        with open(filename, 'rb') as f:
+            contents = f.read()
+        expected = list(cls.iter_paragraphs(contents, use_apt_pkg=False,
+                                            **kwargs))
+        paragraphs = list(cls.iter_paragraphs(contents, workers=2, **kwargs))
+        self.assertEqual(len(expected), len(paragraphs))
+        for p, e in zip(paragraphs, expected):
+            self.assertTrue(isinstance(p, cls))
+            self.assertEqual(e.dump(), p.dump())
+            self.assertEqual(e.encoding, p.encoding)
+
+    def test_iter_paragraphs_workers_packages(self):
+        self._test_iter_paragraphs_workers('test_Packages', deb822.Packages)
+        self._test_iter_paragraphs_workers('test_Packages', deb822.Packages,
+                                           fields=['Package', 'Depends'])
+
+    def test_iter_paragraphs_workers_sources(self):
+        self._test_iter_paragraphs_workers('test_Sources', deb822.Sources)
+        self._test_iter_paragraphs_workers('test_Sources.iso8859-1',
+                                           deb822.Sources,
+                                           encoding='iso8859-1')
+
+    def test_iter_paragraphs_workers_signed(self):
+        data = SIGNED_CHECKSUM_CHANGES_FILE % CHECKSUM_CHANGES_FILE
+        changes = list(deb822.Changes.iter_paragraphs(data, workers=2))
+        self.assertEqual(1, len(changes))
+        self.assertEqual(deb822.Changes(data).dump(), changes[0].dump())
+        self.assertEqual(data.encode('utf-8'), changes[0].raw_text + b'\n')
+
+    def _test_iter_paragraphs_compressed(self, filename, cls):
+        import bz2
+        import gzip
+        with open(filename, 'rb') as f:
+            contents = f.read()
+        expected = list(cls.iter_paragraphs(contents, use_apt_pkg=False))
+        gzipped = BytesIO()
+        g = gzip.GzipFile(fileobj=gzipped, mode='wb')
+        g.write(contents[:1000])
+        g.close()
+        # A second gzip member, as 'cat a.gz b.gz' would give
+        g = gzip.GzipFile(fileobj=gzipped, mode='wb')
+        g.write(contents[1000:])
+        g.close()
+        # Zero padding after the last member, as tar and dd leave it
+        padded = gzipped.getvalue() + b'\0' * 700
+        inputs = [gzipped.getvalue(), padded, bz2.compress(contents)]
+        try:
+            import lzma
+        except ImportError:
+            pass
+        else:
+            inputs.append(lzma.compress(contents))
+        for data in inputs:
+            for make_input in [bytes, BytesIO]:
+                for readahead in [False, True]:
+                    paragraphs = list(cls.iter_paragraphs(
+                        make_input(data), readahead=readahead))
+                    self.assertEqual(len(expected), len(paragraphs))
+                    for p, e in zip(paragraphs, expected):
+                        self.assertEqual(e.dump(), p.dump())
+                # The constructor parses the first paragraph
+                self.assertEqual(expected[0].dump(),
+                                 cls(make_input(data)).dump())
+            fd, path = tempfile.mkstemp()
+            try:
+                os.write(fd, data)
+                os.close(fd)
+                with open(path, 'rb') as f:
+                    paragraphs = list(cls.iter_paragraphs(f))
+                self.assertEqual([e.dump() for e in expected],
+                                 [p.dump() for p in paragraphs])
+            finally:
+                os.remove(path)
+
+    def test_iter_paragraphs_compressed_packages(self):
+        self._test_iter_paragraphs_compressed('test_Packages',
+                                              deb822.Packages)
+
+    def test_iter_paragraphs_compressed_sources(self):
+        self._test_iter_paragraphs_compressed('test_Sources', deb822.Sources)
+
+    def test_compressed_signed(self):
+        import gzip
+        data = (SIGNED_CHECKSUM_CHANGES_FILE
+                % CHECKSUM_CHANGES_FILE).encode('utf-8')
+        compressed = BytesIO()
+        g = gzip.GzipFile(fileobj=compressed, mode='wb')
+        g.write(data)
+        g.close()
+        for make_input in [bytes, BytesIO]:
+            changes = deb822.Changes(make_input(compressed.getvalue()))
+            self.assertEqual(deb822.Changes(data), changes)
+        changes = deb822.Changes(compressed.getvalue())
+        self.assertEqual(data, changes.raw_text)
+        self.assertTrue(changes.get_signed_parts() is not None)
+
+    def test_iter_paragraphs_readahead_error(self):
+        def lines():
+            yield 'Foo: bar\n'
+            raise IOError('broken')
+        generator = deb822.Deb822.iter_paragraphs(lines(), readahead=True)
+        self.assertRaises(IOError, list, generator)
+
     def test_parser_empty_input(self):
         self.assertEqual({}, deb822.Deb822([]))
 
@@ -521,6 +809,27 @@ class TestDeb822(unittest.TestCase):
             for key in wanted_fields:
                 self.assertEqual(PARSED_PACKAGE[key], deb822_[key])
 
+    def test_limit_fields_duplicates(self):
+        """A repeated field takes its last value, whether or not fields
+        are limited"""
+        text = 'Package: a\nVersion: 1\nPackage: b\n'
+        self.assertEqual({'Package': 'b', 'Version': '1'},
+                         deb822.Deb822(text))
+        self.assertEqual({'Package': 'b'},
+                         deb822.Deb822(text, fields=['Package']))
+        self.assertEqual({'Package': 'b', 'Version': '1'},
+                         deb822.Deb822(text, fields=['Package', 'Version']))
+        for fields in [None, ['Package'], ['Version', 'Package']]:
+            for compact in [False, True]:
+                paragraphs = list(deb822.Deb822.iter_paragraphs(
+                    text, fields=fields, compact=compact))
+                self.assertEqual(['b'],
+                                 [p['Package'] for p in paragraphs])
+        for where, found in [({'Package': 'b'}, 1), ({'Package': 'a'}, 0)]:
+            paragraphs = list(deb822.Deb822.iter_paragraphs(
+                text, fields=['Package'], where=where))
+            self.assertEqual(found, len(paragraphs))
+
     def test_dont_assume_trailing_newline(self):
         deb822a = deb822.Deb822(['Package: foo'])
         deb822b = deb822.Deb822(['Package: foo\n'])
@@ -672,6 +981,62 @@ Description: python modules to work with Debian-related data formats
         changesobj = deb822.Changes(CHECKSUM_CHANGES_FILE.splitlines())
         self.assertEqual(CHECKSUM_CHANGES_FILE, changesobj.dump())
 
+    def test_multivalued_lazy_expansion(self):
+        text = CHECKSUM_CHANGES_FILE.replace(' 1117 python ',
+                                             '  1117  python ')
+        changes = deb822.Changes(text)
+        raw = changes._Deb822Dict__dict
+        self.assertFalse('Files' in raw)
+        # Unexpanded fields are dumped as they were
+        self.assertEqual(text, changes.dump())
+        self.assertFalse('Files' in raw)
+
+        files = changes['files']
+        self.assertTrue(files is changes['Files'])
+        self.assertEqual(['md5sum', 'size', 'section', 'priority', 'name'],
+                         list(files[0]))
+        self.assertEqual('python-debian_0.1.10.dsc', files[0]['Name'])
+        self.assertEqual(dict(files[0]), files[0])
+        self.assertEqual(CHECKSUM_CHANGES_FILE, changes.dump())
+        import pickle
+        self.assertEqual(changes, pickle.loads(pickle.dumps(changes)))
+
+        # Rows can be changed in place
+        files[1]['Size'] = '2'
+        self.assertEqual('2', files[1]['size'])
+        self.assertEqual(['md5sum', 'size', 'section', 'priority', 'name'],
+                         list(files[1]))
+        self.assertTrue(' 2 python optional python-debian_0.1.10.tar.gz\n'
+                        in changes.get_as_string('Files'))
+        sha256 = changes['Checksums-Sha256'][0]
+        del sha256['sha256']
+        self.assertEqual(2, len(sha256))
+        self.assertFalse('sha256' in sha256)
+        self.assertEqual(sha256, pickle.loads(pickle.dumps(sha256)))
+        self.assertEqual(files[1], pickle.loads(pickle.dumps(files[1])))
+
+        # Rows can be replaced by dicts, and fields set to new rows
+        files[0] = dict(files[0], size='1')
+        self.assertTrue(' 1 python optional python-debian_0.1.10.dsc\n'
+                        in changes.get_as_string('Files'))
+        changes['Checksums-Sha1'] = [
+            {'sha1': 'deadbeef', 'size': '1', 'name': 'foo.dsc'}]
+        self.assertEqual('\n deadbeef 1 foo.dsc',
+                         changes.get_as_string('checksums-sha1'))
+        del changes['Checksums-Sha256']
+        self.assertFalse('Checksums-Sha256' in changes)
+
+    def test_multivalued_short_rows(self):
+        dsc = deb822.Dsc('Files:\n 0123 1117 foo.dsc\n 4567 2\n')
+        files = dsc['Files']
+        # Rows missing values are the same kind of row, without those names
+        for row in files:
+            self.assertTrue(isinstance(row, deb822._MultivaluedRow))
+        self.assertEqual({'md5sum': '4567', 'size': '2'}, files[1])
+        files[1]['name'] = 'foo.tar.gz'
+        self.assertEqual('\n 0123 1117 foo.dsc\n 4567 2 foo.tar.gz',
+                         dsc.get_as_string('Files'))
+
     def test_case_preserved_in_input(self):
         """The field case in the output from dump() should be the same as the
         input, even if multiple Deb822 objects have been created using
@@ -790,6 +1155,129 @@ Description: python modules to work with Debian-related data formats
         f2.close()
         f1.close()
 
+    def test_decoder(self):
+        with open('test_Sources.mixed_encoding', 'rb') as f:
+            contents = f.read()
+        decoder = deb822.Deb822Decoder()
+        # Not 'ignore', which would hide the warning from other tests on
+        # Python 2
+        with warnings.catch_warnings(record=True):
+            warnings.simplefilter('always')
+            for i in range(3):
+                paragraphs = list(deb822.Sources.iter_paragraphs(
+                    contents, decoder=decoder))
+                self.assertEqual(
+                    six.u('Adeodato Sim\xf3 <dato@net.com.org.es>'),
+                    paragraphs[0]['Maintainer'])
+                self.assertEqual(
+                    six.u('Frank K\xfcster <frank@debian.org>'),
+                    paragraphs[1]['Uploaders'])
+        self.assertEqual(3, decoder.chunks)
+        self.assertEqual(0, decoder.clean_chunks)
+        self.assertEqual(3, decoder.fallbacks)
+        self.assertEqual(1, decoder.detections)
+        self.assertEqual(2, decoder.cache_hits)
+
+        decoder = deb822.Deb822Decoder('utf-8')
+        with open('test_Packages', 'rb') as f:
+            paragraphs = list(deb822.Packages.iter_paragraphs(
+                f, use_apt_pkg=False, decoder=decoder))
+        self.assertEqual(decoder.chunks, decoder.clean_chunks)
+        self.assertEqual(0, decoder.fallbacks)
+        # Values from clean chunks are decoded along with their paragraph
+        self.assertTrue(isinstance(paragraphs[0]._Deb822Dict__parsed._data,
+                                   six.text_type))
+        with open('test_Packages', 'rb') as f:
+            self.assertEqual(paragraphs, list(deb822.Packages.iter_paragraphs(
+                f, use_apt_pkg=False)))
+
+    def test_decoder_pickle(self):
+        import pickle
+        paragraph = next(deb822.Deb822.iter_paragraphs(
+            UNPARSED_PARAGRAPHS_WITH_COMMENTS.encode('utf-8')))
+        self.assertTrue(paragraph._decoder is not None)
+        copy = pickle.loads(pickle.dumps(paragraph))
+        self.assertEqual(paragraph, copy)
+        self.assertEqual('utf-8', copy._decoder.encoding)
+
+    def test_stats(self):
+        with open('test_Packages', 'rb') as f:
+            contents = f.read()
+        expected = list(deb822.Packages.iter_paragraphs(contents,
+                                                        use_apt_pkg=False))
+        stats = deb822.Deb822Stats()
+        self.assertEqual(expected, list(deb822.Packages.iter_paragraphs(
+            contents, use_apt_pkg=False, stats=stats)))
+        self.assertEqual(len(contents), stats.bytes['read'])
+        self.assertEqual(contents.count(b'\n'), stats.lines['split'])
+        self.assertEqual(len(expected), stats.calls['construct'])
+        self.assertEqual(len(expected), stats.calls['scan'])
+        self.assertFalse('armor' in stats.calls)
+        self.assertAlmostEqual(stats.total(), sum(stats.seconds.values()))
+        self.assertTrue(stats.report().startswith('stage'))
+
+        contents = SIGNED_CHECKSUM_CHANGES_FILE % CHECKSUM_CHANGES_FILE
+        stats = deb822.Deb822Stats()
+        changes = list(deb822.Changes.iter_paragraphs(contents, stats=stats))
+        unprofiled = list(deb822.Changes.iter_paragraphs(contents))
+        self.assertEqual(unprofiled, changes)
+        self.assertEqual(unprofiled[0].raw_text, changes[0].raw_text)
+        self.assertEqual(1, stats.calls['armor'])
+        self.assertTrue(stats.bytes['armor'] > 0)
+
+        # Only the stage of the whole run is told apart with workers
+        stats = deb822.Deb822Stats()
+        with open('test_Packages', 'rb') as f:
+            self.assertEqual(expected, list(deb822.Packages.iter_paragraphs(
+                f, workers=2, stats=stats)))
+        self.assertEqual(['workers'], list(stats.calls))
+
+    def test_profile_stages(self):
+        out = StringIO()
+        with deb822.profile_stages(file=out) as stats:
+            deb822.Deb822(UNPARSED_PARAGRAPHS_WITH_COMMENTS)
+            self.assertTrue(stats.lines['skip'] > 0)
+            self.assertEqual(1, stats.calls['construct'])
+            # Reaching the end of the input is not an error
+            self.assertEqual({}, deb822.Deb822([]))
+            with open('test_Sources.mixed_encoding', 'rb') as f:
+                with warnings.catch_warnings(record=True):
+                    warnings.simplefilter('always')
+                    paragraphs = list(deb822.Sources.iter_paragraphs(
+                        f, use_apt_pkg=False))
+                    paragraphs[0]['Maintainer']
+                    paragraphs[1]['Uploaders']
+        self.assertTrue(stats.fallbacks >= 1)
+        self.assertEqual(1, stats.detections)
+        self.assertEqual(1, stats.calls['detect'])
+        self.assertEqual(stats.report(), out.getvalue())
+
+        # Nothing is gathered outside of the block
+        calls = dict(stats.calls)
+        deb822.Deb822(UNPARSED_PARAGRAPHS_WITH_COMMENTS)
+        with open('test_Sources', 'rb') as f:
+            list(deb822.Sources.iter_paragraphs(f, use_apt_pkg=False))
+        self.assertEqual(calls, stats.calls)
+
+    def test_profile_stages_constructor_loop(self):
+        """Constructing paragraphs from a file one after the other reads
+        each of them in turn, whether profiled or not"""
+        def read_all():
+            paragraphs = []
+            with open('test_Packages', 'rb') as f:
+                while True:
+                    paragraph = deb822.Packages(f)
+                    if not paragraph:
+                        break
+                    paragraphs.append(paragraph)
+            return paragraphs
+
+        expected = read_all()
+        self.assertTrue(len(expected) > 1)
+        with deb822.profile_stages(file=False) as stats:
+            self.assertEqual(expected, read_all())
+        self.assertEqual(len(expected), stats.calls['construct'])
+
     def test_bug597249_colon_as_first_value_character(self):
         """Colon should be allowed as the first value character. See #597249.
         """
@@ -852,6 +1340,584 @@ Description: python modules to work with Debian-related data formats
         self._test_iter_paragraphs_comments(paragraphs)
 
 
+class TestCompactDeb822(unittest.TestCase):
+
+    def test_iter_paragraphs(self):
+        # Multivalued fields (e.g. Files in Sources) are not expanded
+        for filename, cls in [('test_Packages', deb822.Packages),
+                              ('test_Sources', deb822.Sources)]:
+            with open(filename, 'rb') as f:
+                expected = list(deb822.Deb822.iter_paragraphs(
+                    f, use_apt_pkg=False))
+            with open(filename, 'rb') as f:
+                compact = list(cls.iter_paragraphs(f, compact=True))
+            self.assertEqual(len(expected), len(compact))
+            for e, c in zip(expected, compact):
+                self.assertTrue(isinstance(c, deb822.CompactDeb822))
+                self.assertEqual(list(e.keys()), list(c.keys()))
+                self.assertEqual(e, c)
+                self.assertEqual(e.dump(), c.dump())
+            # Paragraphs with the same fields share their layout
+            layouts = {}
+            for c in compact:
+                layout = layouts.setdefault(tuple(c), c._layout)
+                self.assertTrue(layout is c._layout)
+
+    def test_iter_paragraphs_fields(self):
+        compact = list(deb822.Packages.iter_paragraphs(
+            UNPARSED_PACKAGE, fields=['Package', 'Version'], compact=True))
+        self.assertEqual(1, len(compact))
+        self.assertEqual(['Package', 'Version'], list(compact[0]))
+
+    def test_lookup(self):
+        c = deb822.CompactDeb822([('Package', 'foo'), ('Depends', 'bar')])
+        self.assertEqual('foo', c['package'])
+        self.assertEqual('bar', c['DEPENDS'])
+        self.assertTrue('PACKAGE' in c)
+        self.assertFalse('Version' in c)
+        self.assertRaises(KeyError, c.__getitem__, 'Version')
+        self.assertEqual(None, c.get('Version'))
+        self.assertEqual(2, len(c))
+        self.assertEqual('Package: foo\nDepends: bar\n', c.dump())
+
+    def test_duplicate_fields(self):
+        c = deb822.CompactDeb822.from_items([('Foo', 'a'), ('Bar', 'b'),
+                                             ('foo', 'c')])
+        self.assertEqual(['Foo', 'Bar'], list(c))
+        self.assertEqual('c', c['Foo'])
+
+    def test_validation(self):
+        self.assertRaises(ValueError, deb822.CompactDeb822,
+                          {'Foo': 'bar\n'})
+        # from_items trusts its input
+        c = deb822.CompactDeb822.from_items([('Foo', 'bar\n')])
+        self.assertEqual('bar\n', c['Foo'])
+
+    def test_read_only(self):
+        c = deb822.CompactDeb822({'Foo': 'bar'})
+        def set_foo():
+            c['Foo'] = 'baz'
+        self.assertRaises(TypeError, set_foo)
+        d = deb822.Deb822(c)
+        d['Foo'] = 'baz'
+        self.assertEqual('bar', c['Foo'])
+
+    def test_decoding(self):
+        c = deb822.CompactDeb822.from_items(
+            [('Maintainer', b'J\xf6rg <j@example.org>')],
+            encoding='iso8859-1')
+        self.assertEqual(six.u('J\xf6rg <j@example.org>'), c['Maintainer'])
+
+    def test_pickle(self):
+        import pickle
+        c = deb822.CompactDeb822({'Foo': 'bar', 'Baz': 'quux'})
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            d = pickle.loads(pickle.dumps(c, protocol))
+            self.assertEqual(c, d)
+            self.assertTrue(c._layout is d._layout)
+
+
+class TestDeb822Table(unittest.TestCase):
+
+    fields = ['Package', 'Section', 'Priority', 'Installed-Size', 'Size']
+
+    def setUp(self):
+        with open('test_Packages', 'rb') as f:
+            self.paragraphs = list(deb822.Packages.iter_paragraphs(
+                f, use_apt_pkg=False))
+        with open('test_Packages', 'rb') as f:
+            self.table = deb822.Deb822Table.from_sequence(f, self.fields)
+
+    def test_columns(self):
+        self.assertEqual(len(self.paragraphs), len(self.table))
+        for field in ['Package', 'Section', 'Priority']:
+            self.assertEqual([p.get(field) for p in self.paragraphs],
+                             list(self.table[field]))
+        self.assertEqual(self.table['installed-size'].values,
+                         self.table['Installed-Size'].values)
+        self.assertTrue('size' in self.table)
+        self.assertFalse('Depends' in self.table)
+        self.assertRaises(KeyError, self.table.__getitem__, 'Depends')
+        self.assertEqual(
+            [dict([(f, p[f]) for f in self.fields])
+             for p in self.paragraphs],
+            [dict([(f, str(v)) for (f, v) in six.iteritems(row)])
+             for row in self.table.rows()])
+
+    def test_integer_column(self):
+        sizes = [int(p['Size']) for p in self.paragraphs]
+        column = self.table['Size']
+        self.assertEqual(sizes, list(column))
+        self.assertEqual(sum(sizes), column.sum())
+        self.assertEqual(min(sizes), column.min())
+        self.assertEqual(max(sizes), column.max())
+        self.assertEqual(len(sizes), column.count())
+        self.assertEqual(None, column.present)
+
+    def test_missing_values(self):
+        table = deb822.Deb822Table(['Section', 'Size'])
+        table.append({'Size': '10'})
+        table.append({'Section': 'net'})
+        table.append({'Section': 'net', 'Size': '5'})
+        self.assertEqual([None, 'net', 'net'], list(table['Section']))
+        self.assertEqual([10, None, 5], list(table['Size']))
+        self.assertEqual({'net': 2}, table['Section'].counts())
+        self.assertEqual(2, table['Size'].count())
+        self.assertEqual(15, table['Size'].sum())
+        self.assertEqual(5, table['Size'].min())
+        self.assertEqual(7.5, table['Size'].mean())
+        self.assertRaises(ValueError, table.append, {'Size': 'big'})
+
+    def test_failed_append(self):
+        table = deb822.Deb822Table(['Section', 'Size', 'Installed-Size'])
+        table.append({'Section': 'net', 'Size': '1', 'Installed-Size': '2'})
+        for bad in [{'Section': 'web', 'Size': '3', 'Installed-Size': 'x'},
+                    {'Section': 'web', 'Size': '3',
+                     'Installed-Size': str(1 << 70)}]:
+            self.assertRaises(ValueError, table.append, bad)
+        # Nothing of the rows that failed was kept
+        self.assertEqual(1, len(table))
+        for column in table.columns():
+            self.assertEqual(1, len(column))
+        self.assertEqual([{'Section': 'net', 'Size': 1,
+                           'Installed-Size': 2}], list(table.rows()))
+
+    def test_empty_mean(self):
+        table = deb822.Deb822Table(['Size'])
+        self.assertRaises(ValueError, table['Size'].mean)
+        table.append({})
+        self.assertRaises(ValueError, table['Size'].mean)
+
+    def test_dictionary_encoding(self):
+        column = self.table['Section']
+        self.assertEqual(['text', 'net'], column.categories)
+        self.assertEqual({'text': 1, 'net': 2}, column.counts())
+        table = deb822.Deb822Table(['Package', 'Section'])
+        table.extend([{'Package': 'p%d' % i, 'Section': 'net'}
+                      for i in range(2000)])
+        self.assertEqual(['p%d' % i for i in range(2000)],
+                         list(table['Package']))
+        self.assertFalse(hasattr(table['Package'], 'categories'))
+        self.assertEqual(['net'], table['Section'].categories)
+        self.assertEqual({'p3': 1}, dict([
+            (k, v) for (k, v) in six.iteritems(table['Package'].counts())
+            if k == 'p3']))
+
+    def test_integer_fields(self):
+        table = deb822.Deb822Table.from_paragraphs(
+            [{'Version': '1', 'Size': '2'}], ['Version', 'Size'],
+            integer_fields=['Version'])
+        self.assertEqual([1], list(table['Version']))
+        self.assertEqual(['2'], list(table['Size']))
+
+    def test_to_numpy(self):
+        try:
+            import numpy
+        except ImportError:
+            return
+        sizes = self.table['Installed-Size'].to_numpy()
+        self.assertEqual(numpy.int64, sizes.dtype)
+        self.assertEqual(list(self.table['Installed-Size']), list(sizes))
+        sections = self.table['Section'].to_numpy()
+        self.assertEqual(list(self.table['Section']), list(sections))
+        records = self.table.to_numpy()
+        self.assertEqual(len(self.table), len(records))
+        self.assertEqual(list(self.table['Package']),
+                         list(records['Package']))
+        self.assertEqual(list(self.table['Size']), list(records['Size']))
+
+        table = deb822.Deb822Table(['Section', 'Size'])
+        table.extend([{'Size': '10'}, {'Section': 'net'}])
+        sizes = table['Size'].to_numpy()
+        self.assertEqual([False, True], list(numpy.ma.getmaskarray(sizes)))
+        self.assertEqual([None, 'net'], list(table['Section'].to_numpy()))
+        self.assertEqual([10, 0], list(table.to_numpy()['Size']))
+
+
+class TestDeb822Writer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'Packages')
+        with open('test_Packages', 'rb') as f:
+            self.paragraphs = list(deb822.Packages.iter_paragraphs(
+                f, use_apt_pkg=False))
+        self.expected = b''.join([p.dump().encode('utf-8') + b'\n'
+                                  for p in self.paragraphs])
+        self.compressions = ['', 'gz', 'bz2']
+        if deb822.lzma is not None:
+            self.compressions.append('xz')
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+    def read(self, name):
+        with open(os.path.join(self.directory, name), 'rb') as f:
+            return f.read()
+
+    def test_write(self):
+        for threads in [True, False]:
+            with deb822.Deb822Writer(self.path, self.compressions,
+                                     buffer_size=100,
+                                     threads=threads) as writer:
+                for paragraph in self.paragraphs:
+                    writer.write(paragraph)
+            self.assertEqual(
+                sorted(['Packages' + writer.suffixes[kind]
+                        for kind in self.compressions]),
+                sorted(os.listdir(self.directory)))
+            self.assertEqual(self.expected, self.read('Packages'))
+            for name in os.listdir(self.directory):
+                parsed = list(deb822.Deb822.iter_paragraphs(
+                    self.read(name), use_apt_pkg=False))
+                self.assertEqual(self.paragraphs, parsed)
+
+    def test_write_dicts(self):
+        with deb822.Deb822Writer(self.path) as writer:
+            writer.write({'Package': 'foo'})
+            writer.write(deb822.Deb822('Package: bar\nEmpty:\n'))
+        self.assertEqual(b'Package: foo\n\nPackage: bar\nEmpty:\n\n',
+                         self.read('Packages'))
+        self.assertRaises(ValueError, writer.write, {'Package': 'baz'})
+
+    def test_release_entries(self):
+        import hashlib
+        self.assertRaises(ValueError, deb822.Deb822Writer, self.path, ['zip'])
+        with deb822.Deb822Writer(self.path, ['', 'gz']) as writer:
+            self.assertRaises(ValueError, writer.release_entries)
+            for paragraph in self.paragraphs:
+                writer.write(paragraph)
+        entries = writer.release_entries(self.directory)
+        self.assertEqual(['MD5Sum', 'SHA1', 'SHA256'], sorted(entries))
+        for field, name in [('MD5Sum', 'md5'), ('SHA1', 'sha1'),
+                            ('SHA256', 'sha256')]:
+            self.assertEqual(['Packages', 'Packages.gz'],
+                             [e['name'] for e in entries[field]])
+            for entry in entries[field]:
+                contents = self.read(entry['name'])
+                self.assertEqual(str(len(contents)), entry['size'])
+                self.assertEqual(hashlib.new(name, contents).hexdigest(),
+                                 entry[field])
+        release = deb822.Release({'Origin': 'Debian'})
+        release['SHA256'] = entries['SHA256']
+        self.assertEqual(
+            ' %s %16d Packages' % (entries['SHA256'][0]['sha256'],
+                                   len(self.expected)),
+            release.dump().splitlines()[2])
+
+    def test_abort(self):
+        def write_and_fail():
+            with deb822.Deb822Writer(self.path, self.compressions,
+                                     encoding='ascii') as writer:
+                writer.write(self.paragraphs[0])
+                writer.write({'Maintainer': six.u('J\xf6rg')})
+        self.assertRaises(UnicodeEncodeError, write_and_fail)
+        self.assertEqual([], os.listdir(self.directory))
+
+
+class TestDeb822Reloader(unittest.TestCase):
+
+    def setUp(self):
+        with open('test_Packages', 'rb') as f:
+            self.contents = f.read()
+        self.blocks = self.contents.rstrip(b'\n').split(b'\n\n')
+
+    def join(self, blocks):
+        return b'\n\n'.join(blocks) + b'\n'
+
+    def test_first_load(self):
+        reloader = deb822.Deb822Reloader(cls=deb822.Packages)
+        added, removed, changed = reloader.load(BytesIO(self.contents))
+        expected = list(deb822.Packages.iter_paragraphs(
+            self.contents, use_apt_pkg=False))
+        self.assertEqual(expected, added)
+        self.assertEqual(expected, reloader.paragraphs)
+        self.assertEqual(([], []), (removed, changed))
+        self.assertTrue(isinstance(added[0], deb822.Packages))
+
+    def test_reload(self):
+        reloader = deb822.Deb822Reloader()
+        reloader.load(self.contents)
+        before = list(reloader.paragraphs)
+        # Drop the first paragraph, change the second, add a new one
+        blocks = [self.blocks[1].replace(b'Priority: optional',
+                                         b'Priority: extra'),
+                  self.blocks[2],
+                  b'Package: new\nVersion: 1']
+        delta = reloader.load(self.join(blocks))
+        self.assertEqual([before[0]], delta.removed)
+        self.assertEqual(1, len(delta.changed))
+        self.assertTrue(delta.changed[0][0] is before[1])
+        self.assertEqual('extra', delta.changed[0][1]['Priority'])
+        self.assertEqual(['new'], [p['Package'] for p in delta.added])
+        self.assertEqual(3, len(reloader.paragraphs))
+        # Unchanged paragraphs are the very same objects
+        self.assertTrue(reloader.paragraphs[1] is before[2])
+        self.assertTrue(reloader.paragraphs[0] is delta.changed[0][1])
+
+        delta = reloader.load(self.join(blocks))
+        self.assertEqual(([], [], []), tuple(delta))
+        self.assertEqual([], reloader.load(b'').added)
+        self.assertEqual([], reloader.paragraphs)
+
+    def test_duplicates(self):
+        reloader = deb822.Deb822Reloader()
+        delta = reloader.load(self.join([self.blocks[0]] * 3))
+        self.assertEqual(3, len(delta.added))
+        self.assertEqual(3, len(set([id(p) for p in delta.added])))
+        first = reloader.paragraphs
+        delta = reloader.load(self.join([self.blocks[0]] * 2))
+        self.assertEqual([first[2]], delta.removed)
+        self.assertEqual(first[:2], reloader.paragraphs)
+
+    def test_key(self):
+        reloader = deb822.Deb822Reloader(key=['Section'],
+                                         fields=['Package', 'Section'])
+        reloader.load(self.contents)
+        delta = reloader.load(self.join(
+            [self.blocks[0].replace(b'Package: a2ps', b'Package: b2ps')]))
+        self.assertEqual(2, len(delta.removed))
+        self.assertEqual(['b2ps'], [new['Package']
+                                    for old, new in delta.changed])
+        self.assertEqual(['Package', 'Section'],
+                         list(reloader.paragraphs[0].keys()))
+
+    def test_failed_load(self):
+        reloader = deb822.Deb822Reloader()
+        reloader.load(self.contents)
+        before = list(reloader.paragraphs)
+
+        class BrokenFile(object):
+            """Gives the first paragraphs, then fails"""
+            def __init__(self, data):
+                self.data = data
+
+            def read(self, size=-1):
+                if self.data is None:
+                    raise IOError('broken')
+                data, self.data = self.data, None
+                return data
+
+        # Fail after some paragraphs of the previous load have been seen
+        part = self.join(self.blocks[:2]) + b'\n'
+        self.assertRaises(IOError, reloader.load, BrokenFile(part))
+        self.assertEqual(before, reloader.paragraphs)
+        # Nothing was forgotten: reloading the same file changes nothing
+        delta = reloader.load(self.contents)
+        self.assertEqual(([], [], []), tuple(delta))
+        for paragraph, previous in zip(reloader.paragraphs, before):
+            self.assertTrue(paragraph is previous)
+
+
+class TestDeb822Index(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.filename = tempfile.mkstemp()
+        fp = os.fdopen(fd, 'wb')
+        with open('test_Packages', 'rb') as f:
+            self.contents = f.read()
+        # Every package appears twice
+        fp.write(self.contents + b'\n' + self.contents)
+        fp.close()
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_lookup(self):
+        with open_utf8('test_Packages') as f:
+            expected = list(deb822.Packages.iter_paragraphs(f))
+        with deb822.Deb822Index(self.filename, cls=deb822.Packages) as index:
+            self.assertEqual([p['Package'] for p in expected], list(index))
+            for p in expected:
+                self.assertTrue(p['Package'] in index)
+                found = index[p['Package']]
+                self.assertTrue(isinstance(found, deb822.Packages))
+                self.assertEqual(p.dump(), found.dump())
+                self.assertEqual(p.relations, found.relations)
+                all_found = index.get_all(p['Package'])
+                self.assertEqual(2, len(all_found))
+                self.assertEqual(p.dump(), all_found[1].dump())
+
+    def test_duplicate_key_field(self):
+        # The last copy of the field is the one the paragraph has
+        with open(self.filename, 'wb') as f:
+            f.write(b'Package: a\nVersion: 1\nPackage: b\n\n'
+                    b'Package: c\n')
+        with deb822.Deb822Index(self.filename) as index:
+            self.assertEqual(['b', 'c'], list(index))
+            self.assertFalse('a' in index)
+            self.assertEqual('b', index['b']['Package'])
+            self.assertEqual('1', index['b']['Version'])
+
+    def test_failed_build(self):
+        class BrokenCache(deb822.Deb822Cache):
+            def load(self, path, kind, build):
+                raise IOError('broken')
+
+        if not os.path.isdir('/proc/self/fd'):
+            return
+        before = len(os.listdir('/proc/self/fd'))
+        # Keeping the tracebacks keeps the half-made indexes alive
+        errors = []
+        for i in range(3):
+            try:
+                deb822.Deb822Index(self.filename,
+                                   cache=BrokenCache(tempfile.gettempdir()))
+            except IOError:
+                errors.append(sys.exc_info())
+        self.assertEqual(3, len(errors))
+        # Neither the file nor its map was left open
+        self.assertEqual(before, len(os.listdir('/proc/self/fd')))
+
+    def test_locate(self):
+        with deb822.Deb822Index(self.filename) as index:
+            offset, length = index.locate('a2ps')[0]
+            self.assertTrue(self.contents[offset:].startswith(
+                b'Package: a2ps\n'))
+            self.assertEqual(b'\n\n', self.contents[offset + length:
+                                                    offset + length + 2])
+
+    def test_missing(self):
+        with deb822.Deb822Index(self.filename) as index:
+            self.assertFalse('no-such-package' in index)
+            self.assertRaises(KeyError, index.__getitem__, 'no-such-package')
+            self.assertEqual([], index.get_all('no-such-package'))
+
+    def test_other_field(self):
+        with deb822.Deb822Index(self.filename, field='filename') as index:
+            p = index['pool/main/z/zssh/zssh_1.5c.debian.1-3_i386.deb']
+            self.assertEqual('zssh', p['Package'])
+
+    def test_empty_file(self):
+        fd, filename = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            with deb822.Deb822Index(filename) as index:
+                self.assertEqual(0, len(index))
+        finally:
+            os.remove(filename)
+
+    def test_compressed_file(self):
+        import bz2
+        fd, filename = tempfile.mkstemp()
+        os.write(fd, bz2.compress(self.contents))
+        os.close(fd)
+        try:
+            self.assertRaises(ValueError, deb822.Deb822Index, filename)
+        finally:
+            os.remove(filename)
+
+
+class TestDeb822Cache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'Packages')
+        with open('test_Packages', 'rb') as f:
+            self.contents = f.read()
+        self.write(self.contents)
+        # Keep the default cache directory out of the user's home
+        self.saved_cache_home = os.environ.get('XDG_CACHE_HOME')
+        os.environ['XDG_CACHE_HOME'] = os.path.join(self.directory, 'xdg')
+
+    def tearDown(self):
+        import shutil
+        if self.saved_cache_home is None:
+            del os.environ['XDG_CACHE_HOME']
+        else:
+            os.environ['XDG_CACHE_HOME'] = self.saved_cache_home
+        shutil.rmtree(self.directory)
+
+    def write(self, contents):
+        with open(self.filename, 'wb') as f:
+            f.write(contents)
+
+    def parse(self, cache, **kwargs):
+        with open(self.filename, 'rb') as f:
+            return [p.dump() for p in
+                    deb822.Packages.iter_paragraphs(f, cache=cache, **kwargs)]
+
+    @staticmethod
+    def _fail(path):
+        raise AssertionError('cache was rebuilt')
+
+    def test_hit(self):
+        cache = deb822.Deb822Cache()
+        expected = self.parse(None)
+        self.assertEqual(expected, self.parse(cache))
+        self.assertTrue(os.path.exists(cache.sidecar(self.filename,
+                                                     'paragraphs')))
+        # The second time around, nothing is parsed
+        cache.load(self.filename, 'paragraphs', self._fail)
+        self.assertEqual(expected, self.parse(cache))
+
+    def test_fields(self):
+        cache = deb822.Deb822Cache()
+        self.parse(cache)
+        with open(self.filename, 'rb') as f:
+            for p in deb822.Packages.iter_paragraphs(
+                    f, fields=['Package', 'Version'], cache=cache):
+                self.assertEqual(['Package', 'Version'], list(p.keys()))
+
+    def test_where(self):
+        cache = deb822.Deb822Cache()
+        where = {'Section': re.compile('^(text|net)$')}
+        expected = self.parse(None, where=where)
+        self.assertEqual(3, len(expected))
+        self.assertEqual(expected, self.parse(cache, where=where))
+
+    def test_stale(self):
+        cache = deb822.Deb822Cache(verify_content=True)
+        self.parse(cache)
+        contents = self.contents.replace(b'Package: a2ps', b'Package: a3ps')
+        self.write(contents)
+        self.assertRaises(AssertionError, cache.load, self.filename,
+                          'paragraphs', self._fail)
+        parsed = self.parse(cache)
+        self.assertTrue(parsed[0].startswith('Package: a3ps\n'))
+
+    def test_directory(self):
+        cache_dir = os.path.join(self.directory, 'cache')
+        os.mkdir(cache_dir)
+        try:
+            cache = deb822.Deb822Cache(cache_dir)
+            self.parse(cache)
+            sidecar = cache.sidecar(self.filename, 'paragraphs')
+            self.assertEqual(cache_dir, os.path.dirname(sidecar))
+            self.assertTrue(os.path.exists(sidecar))
+        finally:
+            for name in os.listdir(cache_dir):
+                os.remove(os.path.join(cache_dir, name))
+            os.rmdir(cache_dir)
+
+    def test_default_directory(self):
+        cache = deb822.Deb822Cache()
+        default = os.path.join(self.directory, 'xdg', 'python-debian')
+        self.assertEqual(default, cache.directory)
+        self.parse(cache)
+        sidecar = cache.sidecar(self.filename, 'paragraphs')
+        self.assertEqual(default, os.path.dirname(sidecar))
+        # Nothing is left next to the file, and no lock files anywhere
+        self.assertEqual(['Packages', 'xdg'], sorted(os.listdir(
+            self.directory)))
+        self.assertEqual([os.path.basename(sidecar)], os.listdir(default))
+        os.environ['XDG_CACHE_HOME'] = 'relative'
+        self.assertEqual(
+            os.path.join(os.path.expanduser('~'), '.cache', 'python-debian'),
+            deb822.Deb822Cache().directory)
+
+    def test_index(self):
+        cache = deb822.Deb822Cache()
+        with deb822.Deb822Index(self.filename, cache=cache) as index:
+            expected = [(value, index.locate(value)) for value in index]
+        with deb822.Deb822Index(self.filename, cache=cache) as index:
+            self.assertEqual(expected,
+                             [(value, index.locate(value)) for value in index])
+            self.assertEqual('zssh', index['zssh']['Package'])
+
+
 class TestPkgRelations(unittest.TestCase):
 
     def test_packages(self):
@@ -974,6 +2040,206 @@ class TestPkgRelations(unittest.TestCase):
         self.assertEqual(rel2, pkg2.relations)
         f.close()
 
+    def test_cache(self):
+        raw = 'emacs | emacsen, make, procps [!hurd-i386], make (>= 3.81)'
+        saved = deb822.PkgRelation.cache
+        cache = deb822.PkgRelation.cache = deb822.PkgRelationCache()
+        try:
+            expected = deb822.PkgRelation._parse_relations(raw)
+            rels = deb822.PkgRelation.parse_relations(raw)
+            self.assertEqual(expected, rels)
+            self.assertEqual((0, 1, 0, 5), (cache.hits, cache.misses,
+                                            cache.atom_hits,
+                                            cache.atom_misses))
+            # Results are copies, which can be changed
+            rels[0][0]['name'] = 'vim'
+            rels[2][0]['arch'].append((True, 'amd64'))
+            rels.pop()
+            self.assertEqual(expected,
+                             deb822.PkgRelation.parse_relations(raw))
+            self.assertEqual(1, cache.hits)
+            deb822.PkgRelation.parse_relations('make, emacs')
+            self.assertEqual((1, 2, 2, 5), (cache.hits, cache.misses,
+                                            cache.atom_hits,
+                                            cache.atom_misses))
+            self.assertEqual({'hits': 1, 'misses': 2, 'atom_hits': 2,
+                              'atom_misses': 5, 'fields': 2, 'atoms': 5},
+                             cache.stats())
+            cache.clear()
+            self.assertEqual(0, len(cache))
+            self.assertEqual(0, cache.hits + cache.misses)
+
+            deb822.PkgRelation.cache = None
+            self.assertEqual(expected,
+                             deb822.PkgRelation.parse_relations(raw))
+            self.assertEqual(0, cache.misses)
+        finally:
+            deb822.PkgRelation.cache = saved
+
+    def test_cache_bounded(self):
+        saved = deb822.PkgRelation.cache
+        cache = deb822.PkgRelation.cache = deb822.PkgRelationCache(4)
+        try:
+            for i in range(10):
+                deb822.PkgRelation.parse_relations('foo%d, bar' % i)
+                self.assertTrue(len(cache.fields) <= 4)
+                self.assertTrue(len(cache.atoms) <= 4)
+            self.assertEqual([[{'name': 'foo9', 'version': None,
+                                'arch': None}],
+                              [{'name': 'bar', 'version': None,
+                                'arch': None}]],
+                             deb822.PkgRelation.parse_relations('foo9, bar'))
+        finally:
+            deb822.PkgRelation.cache = saved
+
+    def test_cache_unparsed(self):
+        saved = (deb822.PkgRelation.cache, sys.stderr)
+        cache = deb822.PkgRelation.cache = deb822.PkgRelationCache()
+        try:
+            for i in range(2):
+                sys.stderr = StringIO()
+                self.assertEqual(
+                    [[{'name': 'foo (>=', 'version': None, 'arch': None}],
+                     [{'name': 'bar', 'version': None, 'arch': None}]],
+                    deb822.PkgRelation.parse_relations('foo (>= , bar'))
+                self.assertTrue('"foo (>="' in sys.stderr.getvalue())
+            self.assertEqual(0, len(cache.fields))
+        finally:
+            deb822.PkgRelation.cache, sys.stderr = saved
+
+    def test_cache_threads(self):
+        try:
+            import threading
+        except ImportError:
+            return
+        saved = deb822.PkgRelation.cache
+        cache = deb822.PkgRelation.cache = deb822.PkgRelationCache(64)
+        fields = ['libfoo%d (>= %d.0), libc6 | libc6.1, bar [!i386]'
+                  % (i % 100, i % 7) for i in range(2000)]
+        expected = [deb822.PkgRelation._parse_relations(raw)
+                    for raw in fields]
+        failures = []
+
+        def parse():
+            for raw, rels in zip(fields, expected):
+                if deb822.PkgRelation.parse_relations(raw) != rels:
+                    failures.append(raw)
+
+        try:
+            threads = [threading.Thread(target=parse) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            deb822.PkgRelation.cache = saved
+        self.assertEqual([], failures)
+        self.assertEqual(8000, cache.hits + cache.misses)
+
+    def test_compact(self):
+        for name, cls in [('test_Packages', deb822.Packages),
+                          ('test_Sources', deb822.Sources)]:
+            f = open_utf8(name)
+            for pkg in cls.iter_paragraphs(f):
+                for field in pkg._relationship_fields:
+                    if field not in pkg:
+                        self.assertEqual((), pkg.compact_relations[field])
+                        continue
+                    rels = deb822.PkgRelation.parse_relations(pkg[field])
+                    compact = pkg.compact_relations[field]
+                    self.assertEqual(
+                        compact, deb822.PkgRelation.parse_compact(pkg[field]))
+                    self.assertEqual(compact,
+                                     deb822.PkgRelation.to_compact(rels))
+                    self.assertEqual(rels,
+                                     deb822.PkgRelation.to_dicts(compact))
+                    self.assertEqual(deb822.PkgRelation.str(rels),
+                                     deb822.PkgRelation.str(compact))
+            f.close()
+
+    def test_compact_atoms(self):
+        import pickle
+        rels = deb822.PkgRelation.parse_compact(
+            'emacs | emacsen, procps [!hurd-i386 amd64], make (>= 3.81), '
+            'make (> 3)')
+        emacs, procps, make, old_make = rels[0][0], rels[1][0], rels[2][0], \
+            rels[3][0]
+        self.assertEqual(2, len(rels[0]))
+        self.assertEqual(('emacs', None, None, None), emacs)
+        self.assertEqual(((False, 'hurd-i386'), (True, 'amd64')),
+                         procps.arch)
+        self.assertEqual('procps [!hurd-i386 amd64]', str(procps))
+        self.assertTrue(make.op is deb822.PkgRelationOp.GE)
+        self.assertEqual('3.81', make.version)
+        self.assertTrue(make.name is old_make.name)
+        self.assertTrue(old_make.op is deb822.PkgRelationOp.get('>'))
+        self.assertEqual('make (> 3)', str(old_make))
+        self.assertRaises(AttributeError, setattr, make, 'name', 'm4')
+        self.assertEqual({'name': 'make', 'version': ('>=', '3.81'),
+                          'arch': None}, make.to_dict())
+        self.assertEqual(procps, deb822.PkgRelationAtom.from_dict(
+            procps.to_dict()))
+        for atom in [emacs, procps, make, old_make]:
+            self.assertEqual(atom, pickle.loads(pickle.dumps(atom)))
+        self.assertTrue(pickle.loads(pickle.dumps(make)).op
+                        is deb822.PkgRelationOp.GE)
+
+        GE = deb822.PkgRelationOp.GE
+        self.assertEqual([False, True, True],
+                         [GE.satisfied_by(c) for c in [-2, 0, 3]])
+        self.assertEqual([True, False, False],
+                         [deb822.PkgRelationOp.LT.satisfied_by(c)
+                          for c in [-1, 0, 1]])
+        self.assertTrue(deb822.PkgRelationOp.get('>').satisfied_by(0))
+        self.assertRaises(ValueError,
+                          deb822.PkgRelationOp.get('=>').satisfied_by, 0)
+
+    def test_lazy_relations(self):
+        import pickle
+        saved = deb822.PkgRelation.cache
+        cache = deb822.PkgRelation.cache = deb822.PkgRelationCache()
+        try:
+            f = open_utf8('test_Packages')
+            pkg = next(deb822.Packages.iter_paragraphs(f))
+            f.close()
+            # Without dict copies going through keys, parsing can't wait
+            lazy = deb822._dict_copies_use_keys
+            self.assertEqual([], pkg.relations['breaks'])
+            self.assertEqual(0 if lazy else 3, cache.misses)
+            self.assertEqual('file', pkg.relations['Depends'][0][0]['name'])
+            self.assertEqual(1 if lazy else 3, cache.misses)
+            self.assertTrue('recommends' in pkg.relations)
+            self.assertEqual(1 if lazy else 3, cache.misses)
+            # Looking at all the values parses all the fields
+            self.assertEqual(3, len([rels for rels in
+                                     pkg.relations.values() if rels]))
+            self.assertEqual(3, cache.misses)
+            self.assertEqual(pkg.relations,
+                             pickle.loads(pickle.dumps(pkg.relations)))
+        finally:
+            deb822.PkgRelation.cache = saved
+
+    def test_lazy_relations_copies(self):
+        f = open_utf8('test_Packages')
+        pkg = next(deb822.Packages.iter_paragraphs(f))
+        f.close()
+        keys = sorted(pkg.relations)
+        self.assertEqual(len(keys), len(pkg.relations))
+        self.assertEqual(keys, sorted(pkg.relations.keys()))
+        self.assertEqual(keys, sorted(dict(pkg.relations)))
+        depends = dict(pkg.relations)['depends']
+        self.assertEqual('file', depends[0][0]['name'])
+        copied = {}
+        copied.update(pkg.compact_relations)
+        self.assertEqual('file', copied['depends'][0][0].name)
+        if sys.version_info >= (3, 5):
+            unpacked = eval('{**pkg.relations}')
+            self.assertEqual(depends, unpacked['depends'])
+        for rels in dict(pkg.relations).values():
+            self.assertTrue(rels is not None)
+        del pkg.relations['recommends']
+        self.assertFalse('recommends' in pkg.relations)
+
 
 class TestGpgInfo(unittest.TestCase):
 
@@ -1048,5 +2314,179 @@ class TestGpgInfo(unittest.TestCase):
         self._validate_gpg_info(gpg_info)
 
 
+# Behaves like gpgv --status-fd 1 without checking anything: the signature
+# is bad if the data says BAD, and it takes a while if the data says SLOW.
+GPGV_STUB = """
+import sys, time
+data = getattr(sys.stdin, 'buffer', sys.stdin).read()
+if b'SLOW' in data:
+    time.sleep(0.8)
+if b'BAD' in data:
+    print('[GNUPG:] BADSIG D14219877A786561 John Wright')
+else:
+    print('[GNUPG:] GOODSIG D14219877A786561 John Wright')
+    print('[GNUPG:] VALIDSIG 8FEFE900783CF175827C2F65D14219877A786561')
+"""
+
+
+class TestGpgVerifyMany(unittest.TestCase):
+
+    def setUp(self):
+        self.executable = [sys.executable, '-c', GPGV_STUB]
+        fd, self.filename = tempfile.mkstemp()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(b'signed\nBAD\n')
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def verify(self, items, **kwargs):
+        return list(deb822.GpgInfo.verify_many(
+            items, keyrings=['/nonexistent'], executable=self.executable,
+            **kwargs))
+
+    def test_results(self):
+        missing = os.path.join(os.path.dirname(self.filename), 'missing', 'x')
+        items = [b'signed\nSLOW\n', b'signed\n', self.filename,
+                 memoryview(b'signed\n'), missing]
+        results = self.verify(items, max_workers=2)
+        self.assertEqual(list(range(5)),
+                         sorted([result.index for result in results]))
+        # The slow one is still running when the others are done
+        self.assertEqual(0, results[-1].index)
+        by_index = dict([(result.index, result) for result in results])
+        for i, item in enumerate(items):
+            self.assertTrue(by_index[i].item is item)
+        self.assertEqual([True, True, False, True, False],
+                         [by_index[i].valid() for i in range(5)])
+        self.assertEqual(['D14219877A786561', 'John Wright'],
+                         by_index[2].info['BADSIG'])
+        self.assertTrue(by_index[4].info is None)
+        self.assertTrue(isinstance(by_index[4].error, EnvironmentError))
+
+        # One at a time, in order
+        results = self.verify(iter(items[1:4]), max_workers=1)
+        self.assertEqual([0, 1, 2], [result.index for result in results])
+        self.assertEqual([True, False, True],
+                         [result.valid() for result in results])
+
+    def test_items_error(self):
+        def items():
+            yield b'signed\n'
+            raise ValueError('no more')
+        self.assertRaises(ValueError, self.verify, items(), max_workers=3)
+
+    def test_missing_executable(self):
+        results = deb822.GpgInfo.verify_many(
+            [b'signed\n'] * 3, keyrings=['/nonexistent'],
+            executable=['/nonexistent/gpgv'])
+        for result in results:
+            self.assertFalse(result.valid())
+            self.assertTrue(isinstance(result.error, EnvironmentError))
+
+
+class TestGpgInfoCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = deb822.GpgInfoCache(os.path.join(self.directory, 'cache'),
+                                         max_entries=2)
+        self.keyring = os.path.join(self.directory, 'keyring.gpg')
+        with open(self.keyring, 'wb') as f:
+            f.write(b'keys')
+        self.calls = os.path.join(self.directory, 'calls')
+        # Counts its calls in self.calls
+        self.executable = [sys.executable, '-c', GPGV_STUB + (
+            "open(%r, 'a').write('x')\n" % self.calls)]
+        self.data = (SIGNED_CHECKSUM_CHANGES_FILE
+                     % CHECKSUM_CHANGES_FILE).encode('utf-8')
+
+    def tearDown(self):
+        import shutil
+        shutil.rmtree(self.directory)
+
+    def count_calls(self):
+        if not os.path.exists(self.calls):
+            return 0
+        with open(self.calls) as f:
+            return len(f.read())
+
+    def verify(self, data):
+        return deb822.GpgInfo.from_sequence(
+            data, keyrings=[self.keyring], executable=self.executable,
+            cache=self.cache)
+
+    def test_cache(self):
+        info = self.verify(self.data)
+        self.assertTrue(info.valid())
+        self.assertEqual(1, self.count_calls())
+        self.assertEqual(info, self.verify(self.data))
+        self.assertEqual(info, self.verify(BytesIO(self.data)))
+        self.assertEqual(1, self.count_calls())
+        self.assertEqual(1, len(self.cache))
+
+        # Changing the keyring changes the key
+        with open(self.keyring, 'ab') as f:
+            f.write(b'more keys')
+        self.assertEqual(info, self.verify(self.data))
+        self.assertEqual(2, self.count_calls())
+
+        # With a new cache on the same directory
+        cache = deb822.GpgInfoCache(self.cache.directory)
+        results = list(deb822.GpgInfo.verify_many(
+            [self.data] * 3, keyrings=[self.keyring],
+            executable=self.executable, cache=cache))
+        self.assertEqual([True] * 3, [result.valid() for result in results])
+        self.assertEqual(2, self.count_calls())
+
+    def test_get_gpg_info(self):
+        changes = deb822.Changes(self.data)
+        key = self.cache.key(self.data, [self.keyring])
+        self.cache.put(key, ('[GNUPG:] GOODSIG D14219877A786561 x\n', ''))
+        info = changes.get_gpg_info(keyrings=[self.keyring], cache=self.cache)
+        self.assertEqual(['D14219877A786561', 'x'], info['GOODSIG'])
+
+    def test_eviction(self):
+        self.cache.max_entries = 10
+        for i in range(10):
+            self.verify(b'signed\n%d\n' % i)
+        # Using it makes it the most recently used one
+        self.verify(b'signed\n0\n')
+        self.assertEqual(10, self.count_calls())
+        self.assertEqual(10, len(self.cache))
+        # Going past max_entries evicts down to 90% of it
+        self.verify(b'signed\n10\n')
+        self.assertEqual(11, self.count_calls())
+        self.assertEqual(9, len(self.cache))
+        self.verify(b'signed\n0\n')
+        self.verify(b'signed\n10\n')
+        self.assertEqual(11, self.count_calls())
+        self.verify(b'signed\n1\n')
+        self.verify(b'signed\n2\n')
+        self.assertEqual(13, self.count_calls())
+        self.cache.clear()
+        self.assertEqual(0, len(self.cache))
+
+    def test_only_definitive_results(self):
+        # gpgv failing without saying anything about the signature
+        failing = [sys.executable, '-c',
+                   "import sys; open(%r, 'a').write('x'); sys.exit(2)"
+                   % self.calls]
+        for i in range(2):
+            info = deb822.GpgInfo.from_sequence(
+                self.data, keyrings=[self.keyring], executable=failing,
+                cache=self.cache)
+            self.assertFalse(info.is_definitive())
+        self.assertEqual(2, self.count_calls())
+        self.assertEqual(0, len(self.cache))
+
+        # A bad signature is as definitive as a good one, whatever the
+        # exit status
+        self.verify(b'BAD\n')
+        self.assertTrue(self.verify(b'BAD\n').is_definitive())
+        self.assertEqual(3, self.count_calls())
+        self.assertEqual(1, len(self.cache))
+
+
 if __name__ == '__main__':
     unittest.main()
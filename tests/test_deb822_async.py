@@ -0,0 +1,135 @@
+#! /usr/bin/python3
+## vim: fileencoding=utf-8
+
+# Tests for Deb822.aiter_paragraphs, which needs Python >= 3.6
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+import asyncio
+import gzip
+import sys
+import unittest
+
+sys.path.insert(0, '../lib/')
+
+from debian import deb822
+
+
+class Chunks(object):
+    """An asynchronous iterable of the pieces of data of the given size"""
+
+    def __init__(self, data, size):
+        self.pieces = [data[i:i + size] for i in range(0, len(data), size)]
+
+    async def __aiter__(self):
+        for piece in self.pieces:
+            await asyncio.sleep(0)
+            yield piece
+
+
+class TestAiterParagraphs(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        with open('test_Packages', 'rb') as f:
+            self.contents = f.read()
+        self.expected = list(deb822.Packages.iter_paragraphs(
+            self.contents, use_apt_pkg=False))
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def collect(self, stream, cls=deb822.Packages, **kwargs):
+        async def collect():
+            return [p async for p in cls.aiter_paragraphs(stream, **kwargs)]
+        return self.loop.run_until_complete(collect())
+
+    def test_stream_reader(self):
+        async def feed(reader):
+            for i in range(0, len(self.contents), 100):
+                reader.feed_data(self.contents[i:i + 100])
+                await asyncio.sleep(0)
+            reader.feed_eof()
+
+        reader = asyncio.StreamReader()
+        feeding = self.loop.create_task(feed(reader))
+        paragraphs = self.collect(reader)
+        self.loop.run_until_complete(feeding)
+        self.assertEqual(self.expected, paragraphs)
+        self.assertTrue(all(isinstance(p, deb822.Packages)
+                            for p in paragraphs))
+
+    def test_chunks(self):
+        for size in [1, 7, 1000, len(self.contents)]:
+            self.assertEqual(self.expected,
+                             self.collect(Chunks(self.contents, size)))
+
+    def test_sources(self):
+        with open('test_Sources', 'rb') as f:
+            contents = f.read()
+        expected = list(deb822.Sources.iter_paragraphs(contents,
+                                                       use_apt_pkg=False))
+        paragraphs = self.collect(Chunks(contents, 50), cls=deb822.Sources)
+        self.assertEqual(expected, paragraphs)
+        self.assertEqual(expected[0]['Files'], paragraphs[0]['Files'])
+
+    def test_options(self):
+        paragraphs = self.collect(Chunks(self.contents, 64),
+                                  fields=['Package', 'Section'],
+                                  where={'Section': 'net'})
+        self.assertEqual([{'Package': p['Package'], 'Section': 'net'}
+                          for p in self.expected if p['Section'] == 'net'],
+                         paragraphs)
+        paragraphs = self.collect(Chunks(self.contents, 64), compact=True)
+        self.assertTrue(isinstance(paragraphs[0], deb822.CompactDeb822))
+        self.assertEqual(self.expected[0]['Package'], paragraphs[0]['Package'])
+
+    def test_compressed(self):
+        paragraphs = self.collect(Chunks(gzip.compress(self.contents * 2), 30))
+        self.assertEqual(self.expected * 2, paragraphs)
+        # Concatenated members, and zero padding after them
+        data = gzip.compress(self.contents) * 2 + b'\0' * 100
+        paragraphs = self.collect(Chunks(data, 30))
+        self.assertEqual(self.expected * 2, paragraphs)
+
+    def test_yields_to_loop(self):
+        ticks = []
+        seen = []
+
+        async def ticker():
+            while len(seen) < 3:
+                ticks.append(len(seen))
+                await asyncio.sleep(0)
+
+        async def consume():
+            # All the data is there at once: only the parser's own
+            # yielding lets the ticker run
+            reader = asyncio.StreamReader()
+            reader.feed_data(self.contents)
+            reader.feed_eof()
+            async for p in deb822.Packages.aiter_paragraphs(reader):
+                seen.append(p)
+
+        ticking = self.loop.create_task(ticker())
+        self.loop.run_until_complete(consume())
+        self.loop.run_until_complete(ticking)
+        self.assertEqual(3, len(seen))
+        self.assertTrue(set([1, 2]) <= set(ticks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,6 +20,7 @@
 
 from __future__ import absolute_import
 
+import random
 import sys
 import unittest
 
@@ -27,6 +28,8 @@ sys.path.insert(0, '../lib/')
 
 from debian import debian_support
 from debian.debian_support import *
+if debian_support._have_apt_pkg:
+    import apt_pkg
 
 
 class VersionTests(unittest.TestCase):
@@ -171,6 +174,121 @@ class VersionTests(unittest.TestCase):
         self._test_comparison('1.5~rc1', '<', '1.5~rc2')
         self._test_comparison('1.5~rc1', '>', '1.5~dev0')
 
+    def test_sort_key(self):
+        for cls in self.test_classes:
+            v = cls('1:1.4.1-1')
+            self.assertEqual((1, ('\x02', 1, '\xae\x02', 4, '\xae\x02', 1,
+                                  '\x02'),
+                              ('\x02', 1, '\x02')),
+                             v.sort_key())
+            self.assertTrue(v.sort_key() is v.sort_key())
+            v.upstream_version = '1.4~rc1'
+            self.assertTrue(v.sort_key() < cls('1:1.4-1').sort_key())
+            v.epoch = None
+            self.assertEqual(cls('1.4~rc1-1').sort_key(), v.sort_key())
+            self.assertEqual(cls('1.0-0').sort_key(), cls('1.00').sort_key())
+            self.assertEqual(cls('1a').sort_key(), cls('1a0').sort_key())
+        versions = [NativeVersion(v) for v in
+                    ['1.0', '1:0.1', '1.0~rc1', '1.0+b1', '1.0-1', '0.9a',
+                     '1.0a', '1.0~~', '1.0.0', '1.0-0.1']]
+        self.assertEqual(
+            ['0.9a', '1.0~~', '1.0~rc1', '1.0', '1.0-0.1', '1.0-1', '1.0a',
+             '1.0+b1', '1.0.0', '1:0.1'],
+            [str(v) for v in sorted(versions, key=NativeVersion.sort_key)])
+        self.assertEqual('1:0.1', str(max(versions)))
+
+    @staticmethod
+    def _verrevcmp(a, b):
+        """The comparison of upstream versions or Debian revisions of dpkg
+        (and so apt), in lib/dpkg/version.c"""
+        def order(c):
+            if not c or c.isdigit():
+                return 0
+            elif c.isalpha():
+                return ord(c)
+            elif c == '~':
+                return -1
+            return ord(c) + 256
+
+        a += '\0'
+        b += '\0'
+        i = j = 0
+        while a[i] != '\0' or b[j] != '\0':
+            while (a[i] != '\0' and not a[i].isdigit()) or \
+                    (b[j] != '\0' and not b[j].isdigit()):
+                ac = order(a[i].strip('\0'))
+                bc = order(b[j].strip('\0'))
+                if ac != bc:
+                    return ac - bc
+                i += 1
+                j += 1
+            while a[i] == '0':
+                i += 1
+            while b[j] == '0':
+                j += 1
+            first_diff = 0
+            while a[i].isdigit() and b[j].isdigit():
+                if not first_diff:
+                    first_diff = ord(a[i]) - ord(b[j])
+                i += 1
+                j += 1
+            if a[i].isdigit():
+                return 1
+            if b[j].isdigit():
+                return -1
+            if first_diff:
+                return first_diff
+        return 0
+
+    def _dpkg_compare(self, a, b):
+        if int(a.epoch or '0') != int(b.epoch or '0'):
+            return int(a.epoch or '0') - int(b.epoch or '0')
+        return (self._verrevcmp(a.upstream_version, b.upstream_version) or
+                self._verrevcmp(a.debian_revision or '',
+                                b.debian_revision or ''))
+
+    def test_random_comparisons(self):
+        """Test NativeVersion against dpkg's algorithm (and apt_pkg, if it
+        is there) on random versions"""
+        rng = random.Random(0)
+        chars = '0123456789' * 3 + 'abzAZ.+~'
+
+        def run(low, high):
+            return ''.join([rng.choice(chars)
+                            for i in range(rng.randint(low, high))])
+
+        versions = []
+        while len(versions) < 2000:
+            version = str(rng.randint(0, 12)) + run(0, 6)
+            if rng.random() < 0.3:
+                version = '%d:%s' % (rng.randint(0, 2), version)
+            if rng.random() < 0.6:
+                version += '-' + run(1, 4)
+            if rng.random() < 0.3:
+                version += rng.choice(['0', '~', '.0', 'a', '+', '~~'])
+            try:
+                versions.append(NativeVersion(version))
+            except ValueError:
+                pass
+
+        def sign(n):
+            return (n > 0) - (n < 0)
+
+        for i in range(20000):
+            a = rng.choice(versions)
+            b = rng.choice(versions)
+            if rng.random() < 0.2:
+                b = NativeVersion(str(a))
+            expected = sign(self._dpkg_compare(a, b))
+            self.assertEqual(expected, sign(a._compare(b)), (a, b))
+            self.assertEqual(expected, sign(version_compare(a, b)), (a, b))
+            if debian_support._have_apt_pkg:
+                self.assertEqual(expected, sign(apt_pkg.version_compare(
+                    str(a), str(b))), (a, b))
+        by_key = sorted(versions, key=NativeVersion.sort_key)
+        for a, b in zip(by_key, by_key[1:]):
+            self.assertTrue(self._dpkg_compare(a, b) <= 0, (a, b))
+
 
 class ReleaseTests(unittest.TestCase):
     """Tests for debian_support.Release"""
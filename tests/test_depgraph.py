@@ -0,0 +1,389 @@
+#! /usr/bin/python
+## vim: fileencoding=utf-8
+
+# Tests for debian.depgraph
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License
+# as published by the Free Software Foundation; version 2
+# dated June, 1991.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA  02110-1301, USA.
+
+from __future__ import absolute_import
+
+import sys
+import unittest
+
+sys.path.insert(0, '../lib/')
+
+from debian import deb822
+from debian import depgraph
+
+
+PACKAGES = """\
+Package: app
+Version: 1.0-1
+Architecture: amd64
+Depends: libfoo1 (>= 1.2), mail-transport-agent | exim4, app-data
+Recommends: app-doc
+
+Package: libfoo1
+Version: 1.3-1
+Architecture: amd64
+Pre-Depends: libc6
+Depends: libc6 (>= 2.14)
+
+Package: libc6
+Version: 2.19-1
+Architecture: amd64
+Depends: libgcc1
+Breaks: app (<< 0.9)
+
+Package: libgcc1
+Version: 4.9-1
+Architecture: amd64
+Depends: libc6
+
+Package: postfix
+Version: 2.11-1
+Architecture: amd64
+Provides: mail-transport-agent
+Conflicts: mail-transport-agent
+Depends: libc6
+
+Package: exim4
+Version: 4.84-1
+Architecture: all
+Provides: mail-transport-agent
+Conflicts: mail-transport-agent
+
+Package: app-data
+Version: 1.0-1
+Architecture: all
+
+Package: app-data
+Version: 0.9-1
+Architecture: all
+"""
+
+
+class TestPackageUniverse(unittest.TestCase):
+
+    def setUp(self):
+        self.universe = depgraph.PackageUniverse(
+            deb822.Packages.iter_paragraphs(PACKAGES.splitlines()))
+
+    def id(self, name):
+        return self.universe.ids(name)[0]
+
+    def names(self, pkgs):
+        return sorted([self.universe.names[pkg] for pkg in pkgs])
+
+    def test_fields(self):
+        u = self.universe
+        self.assertEqual(8, len(u))
+        self.assertEqual('app', u.names[0])
+        self.assertEqual('1.3-1', u.versions[1])
+        self.assertEqual('all', u.architectures[5])
+        self.assertEqual((6, 7), u.ids('app-data'))
+        self.assertEqual((), u.ids('mail-transport-agent'))
+        self.assertEqual(deb822.PkgRelation.parse_compact('libc6 (>= 2.14)'),
+                         u.relations['depends'][1])
+        self.assertEqual((), u.relations['recommends'][1])
+
+    def test_providers(self):
+        u = self.universe
+        self.assertEqual(['exim4', 'postfix'],
+                         self.names(u.providers('mail-transport-agent')))
+        self.assertEqual((), u.providers('libc6'))
+        self.assertEqual(['exim4', 'exim4', 'postfix'],
+                         self.names(u.candidates('exim4')
+                                    + u.candidates('mail-transport-agent')))
+
+    def test_edges(self):
+        u = self.universe
+        self.assertEqual(['app-data', 'app-data', 'exim4', 'libfoo1',
+                          'postfix'],
+                         self.names(u.dependencies(self.id('app'))))
+        self.assertEqual([], self.names(u.dependencies(self.id('app'),
+                                                       'recommends')))
+        self.assertEqual(['libfoo1'],
+                         self.names(u.reverse_dependencies(self.id('libc6'),
+                                                           'pre-depends')))
+        self.assertEqual(['libfoo1', 'libgcc1', 'postfix'],
+                         self.names(u.reverse_dependencies(self.id('libc6'))))
+        self.assertEqual(['app'],
+                         self.names(u.reverse_dependencies(self.id('exim4'))))
+        # Conflicting with what one provides does not count
+        self.assertEqual(['exim4'],
+                         self.names(u.dependencies(self.id('postfix'),
+                                                   'conflicts')))
+        self.assertEqual(['app'],
+                         self.names(u.dependencies(self.id('libc6'),
+                                                   'breaks')))
+
+    def test_closure(self):
+        u = self.universe
+        self.assertEqual(['libc6', 'libfoo1', 'libgcc1'],
+                         self.names(u.closure(self.id('libfoo1'))))
+        self.assertEqual(['libc6', 'libgcc1'],
+                         self.names(u.closure(self.id('libgcc1'))))
+        self.assertEqual(set(range(len(u))), u.closure(self.id('app')))
+        self.assertEqual(len(u), u.closure_size(self.id('app')))
+        self.assertEqual(['app-data', 'app-data', 'exim4'],
+                         self.names(u.closure(u.ids('app-data')
+                                              + u.ids('exim4'))))
+        self.assertEqual(['libc6', 'libfoo1'],
+                         self.names(u.closure(self.id('libfoo1'),
+                                              ['pre-depends'])))
+        self.assertEqual(['app', 'libc6', 'libfoo1', 'libgcc1', 'postfix'],
+                         self.names(u.reverse_closure(self.id('libgcc1'))))
+
+    def test_order(self):
+        u = self.universe
+        self.assertEqual([[u.ids('libc6')[0], u.ids('libgcc1')[0]]],
+                         u.cycles())
+        order = u.topological_order()
+        self.assertEqual(list(range(len(u))), sorted(order))
+        self.assertTrue(order is u.topological_order(depgraph.DEPENDS))
+        position = dict([(pkg, i) for i, pkg in enumerate(order)])
+        for pkg in range(len(u)):
+            for dependency in u.dependencies(pkg):
+                # Unless they are in a cycle
+                if pkg not in u.closure(dependency):
+                    self.assertTrue(position[dependency] < position[pkg])
+        self.assertEqual([], u.cycles(['pre-depends']))
+
+    def test_packages_file(self):
+        with open('test_Packages') as f:
+            u = depgraph.PackageUniverse(deb822.Packages.iter_paragraphs(f))
+        for pkg in range(len(u)):
+            reached = set([pkg])
+            todo = [pkg]
+            while todo:
+                current = todo.pop()
+                for kind in depgraph.DEPENDS:
+                    for dependency in u.dependencies(current, kind):
+                        if dependency not in reached:
+                            reached.add(dependency)
+                            todo.append(dependency)
+            self.assertEqual(reached, u.closure(pkg))
+            for dependency in u.dependencies(pkg):
+                self.assertTrue(pkg in u.reverse_dependencies(dependency))
+
+
+INSTALLABILITY = """\
+Package: ok
+Version: 1
+Depends: lib (>= 2)
+
+Package: lib
+Version: 2
+Depends: base
+
+Package: base
+Version: 1
+
+Package: too-new
+Version: 1
+Depends: lib (>= 3)
+
+Package: down-the-line
+Version: 1
+Depends: too-new | missing
+
+Package: clash
+Version: 1
+Depends: lib, other
+
+Package: other
+Version: 1
+Conflicts: base
+
+Package: either
+Version: 1
+Depends: mta, base
+
+Package: bad-mta
+Version: 1
+Provides: mta
+Breaks: base (<< 2)
+
+Package: good-mta
+Version: 1
+Provides: mta
+Conflicts: mta
+
+Package: versioned
+Version: 1
+Depends: mta (>= 1)
+
+Package: shim
+Version: 1
+Provides: mta (= 1.5)
+
+Package: old-shim
+Version: 1
+Provides: mta (= 0.5)
+
+Package: wants-old
+Version: 1
+Depends: mta (<< 1), base
+
+Package: old-lib
+Version: 1
+Depends: base (>= 1:0)
+
+Package: base
+Version: 1:1
+Conflicts: lib
+
+Package: two-bases
+Version: 1
+Depends: base (>= 1), old-lib
+
+Package: both-libs
+Version: 1
+Depends: lib, old-lib
+"""
+
+
+class TestInstallabilityChecker(unittest.TestCase):
+
+    def setUp(self):
+        self.universe = depgraph.PackageUniverse(
+            deb822.Packages.iter_paragraphs(INSTALLABILITY.splitlines()))
+        self.checker = depgraph.InstallabilityChecker(self.universe)
+
+    def id(self, name):
+        return self.universe.ids(name)[0]
+
+    def names(self, chain):
+        return [self.universe.names[pkg] for pkg in chain]
+
+    def test_installable(self):
+        for name in ('ok', 'lib', 'base', 'either', 'bad-mta', 'good-mta',
+                     'versioned', 'shim', 'two-bases'):
+            self.assertEqual((), self.checker.check(self.id(name)), name)
+            self.assertTrue(self.checker.installable(self.id(name)))
+
+    def test_missing(self):
+        reasons = self.checker.check(self.id('too-new'))
+        self.assertEqual(1, len(reasons))
+        self.assertEqual('missing', reasons[0].kind)
+        self.assertEqual(['too-new'], self.names(reasons[0].chain))
+        self.assertEqual(deb822.PkgRelation.parse_compact('lib (>= 3)')[0],
+                         reasons[0].relation)
+        self.assertEqual(None, reasons[0].other)
+        reason, = self.checker.check(self.id('down-the-line'))
+        self.assertEqual(['down-the-line', 'too-new'], self.names(reason.chain))
+        self.assertEqual('down-the-line (= 1) -> too-new (= 1): '
+                         'nothing satisfies lib (>= 3)',
+                         self.checker.describe(reason))
+
+    def test_conflict(self):
+        reasons = self.checker.check(self.id('clash'))
+        self.assertTrue(reasons)
+        for reason in reasons:
+            self.assertEqual('conflict', reason.kind)
+            self.assertEqual('clash', self.names(reason.chain)[0])
+            self.assertEqual('clash', self.names(reason.other)[0])
+            self.assertEqual(set(['other', 'base']),
+                             set([self.universe.names[reason.chain[-1]],
+                                  self.universe.names[reason.other[-1]]]))
+        self.assertTrue(' conflicts with ' in
+                        self.checker.describe(reasons[0]))
+
+    def test_versioned_provides(self):
+        # Only old-shim provides mta (<< 1), and nothing else does
+        self.assertTrue(self.checker.installable(self.id('wants-old')))
+        universe = depgraph.PackageUniverse(
+            deb822.Packages.iter_paragraphs(
+                INSTALLABILITY.replace('mta (= 0.5)', 'mta').splitlines()))
+        checker = depgraph.InstallabilityChecker(universe)
+        reason, = checker.check(universe.ids('wants-old')[0])
+        self.assertEqual('missing', reason.kind)
+
+    def test_versions(self):
+        # old-lib needs base 1:1 (not 1), which conflicts with lib
+        self.assertEqual((), self.checker.check(self.id('old-lib')))
+        reasons = self.checker.check(self.id('both-libs'))
+        self.assertTrue(reasons)
+        for reason in reasons:
+            self.assertEqual('conflict', reason.kind)
+        self.assertTrue(self.checker._compare('1:0', '2') > 0)
+        self.assertEqual(None, self.checker._compare('1:0', ':'))
+
+    def test_shared_failures(self):
+        universe = depgraph.PackageUniverse(deb822.Packages.iter_paragraphs(
+            (INSTALLABILITY + '\nPackage: needs-clash\nVersion: 1\n'
+             'Depends: clash | too-new\n').splitlines()))
+        self.universe = universe
+        checker = depgraph.InstallabilityChecker(universe)
+        first = checker.check(universe.ids('clash')[0])
+        reasons = checker.check(universe.ids('needs-clash')[0])
+        self.assertTrue(reasons)
+        self.assertEqual(['needs-clash'] + self.names(first[0].chain),
+                         self.names(reasons[0].chain))
+        self.assertEqual(['needs-clash'] + self.names(first[0].other),
+                         self.names(reasons[0].other))
+
+    def test_backjumping(self):
+        # 2 ** 30 ways of picking the alternatives before the last one,
+        # none of which matters
+        paragraphs = ['Package: top\nVersion: 1\nDepends: %s, c | d' %
+                      ', '.join(['a%d | b%d' % (i, i) for i in range(30)])]
+        for i in range(30):
+            paragraphs.append('Package: a%d\nVersion: 1' % i)
+            paragraphs.append('Package: b%d\nVersion: 1' % i)
+        for name in ('c', 'd'):
+            paragraphs.append('Package: %s\nVersion: 1\nDepends: e' % name)
+        paragraphs.append('Package: e\nVersion: 1\nConflicts: top')
+        universe = depgraph.PackageUniverse(deb822.Packages.iter_paragraphs(
+            '\n\n'.join(paragraphs).splitlines()))
+        self.universe = universe
+        checker = depgraph.InstallabilityChecker(universe)
+        reasons = checker.check(universe.ids('top')[0])
+        self.assertEqual([['top', 'c', 'e'], ['top', 'd', 'e']],
+                         sorted([self.names(reason.chain)
+                                 for reason in reasons]))
+        for reason in reasons:
+            self.assertEqual('conflict', reason.kind)
+            self.assertEqual(['top'], self.names(reason.other))
+
+    def test_check_all(self):
+        broken = self.checker.check_all()
+        self.assertEqual(['both-libs', 'clash', 'down-the-line', 'too-new'],
+                         sorted(self.names(broken)))
+        checker = depgraph.InstallabilityChecker(self.universe)
+        self.assertEqual(sorted(broken),
+                         sorted(checker.check_all(workers=2)))
+        self.assertEqual({}, self.checker.check_all([self.id('ok')]))
+        self.assertEqual([self.id('too-new')],
+                         list(self.checker.check_all([self.id('ok'),
+                                                      self.id('too-new')])))
+
+    def test_packages_file(self):
+        with open('test_Packages') as f:
+            universe = depgraph.PackageUniverse(
+                deb822.Packages.iter_paragraphs(f))
+        checker = depgraph.InstallabilityChecker(universe)
+        broken = checker.check_all()
+        self.assertEqual(sorted(broken), sorted(
+            depgraph.InstallabilityChecker(universe).check_all(workers=2)))
+        for pkg, reasons in broken.items():
+            for reason in reasons:
+                self.assertEqual(pkg, reason.chain[0])
+                checker.describe(reason)
+
+
+if __name__ == '__main__':
+    unittest.main()